@@ -0,0 +1,150 @@
+import logging
+import multiprocessing
+import threading
+import time
+
+import metrics
+from protocol import BUSY_CONNECTIONS, BUSY_RATE, BUSY_SESSIONS, RECV_CHUNK, Busy
+
+# Controle de admissão no accept (server.py --max-conexoes, --max-sessoes,
+# --limite-ip). Cada conexão aceita é checada antes de virar uma Connection:
+# - acima do limite de conexões abertas ou de sessões em andamento, ou
+# - acima da taxa de conexões novas do IP (token bucket por IP),
+# o cliente recebe OP_BUSY com o motivo e o socket é fechado na hora, sem
+# thread e sem passar pelo lobby. Quem já foi admitido nunca
+# é recusado: jogadores em sessão e quem volta ao lobby depois de uma rodada
+# continuam pareando, então as partidas em andamento têm prioridade sobre os
+# logins novos durante uma sobrecarga.
+# Com --workers (shared=True) os contadores de conexões e sessões ficam em
+# memória compartilhada, criada antes do fork: os limites valem para o servidor
+# todo, contando quem espera no lobby do broker (cluster.py), que a conexão
+# entregada por um worker conta no broker e vice-versa. A taxa por IP continua
+# por processo.
+
+PRUNE_INTERVAL = 1.0 # Segundos entre limpezas dos buckets de IPs que pararam de conectar
+
+
+_CONNECTIONS = 0
+_SESSIONS = 1
+
+
+class Admission:
+    def __init__(self, max_connections=0, max_sessions=0, ip_rate=0.0, ip_burst=1, shared=False):
+        self.max_connections = max_connections # 0 = sem limite
+        self.max_sessions = max_sessions
+        self.ip_rate = ip_rate # Conexões novas por segundo por IP (0 = sem limite)
+        self.ip_burst = max(1, ip_burst)
+        if shared:
+            self._counts = multiprocessing.RawArray('q', 2)
+            self._counts_lock = multiprocessing.Lock()
+        else:
+            self._counts = [0, 0]
+            self._counts_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._buckets = {} # ip -> [fichas, instante da última recarga]
+        self._pruned_at = time.monotonic()
+
+    @property
+    def connections(self):
+        return self._counts[_CONNECTIONS]
+
+    @property
+    def sessions(self):
+        return self._counts[_SESSIONS]
+
+    def _add(self, index, amount):
+        with self._counts_lock:
+            self._counts[index] += amount
+
+    def connection_opened(self):
+        self._add(_CONNECTIONS, 1)
+
+    def connection_closed(self):
+        self._add(_CONNECTIONS, -1)
+
+    def session_started(self):
+        self._add(_SESSIONS, 1)
+
+    def session_ended(self):
+        self._add(_SESSIONS, -1)
+
+    # Motivo da recusa (BUSY_*) de uma conexão nova de `ip`, ou 0 se ela entra
+    def check(self, ip):
+        if self.max_connections and self.connections >= self.max_connections:
+            return BUSY_CONNECTIONS
+        if self.max_sessions and self.sessions >= self.max_sessions:
+            return BUSY_SESSIONS
+        if self.ip_rate and not self._take_token(ip):
+            return BUSY_RATE
+        return 0
+
+    # Token bucket do IP: recarrega ip_rate fichas por segundo, até ip_burst
+    def _take_token(self, ip):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._pruned_at >= PRUNE_INTERVAL:
+                self._prune(now)
+            bucket = self._buckets.get(ip)
+            if bucket is None:
+                self._buckets[ip] = [self.ip_burst - 1, now]
+                return True
+            tokens = min(self.ip_burst, bucket[0] + (now - bucket[1]) * self.ip_rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                return False
+            bucket[0] = tokens - 1
+            return True
+
+    # Um bucket que já teria recarregado por completo equivale a um IP novo
+    def _prune(self, now):
+        full = self.ip_burst / self.ip_rate
+        self._buckets = {ip: bucket for ip, bucket in self._buckets.items() if now - bucket[1] < full}
+        self._pruned_at = now
+
+
+control = None # Admission do processo (None = sem controle de admissão)
+
+def configure(max_connections=0, max_sessions=0, ip_rate=0.0, ip_burst=1, shared=False):
+    global control
+    control = Admission(max_connections, max_sessions, ip_rate, ip_burst, shared)
+    return control
+
+def connection_opened():
+    if control is not None:
+        control.connection_opened()
+
+def connection_closed():
+    if control is not None:
+        control.connection_closed()
+
+def session_started():
+    if control is not None:
+        control.session_started()
+
+def session_ended():
+    if control is not None:
+        control.session_ended()
+
+# Motivo da recusa de uma conexão nova de `addr` (0 = admitida)
+def check(addr):
+    if control is None:
+        return 0
+    return control.check(addr[0] if isinstance(addr, tuple) else addr)
+
+def rejected(addr, reason):
+    metrics.CONNECTIONS_REJECTED.inc()
+    logging.debug("Conexão de %s recusada (motivo %s): servidor ocupado.", addr, reason)
+
+# Responde OP_BUSY sem bloquear e fecha o socket recém-aceito. O que o cliente
+# já mandou (OP_HELLO) é descartado antes: fechar com dados não lidos manda RST,
+# que pode chegar antes do OP_BUSY.
+def reject(sock, addr, reason):
+    rejected(addr, reason)
+    try:
+        sock.setblocking(False)
+        sock.send(Busy(reason).encode())
+        sock.recv(RECV_CHUNK)
+    except OSError:
+        pass
+    sock.close()
@@ -0,0 +1,91 @@
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from leaderboard import SCHEMA, UPSERT, Leaderboard
+
+# Compara gravar o placar direto na thread de jogo (uma transação por rodada)
+# com o Leaderboard de escrita em lote, com T threads registrando rodadas de P
+# jogadores o mais rápido possível durante D segundos.
+#
+#   python3 -m benchmarks.leaderboard --threads 32 --jogadores 10000 --duracao 5
+#
+# Mede rodadas/s e a latência de cada registro (o que a thread de jogo espera)
+# e confere que os totais gravados batem com as rodadas registradas.
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+# Gravação síncrona: cada rodada abre e confirma a própria transação
+class WriteThrough:
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def record(self, name, points, rounds=1):
+        with self._lock, self._db:
+            self._db.execute(UPSERT, (name, points, rounds, time.time()))
+
+    def close(self):
+        self._db.close()
+
+def bench(name, store, path, threads, players, duration):
+    latencies = [[] for _ in range(threads)]
+    counts = [0] * threads
+    deadline = time.perf_counter() + duration
+
+    def worker(i):
+        rng = random.Random(i)
+        own = latencies[i]
+        while time.perf_counter() < deadline:
+            player = f'p{rng.randrange(players)}'
+            start = time.perf_counter()
+            store.record(player, int(rng.random() < 0.5))
+            own.append(time.perf_counter() - start)
+            counts[i] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    store.close() # O Leaderboard grava o que ainda estiver na fila
+    drained = time.perf_counter() - start - elapsed
+
+    total = sum(counts)
+    with sqlite3.connect(path) as db:
+        stored = db.execute("SELECT COALESCE(SUM(rounds), 0) FROM players").fetchone()[0]
+    all_latencies = [x for own in latencies for x in own]
+    print(f"{name:9} rodadas/s={total / elapsed:10.0f}  registro p50={percentile(all_latencies, 0.50) * 1e6:8.1f} µs  "
+          f"p99={percentile(all_latencies, 0.99) * 1e6:8.1f} µs  máx={max(all_latencies) * 1e3:7.2f} ms  "
+          f"gravadas={stored}/{total}  fila final={drained * 1000:.0f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do placar: gravação direta x escrita em lote")
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--jogadores', type=int, default=10000)
+    parser.add_argument('--duracao', type=float, default=5.0)
+    parser.add_argument('--apenas', choices=['direto', 'lote'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.apenas != 'lote':
+            path = os.path.join(tmp, 'direto.db')
+            bench("direto", WriteThrough(path), path, args.threads, args.jogadores, args.duracao)
+        if args.apenas != 'direto':
+            path = os.path.join(tmp, 'lote.db')
+            bench("lote", Leaderboard(path), path, args.threads, args.jogadores, args.duracao)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+
+from bot_client import WORDS, BotClient, BotStats
+from protocol import RECV_CHUNK, FrameParser, GameState, OpponentLost, OpponentWon, Watch
+from solver import Solver
+from wordlist import WordList
+
+# Gerador de carga: abre milhares de bots (bot_client.BotClient) contra um
+# servidor local em um único processo e mede
+#   - latência de pareamento (lobby -> OP_PLAYER_ROLE), p50/p99, incluindo quem
+#     volta ao lobby depois de uma sessão (--prob-sair)
+#   - ida e volta de cada palpite (OP_GUESS -> resposta), p50/p99
+#   - rodadas por segundo
+#   - RSS e CPU do processo do servidor (lidos de /proc, apenas Linux)
+#   - com --espectadores, frames entregues aos espectadores da partida mais
+#     assistida; --espectadores-lentos param de ler e não devem mexer no p99
+#     dos palpites
+#   - segmentos TCP por rodada (todo o sistema, /proc/net/snmp) e, com
+#     --metrics-port, frames por escrita e escritas por rodada do servidor; rode
+#     com --server-args=--envio-imediato para comparar com uma escrita por frame
+#
+#   python3 -m benchmarks.loadgen --spawn --bots 2000 --duracao 30
+#   python3 -m benchmarks.loadgen --pid 1234 --bots 500
+#
+# Os limites --max-palpite-p99-ms / --max-pareamento-p99-ms / --min-rodadas-s
+# fazem o processo sair com código 1 quando violados, para travar mudanças nos
+# caminhos quentes do server.py.
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+# CPU (segundos de usuário + sistema) e RSS atual/pico do processo, via /proc
+def proc_sample(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        rss = hwm = 0
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    hwm = int(line.split()[1]) * 1024
+        return cpu, rss, hwm
+    except (OSError, IndexError, ValueError):
+        return None
+
+# Segmentos TCP enviados por todo o sistema (servidor e bots, no loopback)
+def tcp_out_segments():
+    try:
+        with open('/proc/net/snmp') as f:
+            header, values = [line.split() for line in f if line.startswith('Tcp:')]
+        return int(values[header.index('OutSegs')])
+    except (OSError, ValueError):
+        return None
+
+# Contadores do servidor lidos do endpoint /metrics
+def scrape(port, names):
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=2) as resp:
+            text = resp.read().decode()
+    except OSError:
+        return {}
+    values = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(' ')
+        if name in names:
+            values[name] = float(value)
+    return values
+
+SERVER_COUNTERS = ('hagsman_frames_out_total', 'hagsman_socket_writes_total')
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def spawn_server(port, extra_args):
+    cmd = [sys.executable, 'server.py', '--port', str(port)] + extra_args
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            preexec_fn=raise_fd_limit)
+    time.sleep(0.5) # Tempo para o bind
+    if proc.poll() is not None:
+        raise SystemExit(f"Servidor terminou ao iniciar: {' '.join(cmd)}")
+    return proc
+
+# Espectador (OP_WATCH) da partida mais assistida; quem fica sem partida (ainda
+# nenhuma, ou a dela terminou) pede de novo. O lento para de ler depois da
+# resposta e deixa o buffer do socket encher.
+async def spectate(host, port, stats, slow, deadline):
+    while time.perf_counter() < deadline:
+        reader, writer = await asyncio.open_connection(host, port)
+        parser = FrameParser()
+        watching = None
+        try:
+            writer.write(Watch('').encode())
+            while watching is not False:
+                data = await reader.read(RECV_CHUNK)
+                if not data:
+                    break
+                parser.feed(data)
+                msg = parser.next_message()
+                while msg is not None:
+                    if isinstance(msg, Watch):
+                        watching = bool(msg.game)
+                    elif isinstance(msg, (GameState, OpponentWon, OpponentLost)):
+                        stats.spectator_frames += 1
+                    msg = parser.next_message()
+                if watching and slow:
+                    await asyncio.sleep(deadline - time.perf_counter())
+                    break
+        finally:
+            writer.close()
+        if not watching:
+            await asyncio.sleep(0.1)
+
+# Mantém `bots` bots conectados durante `duration` segundos; quem sai é substituído
+async def drive(host, port, bots, duration, ramp, delta, stats, quit_prob=0.0, words=WORDS, solver=None,
+                names=0, spectators=0, slow_spectators=0.0):
+    deadline = time.perf_counter() + duration
+
+    async def bot_loop(i):
+        while time.perf_counter() < deadline:
+            try:
+                restart = random.random() >= quit_prob
+                pick_letter = solver.guesser().pick_letter if solver else None
+                name = f'bot{i % names}' if names else None
+                bot = BotClient(host, port, stats, delta=delta, restart=restart, words=words,
+                                pick_letter=pick_letter, name=name)
+                await bot.run()
+                if bot.busy:
+                    await asyncio.sleep(0.1) # Recusado pelo servidor: espera antes de tentar de novo
+            except OSError:
+                stats.errors += 1
+                await asyncio.sleep(0.1)
+
+    tasks = []
+    for i in range(bots):
+        tasks.append(asyncio.create_task(bot_loop(i)))
+        if ramp and i % 100 == 99:
+            await asyncio.sleep(ramp)
+    for i in range(spectators):
+        slow = i < spectators * slow_spectators
+        tasks.append(asyncio.create_task(spectate(host, port, stats, slow, deadline)))
+        if ramp and i % 100 == 99:
+            await asyncio.sleep(ramp)
+    remaining = deadline - time.perf_counter()
+    if remaining > 0:
+        await asyncio.sleep(remaining)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def run(host, port, bots, duration, ramp=0.01, delta=True, pid=None, quit_prob=0.0, words_path=None, names=0,
+        spectators=0, slow_spectators=0.0, metrics_port=None):
+    stats = BotStats()
+    before = proc_sample(pid) if pid else None
+    segments_before = tcp_out_segments()
+    counters_before = scrape(metrics_port, SERVER_COUNTERS) if metrics_port else {}
+    start = time.perf_counter()
+    words, solver = WORDS, None
+    if words_path:
+        # Bots escolhem palavras da lista e chutam com o solver sobre a mesma lista
+        word_list = WordList.open(words_path)
+        words = [word_list.sample() for _ in range(10000)]
+        solver = Solver(word_list).warm()
+    asyncio.run(drive(host, port, bots, duration, ramp, delta, stats, quit_prob, words, solver, names,
+                      spectators, slow_spectators))
+    elapsed = time.perf_counter() - start
+    after = proc_sample(pid) if pid else None
+    segments_after = tcp_out_segments()
+    counters_after = scrape(metrics_port, SERVER_COUNTERS) if metrics_port else {}
+
+    result = {
+        'bots': bots,
+        'duracao_s': round(elapsed, 2),
+        'conexoes': stats.connections,
+        'recusadas': stats.rejected,
+        'erros': stats.errors,
+        'rodadas': stats.rounds,
+        'rodadas_por_s': round(stats.rounds / elapsed, 1),
+        'pareamento_p50_ms': round(percentile(stats.pairing, 0.50) * 1000, 3),
+        'pareamento_p99_ms': round(percentile(stats.pairing, 0.99) * 1000, 3),
+        'palpite_p50_ms': round(percentile(stats.guess_rtt, 0.50) * 1000, 3),
+        'palpite_p99_ms': round(percentile(stats.guess_rtt, 0.99) * 1000, 3),
+        'palpites': len(stats.guess_rtt),
+    }
+    if spectators:
+        result['espectadores'] = spectators
+        result['espectador_frames_por_s'] = round(stats.spectator_frames / elapsed, 1)
+    if before and after:
+        result['servidor_cpu_pct'] = round((after[0] - before[0]) / elapsed * 100, 1)
+        result['servidor_rss_mb'] = round(after[1] / 2**20, 1)
+        result['servidor_rss_pico_mb'] = round(after[2] / 2**20, 1)
+    if stats.rounds and segments_before is not None and segments_after is not None:
+        result['segmentos_tcp_por_rodada'] = round((segments_after - segments_before) / stats.rounds, 1)
+    if stats.rounds and len(counters_before) == len(counters_after) == len(SERVER_COUNTERS):
+        frames, writes = (counters_after[name] - counters_before[name] for name in SERVER_COUNTERS)
+        result['servidor_escritas_por_rodada'] = round(writes / stats.rounds, 1)
+        result['servidor_frames_por_escrita'] = round(frames / writes, 2) if writes else 0.0
+    if stats.rounds:
+        result['vitorias_pct'] = round(stats.wins / stats.rounds * 100, 1)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga e benchmark de latência do servidor")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--bots', type=int, default=1000)
+    parser.add_argument('--duracao', type=float, default=20.0, help="segundos de medição")
+    parser.add_argument('--rampa', type=float, default=0.01, help="pausa a cada 100 conexões abertas")
+    parser.add_argument('--sem-delta', action='store_true', help="bots não negociam OP_UPDATE")
+    parser.add_argument('--palavras', metavar='ARQUIVO',
+                        help="lista binária (wordlist.py build): palavras dos bots e solver.py para os palpites")
+    parser.add_argument('--prob-sair', type=float, default=0.0,
+                        help="fração dos bots que recusa o OP_RESTART (o parceiro volta ao lobby)")
+    parser.add_argument('--nomes', type=int, default=0,
+                        help="bots mandam OP_LOGIN com um de N nomes (exercita o placar, server.py --placar)")
+    parser.add_argument('--espectadores', type=int, default=0,
+                        help="conexões assistindo a partida mais assistida (OP_WATCH)")
+    parser.add_argument('--espectadores-lentos', type=float, default=0.0,
+                        help="fração dos espectadores que para de ler o socket")
+    parser.add_argument('--metrics-port', type=int,
+                        help="porta de métricas do servidor, para contar escritas (com --spawn, repassada a ele)")
+    parser.add_argument('--pid', type=int, help="PID do servidor já em execução (para RSS/CPU)")
+    parser.add_argument('--spawn', action='store_true', help="inicia o servidor (server.py) nesta porta")
+    parser.add_argument('--server-args', default='', help="argumentos extras para o servidor iniciado com --spawn")
+    parser.add_argument('--json', action='store_true')
+    parser.add_argument('--max-palpite-p99-ms', type=float)
+    parser.add_argument('--max-pareamento-p99-ms', type=float)
+    parser.add_argument('--min-rodadas-s', type=float)
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    server_args = args.server_args.split()
+    if args.spawn and args.metrics_port:
+        server_args += ['--metrics-port', str(args.metrics_port)]
+    proc = spawn_server(args.port, server_args) if args.spawn else None
+    pid = proc.pid if proc else args.pid
+    try:
+        result = run(args.host, args.port, args.bots, args.duracao, args.rampa, not args.sem_delta, pid,
+                     args.prob_sair, args.palavras, args.nomes, args.espectadores, args.espectadores_lentos,
+                     args.metrics_port)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for key, value in result.items():
+            print(f"{key:24} {value}")
+
+    failures = []
+    if args.max_palpite_p99_ms is not None and not result['palpite_p99_ms'] <= args.max_palpite_p99_ms:
+        failures.append(f"palpite p99 {result['palpite_p99_ms']} ms > {args.max_palpite_p99_ms} ms")
+    if args.max_pareamento_p99_ms is not None and not result['pareamento_p99_ms'] <= args.max_pareamento_p99_ms:
+        failures.append(f"pareamento p99 {result['pareamento_p99_ms']} ms > {args.max_pareamento_p99_ms} ms")
+    if args.min_rodadas_s is not None and not result['rodadas_por_s'] >= args.min_rodadas_s:
+        failures.append(f"{result['rodadas_por_s']} rodadas/s < {args.min_rodadas_s}")
+    for failure in failures:
+        print(f"FALHOU: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import resource
+import socket
+import statistics
+import threading
+import time
+
+from connection import Connection
+from matchmaking import Lobby
+
+# Compara o lobby antigo (uma thread por cliente fazendo polling de 1 s na lista
+# global) com o Lobby orientado a eventos, com N clientes chegando de uma vez.
+#
+#   python3 -m benchmarks.lobby --clientes 10000
+#
+# Para cada implementação mede o tempo até formar o par (p50/p99/máx), o tempo
+# total para parear todo mundo e a CPU gasta pelo lobby com as sessões em
+# andamento (sem nenhuma chegada nova), além do número de threads vivas.
+
+
+# Cópia do laço de handle_client_thread antes do Lobby; a sessão de jogo é
+# substituída por uma espera, como se a partida estivesse em andamento.
+def legacy_client_thread(client_sock, waiting_clients, waiting_clients_lock, on_pair, stop):
+    with waiting_clients_lock:
+        waiting_clients.append(client_sock)
+
+    while not stop.is_set():
+        paired_clients = []
+        with waiting_clients_lock:
+            if client_sock in waiting_clients and len(waiting_clients) >= 2:
+                temp_waiting_clients = [s for s in waiting_clients if s != client_sock]
+                if temp_waiting_clients:
+                    paired_clients = [client_sock, temp_waiting_clients[0]]
+                    waiting_clients.remove(client_sock)
+                    waiting_clients.remove(temp_waiting_clients[0])
+            elif client_sock.fileno() == -1:
+                break
+
+        if len(paired_clients) == 2:
+            on_pair(paired_clients)
+            stop.wait()
+            break
+        else:
+            time.sleep(1)
+
+
+def make_clients(n):
+    pairs = [socket.socketpair() for _ in range(n)]
+    return [a for a, _ in pairs], [b for _, b in pairs]
+
+def close_all(*groups):
+    for group in groups:
+        for s in group:
+            s.close()
+
+# Mede a CPU do processo em uma janela sem chegadas (só o custo de manter o lobby)
+def idle_cpu(window):
+    start = time.process_time()
+    time.sleep(window)
+    return time.process_time() - start
+
+def report(name, arrivals, paired_at, elapsed, cpu, window):
+    waits = sorted(paired_at[s] - arrivals[s] for s in paired_at)
+    p99 = waits[min(len(waits) - 1, int(len(waits) * 0.99))]
+    print(f"{name:8} pareados={len(waits):6d}  p50={statistics.median(waits) * 1000:9.2f} ms  "
+          f"p99={p99 * 1000:9.2f} ms  máx={waits[-1] * 1000:9.2f} ms  total={elapsed:7.2f} s  "
+          f"cpu ociosa={cpu / window * 100:6.1f}%  threads={threading.active_count()}")
+
+def bench_legacy(n, window):
+    server_side, client_side = make_clients(n)
+    waiting_clients, waiting_clients_lock = [], threading.Lock()
+    stop = threading.Event()
+    arrivals, paired_at = {}, {}
+    done = threading.Event()
+
+    def on_pair(pair):
+        now = time.perf_counter()
+        for s in pair:
+            paired_at[s] = now
+        if len(paired_at) >= n - n % 2:
+            done.set()
+
+    start = time.perf_counter()
+    threads = []
+    for s in server_side:
+        arrivals[s] = time.perf_counter()
+        t = threading.Thread(target=legacy_client_thread, args=(s, waiting_clients, waiting_clients_lock, on_pair, stop), daemon=True)
+        t.start()
+        threads.append(t)
+    done.wait()
+    elapsed = time.perf_counter() - start
+
+    cpu = idle_cpu(window)
+    report("antigo", arrivals, paired_at, elapsed, cpu, window)
+    stop.set()
+    for t in threads:
+        t.join()
+    close_all(server_side, client_side)
+
+def bench_lobby(n, window):
+    server_side, client_side = make_clients(n)
+    arrivals, paired_at = {}, {}
+    done = threading.Event()
+
+    def on_pair(pair):
+        now = time.perf_counter()
+        for s in pair:
+            paired_at[s] = now
+        if len(paired_at) >= n - n % 2:
+            done.set()
+
+    lobby = Lobby(on_pair=on_pair)
+    start = time.perf_counter()
+    for s in server_side:
+        conn = Connection(s, None)
+        arrivals[conn] = time.perf_counter()
+        lobby.join(conn)
+    done.wait()
+    elapsed = time.perf_counter() - start
+
+    cpu = idle_cpu(window)
+    report("lobby", arrivals, paired_at, elapsed, cpu, window)
+    lobby.close()
+    close_all(server_side, client_side)
+
+# Cada cliente usa um socketpair (2 descritores); ajusta N ao limite do processo
+def fit_fd_limit(n):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        soft = hard
+    max_clients = (soft - 64) // 2
+    if n > max_clients:
+        print(f"Limite de descritores ({soft}) só permite {max_clients} clientes; usando esse valor.")
+        n = max_clients
+    return n
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do lobby: polling antigo x Lobby orientado a eventos")
+    parser.add_argument('--clientes', type=int, default=10000)
+    parser.add_argument('--janela', type=float, default=3.0, help="segundos de medição de CPU ociosa")
+    parser.add_argument('--apenas', choices=['antigo', 'lobby'])
+    args = parser.parse_args()
+
+    n = fit_fd_limit(args.clientes)
+    threading.stack_size(256 * 1024) # 10k threads do modo antigo precisam de pilha menor
+    if args.apenas != 'lobby':
+        bench_legacy(n, args.janela)
+    if args.apenas != 'antigo':
+        bench_lobby(n, args.janela)
+
+if __name__ == '__main__':
+    main()
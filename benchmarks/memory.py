@@ -0,0 +1,141 @@
+import argparse
+import json
+import socket
+import time
+
+from benchmarks import loadgen
+from benchmarks.loadgen import proc_sample, raise_fd_limit, spawn_server
+
+# Memória do servidor por conexão parada e por partida em andamento:
+#   - abre N conexões TCP que só ficam abertas (sem OP_HELLO, sem jogar) e mede
+#     o RSS do servidor antes e depois. O lobby pareia as conexões na chegada,
+#     então cada par vira uma sessão esperando o OP_SETWORD (uma thread por par
+#     no modo threads); o valor por conexão já inclui essa metade da sessão.
+#   - em um servidor novo, roda M partidas de bots (bot_client.BotClient) e mede
+#     o RSS com todas em andamento.
+# Também mostra a memória de sockets TCP do kernel (/proc/net/sockstat), que
+# não entra no RSS. Apenas Linux.
+#
+#   python3 -m benchmarks.memory --conexoes 10000 --partidas 500
+#   python3 -m benchmarks.memory --conexoes 100000 --origens 4 --server-args=--modo=asyncio
+#
+# Com mais de ~28 mil conexões faltam portas locais para um único IP de origem:
+# --origens K distribui as conexões entre 127.0.0.1 .. 127.0.0.K. O limite de
+# descritores (ulimit -n) vale para este processo e para o servidor.
+
+SETTLE_SECONDS = 1.0 # Espera depois da última conexão para o servidor terminar de aceitar
+
+
+def sample(pid):
+    cpu, rss, _hwm = proc_sample(pid)
+    threads = 0
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('Threads:'):
+                threads = int(line.split()[1])
+    return rss, threads
+
+# Páginas de memória dos buffers TCP de todo o sistema, em bytes
+def tcp_kernel_bytes():
+    try:
+        with open('/proc/net/sockstat') as f:
+            for line in f:
+                if line.startswith('TCP:'):
+                    fields = line.split()
+                    return int(fields[fields.index('mem') + 1]) * 4096
+    except (OSError, ValueError):
+        pass
+    return None
+
+def open_idle(host, port, count, sources):
+    socks = []
+    for i in range(count):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if sources > 1:
+            s.bind((f'127.0.0.{1 + i % sources}', 0))
+        s.connect((host, port))
+        socks.append(s)
+    time.sleep(SETTLE_SECONDS)
+    return socks
+
+def measure_idle(port, count, sources, server_args):
+    proc = spawn_server(port, server_args)
+    try:
+        base_rss, base_threads = sample(proc.pid)
+        base_kernel = tcp_kernel_bytes()
+        start = time.perf_counter()
+        socks = open_idle('127.0.0.1', port, count, sources)
+        elapsed = time.perf_counter() - start
+        rss, threads = sample(proc.pid)
+        kernel = tcp_kernel_bytes()
+        for s in socks:
+            s.close()
+    finally:
+        proc.terminate()
+        proc.wait()
+    result = {
+        'conexoes': count,
+        'conexoes_por_s': round(count / elapsed),
+        'servidor_rss_base_mb': round(base_rss / 2**20, 1),
+        'servidor_rss_mb': round(rss / 2**20, 1),
+        'bytes_por_conexao': round((rss - base_rss) / count),
+        'threads': threads - base_threads,
+    }
+    if kernel is not None and base_kernel is not None:
+        result['kernel_tcp_bytes_por_conexao'] = round((kernel - base_kernel) / count)
+    return result
+
+def measure_games(port, games, duration, server_args):
+    proc = spawn_server(port, server_args)
+    try:
+        base_rss, _threads = sample(proc.pid)
+        result = loadgen.run('127.0.0.1', port, games * 2, duration, pid=proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+    rss = result['servidor_rss_mb'] * 2**20
+    return {
+        'partidas': games,
+        'rodadas_por_s': result['rodadas_por_s'],
+        'servidor_rss_mb': result['servidor_rss_mb'],
+        'bytes_por_partida': round((rss - base_rss) / games),
+        'erros': result['erros'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória do servidor por conexão parada e por partida")
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--conexoes', type=int, default=10000)
+    parser.add_argument('--origens', type=int, default=1,
+                        help="IPs de origem (127.0.0.1 .. 127.0.0.K) para passar do limite de portas locais")
+    parser.add_argument('--partidas', type=int, default=500)
+    parser.add_argument('--duracao', type=float, default=5.0)
+    parser.add_argument('--server-args', default='',
+                        help="argumentos extras para o servidor (ex.: --server-args=--modo=asyncio)")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    # Prazo longo para a palavra: as sessões das conexões paradas não expiram
+    # durante a medição; com a fila do listen padrão as conexões abertas em
+    # sequência transbordam o accept e esperam a retransmissão do SYN
+    server_args = ['--prazo-palavra', '3600', '--backlog', '4096', '--log-level', 'WARNING'] + args.server_args.split()
+    idle = measure_idle(args.port, args.conexoes, args.origens, server_args) if args.conexoes else None
+    # Outra porta: as conexões do primeiro servidor ainda estão em TIME_WAIT
+    games = measure_games(args.port + 1, args.partidas, args.duracao, server_args) if args.partidas else None
+
+    if args.json:
+        print(json.dumps({'paradas': idle, 'partidas': games}))
+        return
+    if idle:
+        print(f"{idle['conexoes']} conexões paradas: {idle['bytes_por_conexao']} bytes/conexão "
+              f"(RSS {idle['servidor_rss_base_mb']} -> {idle['servidor_rss_mb']} MB, "
+              f"+{idle['threads']} threads, {idle['conexoes_por_s']} conexões/s)")
+        if 'kernel_tcp_bytes_por_conexao' in idle:
+            print(f"  buffers TCP do kernel: {idle['kernel_tcp_bytes_por_conexao']} bytes/conexão (fora do RSS)")
+    if games:
+        print(f"{games['partidas']} partidas em andamento: {games['bytes_por_partida']} bytes/partida "
+              f"(RSS {games['servidor_rss_mb']} MB, {games['rodadas_por_s']} rodadas/s, {games['erros']} erros)")
+
+if __name__ == '__main__':
+    main()
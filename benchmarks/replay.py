@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import heapq
+import json
+import mmap
+import sys
+import time
+from collections import Counter
+
+import journal
+from bot_client import BotClient, BotStats
+from benchmarks.loadgen import percentile, proc_sample, raise_fd_limit, spawn_server
+from protocol import (
+    FEATURE_DELTA, ROLE_GUESSER, ROLE_SETTER, FrameParser, GameOverLose, GameOverWin, Guess, Hello,
+    PlayerRole, ProtocolError, Restart, Resume, SetWord,
+)
+
+# Lê diários gravados com server.py --diario (journal.py) por mmap, sem passar
+# pelos logs de debug:
+#
+#   python3 -m benchmarks.replay stats diario.bin
+#   python3 -m benchmarks.replay run diario.bin --spawn --port 12399
+#
+# `stats` mostra tamanhos das palavras, palpites por rodada e vitórias.
+# `run` joga de novo, o mais rápido possível, as sessões gravadas contra um
+# servidor local: cada sessão vira um par de clientes (bot_client.BotClient)
+# que repetem as palavras e os palpites de cada rodada. O servidor sorteia os
+# papéis, então o roteiro é da sessão e cada cliente segue a parte do papel que
+# recebeu. As sessões começam na ordem gravada e preservam o entrelaçamento:
+# cada uma só começa depois que terminarem as que, na gravação, já tinham
+# terminado quando ela começou. Com --workers, passe os arquivos de todos os
+# workers (diario.bin.*).
+# Sessões com um bot do servidor e salas de vários guessers (server.py --sala)
+# ficam de fora.
+
+
+class Round:
+    __slots__ = ('word', 'guesses', 'won')
+
+    def __init__(self):
+        self.word = None # Primeira palavra válida do SETTER (None = rodada sem palavra)
+        self.guesses = []
+        self.won = None  # None = rodada interrompida
+
+
+class Session:
+    __slots__ = ('start', 'end', 'players', 'rounds', 'has_bot', 'concurrency')
+
+    def __init__(self, start, has_bot):
+        self.start = start
+        self.end = start
+        self.players = []
+        self.rounds = []
+        self.has_bot = has_bot
+        self.concurrency = 1
+
+
+class _Player:
+    __slots__ = ('delta', 'session')
+
+    def __init__(self):
+        self.delta = False
+        self.session = None
+
+
+class Journal:
+    def __init__(self):
+        self.sessions = []
+        self.records = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.connections = 0
+        self.bytes = 0
+
+    @classmethod
+    def load(cls, paths):
+        self = cls()
+        for path in paths:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                self.bytes += len(buf)
+                self._scan(buf)
+        self.sessions.sort(key=lambda s: s.start)
+        # Sessões em andamento quando cada uma começou (incluindo ela)
+        ends = []
+        for session in self.sessions:
+            while ends and ends[0] <= session.start:
+                heapq.heappop(ends)
+            heapq.heappush(ends, session.end)
+            session.concurrency = len(ends)
+        return self
+
+    # Os memoryviews de journal.records() não saem daqui: o mmap fecha em seguida
+    def _scan(self, buf):
+        players = {}
+        parser = FrameParser()
+        for ts, conn_id, kind, data in journal.records(buf):
+            self.records += 1
+            if kind == journal.START:
+                players = {} # Outro processo (ou reinício): os ids recomeçam
+                continue
+            if kind == journal.SESSION:
+                ids = journal.PAIR.unpack(data)
+                session = Session(ts, 0 in ids)
+                self.sessions.append(session)
+                for player_id in ids:
+                    player = players.get(player_id)
+                    if player is not None:
+                        player.session = session
+                        session.players.append(player)
+                continue
+            if kind == journal.OPEN:
+                players[conn_id] = _Player()
+                self.connections += 1
+                continue
+            player = players.get(conn_id)
+            if player is None:
+                continue
+            session = player.session
+            if session is not None:
+                session.end = ts
+            if kind == journal.IN:
+                self.frames_in += 1
+                try:
+                    parser.feed(bytes(data))
+                    msg = parser.next_message()
+                except ProtocolError:
+                    continue
+                if isinstance(msg, Hello):
+                    player.delta = bool(msg.features & FEATURE_DELTA)
+                elif session is None or not session.rounds:
+                    continue
+                elif isinstance(msg, SetWord):
+                    word = msg.word.lower()
+                    current = session.rounds[-1]
+                    if current.word is None and word.isalpha():
+                        current.word = word
+                elif isinstance(msg, Guess):
+                    session.rounds[-1].guesses.append(msg.letter)
+            elif kind == journal.OUT:
+                self.frames_out += 1
+                try:
+                    parser.feed(bytes(data))
+                    msgs = list(iter(parser.next_message, None))
+                except ProtocolError:
+                    continue
+                if session is None:
+                    continue
+                if any(isinstance(msg, Resume) for msg in msgs):
+                    continue # Estado reenviado a um jogador que retomou o lugar, não uma rodada nova
+                for msg in msgs:
+                    # Um OP_PLAYER_ROLE ao GUESSER por rodada (o SETTER recebe outro a cada palavra inválida)
+                    if isinstance(msg, PlayerRole) and msg.role == ROLE_GUESSER:
+                        session.rounds.append(Round())
+                    elif isinstance(msg, (GameOverWin, GameOverLose)) and session.rounds:
+                        session.rounds[-1].won = isinstance(msg, GameOverWin)
+
+    # Sessões entre dois jogadores gravados, com ao menos uma rodada
+    def replayable(self):
+        return [s for s in self.sessions if not s.has_bot and len(s.players) == 2 and s.rounds]
+
+
+def histogram(counts, width=40):
+    top = max(counts.values(), default=0)
+    for key in sorted(counts):
+        bar = '#' * max(1, round(counts[key] / top * width))
+        print(f"  {key:4} {counts[key]:8} {bar}")
+
+def print_stats(log, elapsed):
+    rounds = [r for s in log.sessions for r in s.rounds]
+    finished = [r for r in rounds if r.won is not None]
+    guesses = [len(r.guesses) for r in finished]
+    print(f"{log.records} registros, {log.bytes / 2**20:.1f} MB lidos em {elapsed * 1000:.0f} ms")
+    print(f"conexões {log.connections}  frames recebidos {log.frames_in}  enviados {log.frames_out}")
+    print(f"sessões {len(log.sessions)} (com bot {sum(s.has_bot for s in log.sessions)})  "
+          f"rodadas {len(rounds)} (terminadas {len(finished)}, interrompidas {len(rounds) - len(finished)})")
+    if not finished:
+        return
+    wins = sum(r.won for r in finished)
+    print(f"vitórias do guesser {wins / len(finished) * 100:.1f}%")
+    print(f"palpites por rodada: média {sum(guesses) / len(guesses):.1f}  p50 {percentile(guesses, 0.50)}  "
+          f"p90 {percentile(guesses, 0.90)}  máx {max(guesses)}")
+    histogram(Counter(guesses))
+    print("tamanho das palavras:")
+    histogram(Counter(len(r.word) for r in finished if r.word))
+
+
+# Cliente que segue o roteiro gravado da sessão no papel que o servidor sortear
+class ReplayClient(BotClient):
+    def __init__(self, host, port, stats, delta, rounds):
+        super().__init__(host, port, stats, delta=delta)
+        self.rounds = rounds
+        self.round = -1
+        self.script = iter(())
+
+    def handle(self, msg):
+        if isinstance(msg, PlayerRole):
+            self.round += 1
+            if self.round >= len(self.rounds):
+                return False
+            current = self.rounds[self.round]
+            if msg.role == ROLE_SETTER:
+                if current.word is None:
+                    return False # O SETTER gravado não chegou a escolher a palavra
+                self.words = (current.word,)
+            self.script = iter(current.guesses)
+        elif isinstance(msg, Restart):
+            self.restart = self.round + 1 < len(self.rounds) # Na última rodada gravada, os dois saem
+        return super().handle(msg)
+
+    def guess(self):
+        letter = next(self.script, None)
+        if letter is None:
+            self.writer.close() # A rodada gravada foi interrompida aqui
+            return
+        self.send_guess(letter)
+
+
+async def replay(host, port, sessions, stats):
+    tasks = {} # id(sessão) -> task
+    by_end = sorted(sessions, key=lambda s: s.end)
+    done = 0
+    for session in sessions:
+        while done < len(by_end) and by_end[done].end <= session.start:
+            task = tasks.get(id(by_end[done]))
+            if task is not None:
+                await asyncio.wait([task])
+            done += 1
+        pair = [ReplayClient(host, port, stats, player.delta, session.rounds) for player in session.players]
+        try:
+            # Um depois do outro: o lobby forma o par com os dois, como na sessão gravada
+            for client in pair:
+                await client.connect()
+        except OSError:
+            stats.errors += 1
+            for client in pair:
+                if client.writer is not None:
+                    client.writer.close()
+            continue
+        tasks[id(session)] = asyncio.ensure_future(asyncio.gather(*(client.run() for client in pair)))
+    if tasks:
+        await asyncio.wait(tasks.values())
+
+def run(host, port, sessions, pid=None):
+    stats = BotStats()
+    before = proc_sample(pid) if pid else None
+    start = time.perf_counter()
+    asyncio.run(replay(host, port, sessions, stats))
+    elapsed = time.perf_counter() - start
+    after = proc_sample(pid) if pid else None
+    recorded = sum(len(s.rounds) for s in sessions)
+    result = {
+        'sessoes': len(sessions),
+        'rodadas_gravadas': recorded,
+        'rodadas': stats.rounds,
+        'duracao_s': round(elapsed, 2),
+        'rodadas_por_s': round(stats.rounds / elapsed, 1),
+        'palpite_p50_ms': round(percentile(stats.guess_rtt, 0.50) * 1000, 3),
+        'palpite_p99_ms': round(percentile(stats.guess_rtt, 0.99) * 1000, 3),
+        'palpites': len(stats.guess_rtt),
+        'erros': stats.errors,
+        'concorrencia_max': max((s.concurrency for s in sessions), default=0),
+    }
+    if before and after:
+        result['servidor_cpu_pct'] = round((after[0] - before[0]) / elapsed * 100, 1)
+        result['servidor_rss_pico_mb'] = round(after[2] / 2**20, 1)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Estatísticas e reprodução de diários do servidor (--diario)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    stats = commands.add_parser('stats', help="tamanhos das palavras, palpites por rodada e vitórias")
+    stats.add_argument('arquivos', nargs='+')
+    play = commands.add_parser('run', help="joga as sessões gravadas contra um servidor local")
+    play.add_argument('arquivos', nargs='+')
+    play.add_argument('--host', default='127.0.0.1')
+    play.add_argument('--port', type=int, default=12345)
+    play.add_argument('--limite', type=int, help="reproduz só as N primeiras sessões")
+    play.add_argument('--pid', type=int, help="PID do servidor já em execução (para RSS/CPU)")
+    play.add_argument('--spawn', action='store_true', help="inicia o servidor (server.py) nesta porta")
+    play.add_argument('--server-args', default='', help="argumentos extras para o servidor iniciado com --spawn")
+    play.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    log = Journal.load(args.arquivos)
+    if args.command == 'stats':
+        print_stats(log, time.perf_counter() - start)
+        return
+
+    sessions = log.replayable()[:args.limite]
+    if not sessions:
+        sys.exit("Nenhuma sessão entre dois jogadores no diário")
+    raise_fd_limit()
+    proc = spawn_server(args.port, args.server_args.split()) if args.spawn else None
+    try:
+        result = run(args.host, args.port, sessions, proc.pid if proc else args.pid)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for key, value in result.items():
+            print(f"{key:24} {value}")
+
+if __name__ == '__main__':
+    main()
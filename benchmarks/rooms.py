@@ -0,0 +1,62 @@
+import argparse
+import json
+
+from benchmarks import loadgen
+from benchmarks.loadgen import raise_fd_limit, spawn_server
+
+# Latência dos palpites em salas de vários guessers (server.py --sala N): para
+# cada N sobe um servidor novo e abre N+1 bots, que formam uma única sala (um
+# SETTER e N GUESSERs chutando ao mesmo tempo na mesma palavra).
+#
+#   python3 -m benchmarks.rooms --guessers 1 10 50 100 --duracao 10
+#
+# O custo do servidor por palpite (CPU do servidor / palpites) deve ficar
+# estável com N: a sala lê todos os guessers com selectors e os OP_UPDATE de
+# cada passada vão juntos para todos (server.send_guess_updates). A latência
+# medida pelos bots não fica: cada bot tem um palpite em voo (latência ~ N /
+# palpites por segundo) e recebe o OP_UPDATE dos outros N-1, então o gerador
+# faz O(N) por palpite. Com servidor e gerador no mesmo núcleo, é o gerador que
+# limita a sala grande.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latência dos palpites em função do tamanho da sala")
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--guessers', type=int, nargs='+', default=[1, 10, 50, 100])
+    parser.add_argument('--duracao', type=float, default=10.0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    rows = []
+    for i, guessers in enumerate(args.guessers):
+        # Uma porta por servidor: as conexões do anterior ainda estão em TIME_WAIT
+        port = args.port + i
+        proc = spawn_server(port, ['--sala', str(guessers)])
+        try:
+            result = loadgen.run('127.0.0.1', port, guessers + 1, args.duracao, pid=proc.pid)
+        finally:
+            proc.terminate()
+            proc.wait()
+        rows.append({
+            'guessers': guessers,
+            'palpites_por_s': round(result['palpites'] / result['duracao_s'], 1),
+            'palpite_p50_ms': result['palpite_p50_ms'],
+            'palpite_p99_ms': result['palpite_p99_ms'],
+            'servidor_cpu_pct': result.get('servidor_cpu_pct'),
+            'servidor_us_por_palpite': round(result['servidor_cpu_pct'] * 1e4 / (result['palpites'] / result['duracao_s']), 1)
+                                       if result.get('servidor_cpu_pct') and result['palpites'] else None,
+            'erros': result['erros'],
+        })
+
+    if args.json:
+        print(json.dumps(rows))
+        return
+    print(f"{'guessers':>8} {'palpites/s':>11} {'palpite p50 ms':>15} {'palpite p99 ms':>15} {'cpu %':>6} "
+          f"{'cpu us/palpite':>15} {'erros':>6}")
+    for row in rows:
+        print(f"{row['guessers']:>8} {row['palpites_por_s']:>11} {row['palpite_p50_ms']:>15} "
+              f"{row['palpite_p99_ms']:>15} {row['servidor_cpu_pct']!s:>6} {row['servidor_us_por_palpite']!s:>15} {row['erros']:>6}")
+
+if __name__ == '__main__':
+    main()
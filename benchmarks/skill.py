@@ -0,0 +1,123 @@
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from benchmarks.lobby import close_all, fit_fd_limit, make_clients
+from connection import Connection
+from matchmaking import Lobby
+from skill import DEFAULT_RATING, SkillIndex
+
+# Pareamento por nível (skill.py, server.py --nivel):
+#   - índice: com F jogadores já na fila, mede buscas do parceiro mais próximo
+#     por segundo (cada busca retira um e coloca outro, mantendo a fila em F),
+#     comparando com uma varredura linear da fila
+#   - lobby: N clientes com ratings aleatórios entram de uma vez no
+#     matchmaking.Lobby; mede pares por segundo, tempo até o par (p50/p99/máx,
+#     limitado pelo alargamento da janela e por --max-espera) e a diferença de
+#     rating dos pares, comparando com a fila FIFO
+#
+#   python3 -m benchmarks.skill --fila 1000 10000 50000 --clientes 8000
+
+SPREAD = 350.0 # Desvio padrão dos ratings sorteados
+
+
+class _Player:
+    __slots__ = ('rating',)
+
+    def __init__(self, rating):
+        self.rating = rating
+
+def random_rating():
+    return random.gauss(DEFAULT_RATING, SPREAD)
+
+def bench_index(size, ops, window):
+    index = SkillIndex(window)
+    for i in range(size):
+        index.add(_Player(random_rating()), i)
+    searches = [random_rating() for _ in range(ops)]
+    start = time.perf_counter()
+    found = 0
+    for i, rating in enumerate(searches):
+        partner = index.pop_closest(rating, window)
+        if partner is not None:
+            found += 1
+            index.add(_Player(random_rating()), size + i)
+    elapsed = time.perf_counter() - start
+    return ops / elapsed, found / ops
+
+# A mesma busca sem índice: varre a fila inteira atrás do rating mais próximo
+def bench_scan(size, ops, window):
+    queue = [_Player(random_rating()) for _ in range(size)]
+    searches = [random_rating() for _ in range(ops)]
+    start = time.perf_counter()
+    for rating in searches:
+        best = min(range(len(queue)), key=lambda i: abs(queue[i].rating - rating))
+        if abs(queue[best].rating - rating) <= window:
+            queue[best] = _Player(random_rating())
+    return ops / (time.perf_counter() - start)
+
+def bench_lobby(name, n, skill):
+    server_side, client_side = make_clients(n)
+    arrivals, paired_at, gaps = {}, {}, []
+    done = threading.Event()
+
+    def on_pair(pair):
+        now = time.perf_counter()
+        for conn in pair:
+            paired_at[conn] = now
+        gaps.append(abs(pair[0].rating - pair[1].rating))
+        if len(paired_at) >= n - n % 2:
+            done.set()
+
+    lobby = Lobby(on_pair=on_pair, skill=skill)
+    conns = []
+    for s in server_side:
+        conn = Connection(s, None)
+        conn.rating = random_rating()
+        conns.append(conn)
+    start = time.perf_counter()
+    for conn in conns:
+        arrivals[conn] = time.perf_counter()
+        lobby.join(conn)
+    joined = time.perf_counter() - start
+    done.wait()
+    elapsed = time.perf_counter() - start
+
+    waits = sorted(paired_at[c] - arrivals[c] for c in paired_at)
+    p99 = waits[min(len(waits) - 1, int(len(waits) * 0.99))]
+    print(f"{name:6} pares/s={len(gaps) / joined:9.0f}  espera p50={statistics.median(waits) * 1000:8.2f} ms  "
+          f"p99={p99 * 1000:8.2f} ms  máx={waits[-1] * 1000:8.2f} ms  total={elapsed:6.2f} s  "
+          f"diferença de rating média={statistics.mean(gaps):6.1f}  p99={sorted(gaps)[int(len(gaps) * 0.99)]:6.1f}")
+    lobby.close()
+    close_all(server_side, client_side)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pareamento por nível")
+    parser.add_argument('--fila', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help="jogadores já esperando no índice")
+    parser.add_argument('--buscas', type=int, default=20000)
+    parser.add_argument('--clientes', type=int, default=8000)
+    parser.add_argument('--janela', type=float, default=50.0, help="janela inicial em pontos de rating")
+    parser.add_argument('--alargar', type=float, default=100.0, help="pontos por segundo de espera")
+    parser.add_argument('--max-espera', type=float, default=10.0, help="segundos até aceitar qualquer rating")
+    parser.add_argument('--sem-varredura', action='store_true', help="não mede a varredura linear (lenta com filas grandes)")
+    args = parser.parse_args()
+
+    random.seed(1)
+    for size in args.fila:
+        rate, hit = bench_index(size, args.buscas, args.janela)
+        line = f"fila={size:6d}  índice: {rate:9.0f} buscas/s ({hit * 100:5.1f}% com par)"
+        if not args.sem_varredura:
+            scan_ops = max(1, min(args.buscas, 2_000_000 // size))
+            line += f"  varredura: {bench_scan(size, scan_ops, args.janela):9.0f} buscas/s"
+        print(line)
+
+    if args.clientes:
+        n = fit_fd_limit(args.clientes)
+        bench_lobby("fifo", n, None)
+        bench_lobby("nível", n, SkillIndex(args.janela, args.alargar, args.max_espera))
+
+if __name__ == '__main__':
+    main()
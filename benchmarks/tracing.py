@@ -0,0 +1,78 @@
+import argparse
+import socket
+import tempfile
+import threading
+import time
+
+import profiler
+import tracing
+from connection import Connection
+
+# Custo do rastreio de rodadas (tracing.py) e do profiler (profiler.py) no
+# caminho de escrita: mede frames enviados por segundo por Connection.send em
+# um socketpair (com uma thread drenando o outro lado) nos estados
+#   desligado   tracing.enabled = False (o padrão do servidor)
+#   ligado      com uma rodada aberta, cada escrita somada à fase 'envio'
+#   profiler    desligado, com o profiler amostrando todas as threads
+# e o custo de uma marca de fase (RoundTrace.phase).
+#
+#   python3 -m benchmarks.tracing --frames 200000
+
+FRAME = bytes([7, 5]) + b'_a__a' # Do tamanho de um OP_GAME_STATE de palavra curta
+
+
+def _drain(sock):
+    while sock.recv(65536):
+        pass
+
+def bench_send(frames):
+    server_side, client_side = socket.socketpair()
+    reader = threading.Thread(target=_drain, args=(client_side,), daemon=True)
+    reader.start()
+    conn = Connection(server_side, None)
+    start = time.perf_counter()
+    for _ in range(frames):
+        conn.send(FRAME)
+    elapsed = time.perf_counter() - start
+    server_side.close()
+    reader.join()
+    client_side.close()
+    return frames / elapsed
+
+def bench_phase(marks):
+    trace = tracing.RoundTrace('bench')
+    start = time.perf_counter()
+    for _ in range(marks):
+        trace.phase('palpite')
+    return (time.perf_counter() - start) / marks
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do rastreio de rodadas e do profiler")
+    parser.add_argument('--frames', type=int, default=200000)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    def best(setup):
+        rates = []
+        for _ in range(args.repeticoes):
+            setup()
+            rates.append(bench_send(args.frames))
+        return max(rates)
+
+    tracing.enabled = False
+    off = best(lambda: None)
+    print(f"desligado  {off:10.0f} frames/s")
+
+    tracing.enabled = True
+    on = best(lambda: tracing.start_round('bench'))
+    print(f"ligado     {on:10.0f} frames/s  ({(1 / on - 1 / off) * 1e9:+6.0f} ns por escrita)")
+    tracing.enabled = False
+
+    profiler.start(profiler.MAX_SECONDS, tempfile.gettempdir()) # Termina com o processo, sem gravar
+    sampled = best(lambda: None)
+    print(f"profiler   {sampled:10.0f} frames/s  ({(1 / sampled - 1 / off) * 1e9:+6.0f} ns por escrita)")
+
+    print(f"marca de fase: {bench_phase(args.frames) * 1e9:.0f} ns")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.loadgen import raise_fd_limit, spawn_server
+
+# Escalabilidade do modo multiprocesso (server.py --workers N): para cada N sobe
+# um servidor novo e mede rodadas por segundo com o gerador de carga.
+#
+#   python3 -m benchmarks.workers --workers 1 2 4 8 --bots 2000 --duracao 20
+#
+# O gerador de carga também é limitado pelo GIL, então os bots são divididos em
+# --geradores processos (por padrão um por núcleo) e os resultados são somados.
+# Com N workers o ganho só aparece se houver núcleos para servidor e geradores.
+
+
+def run_generators(port, bots, duration, generators):
+    per_process = max(1, bots // generators)
+    cmd = [sys.executable, '-m', 'benchmarks.loadgen', '--port', str(port), '--json',
+           '--bots', str(per_process), '--duracao', str(duration)]
+    procs = [subprocess.Popen(cmd, stdout=subprocess.PIPE, preexec_fn=raise_fd_limit)
+             for _ in range(generators)]
+    results = [json.loads(proc.communicate()[0]) for proc in procs]
+    return {
+        'rodadas_por_s': round(sum(r['rodadas_por_s'] for r in results), 1),
+        'pareamento_p99_ms': max(r['pareamento_p99_ms'] for r in results),
+        'palpite_p99_ms': max(r['palpite_p99_ms'] for r in results),
+        'erros': sum(r['erros'] for r in results),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Rodadas por segundo em função do número de workers")
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--bots', type=int, default=1000)
+    parser.add_argument('--duracao', type=float, default=10.0)
+    parser.add_argument('--geradores', type=int, default=os.cpu_count() or 1,
+                        help="processos do gerador de carga")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    rows = []
+    for workers in args.workers:
+        proc = spawn_server(args.port, ['--workers', str(workers)])
+        try:
+            result = run_generators(args.port, args.bots, args.duracao, args.geradores)
+        finally:
+            proc.terminate()
+            proc.wait()
+        time.sleep(0.5) # Libera a porta para o próximo servidor
+        result['workers'] = workers
+        rows.append(result)
+
+    if args.json:
+        print(json.dumps(rows))
+        return
+    print(f"núcleos: {os.cpu_count()}  bots: {args.bots}  geradores: {args.geradores}")
+    print(f"{'workers':>8} {'rodadas/s':>10} {'pareamento p99 ms':>18} {'palpite p99 ms':>15} {'erros':>6}")
+    for row in rows:
+        print(f"{row['workers']:>8} {row['rodadas_por_s']:>10} {row['pareamento_p99_ms']:>18} "
+              f"{row['palpite_p99_ms']:>15} {row['erros']:>6}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import random
+import time
+
+from protocol import (
+    FEATURE_DELTA, RECV_CHUNK, ROLE_SETTER, ROLE_GUESSER, FrameParser, SetWord, Guess, Hello, Login,
+    Restart, PlayerRole, Start, GameState, Update, GameOverWin, GameOverLose, OpponentWon,
+    OpponentLost, RestartConfirm, WaitingForPlayer, Busy,
+)
+from wordlist import LETTER_ORDER
+
+# Cliente sem interface (bot) que joga sozinho contra o servidor: escolhe
+# palavras, chuta letras e responde ao OP_RESTART. Usado pelo gerador de carga
+# (benchmarks/loadgen.py) para abrir milhares de sessões em um único processo.
+
+WORDS = [
+    'casa', 'banana', 'janela', 'computador', 'forca', 'teclado', 'servidor', 'cliente',
+    'protocolo', 'palavra', 'abacaxi', 'elefante', 'girassol', 'montanha', 'biblioteca',
+    'chocolate', 'bicicleta', 'travesseiro', 'guarda', 'relogio', 'cachorro', 'sorvete',
+]
+
+
+# Métricas coletadas por todos os bots de uma execução
+class BotStats:
+    def __init__(self):
+        self.pairing = []     # segundos entre entrar no lobby e receber o papel
+        self.guess_rtt = []   # segundos entre enviar OP_GUESS e receber a resposta
+        self.rounds = 0       # rodadas terminadas (contadas pelo guesser)
+        self.wins = 0
+        self.errors = 0
+        self.connections = 0
+        self.rejected = 0     # conexões recusadas com OP_BUSY (controle de admissão do servidor)
+        self.spectator_frames = 0 # frames de jogo recebidos pelos espectadores (loadgen --espectadores)
+
+
+class BotClient:
+    def __init__(self, host, port, stats, delta=True, restart=True, words=WORDS, pick_letter=None, name=None):
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.delta = delta
+        self.restart = restart
+        self.words = words
+        self.pick_letter = pick_letter or self._next_frequent_letter
+        self.name = name # Com nome (OP_LOGIN) as rodadas do bot entram no placar do servidor
+        self.parser = FrameParser()
+        self.reader = None
+        self.writer = None
+        self.role = 0
+        self.busy = False # O servidor recusou a conexão (OP_BUSY)
+        self.display = []
+        self.wrong = set()
+        self.remaining = 0
+        self.tried = set()
+        self.lobby_since = None
+        self.guess_sent_at = None # Palpite em voo (None = nenhum)
+        self.guess_letter = None
+        self.reads = 0 # Leituras do socket; a resposta a um palpite vem em uma leitura posterior
+        self.guess_read = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.stats.connections += 1
+        self.lobby_since = time.perf_counter()
+
+    # Conecta (se connect() ainda não foi chamado) e joga até o servidor encerrar
+    async def run(self):
+        if self.writer is None:
+            await self.connect()
+        reader = self.reader
+        try:
+            if self.delta:
+                self.writer.write(Hello(FEATURE_DELTA).encode())
+            if self.name:
+                self.writer.write(Login(self.name).encode())
+            while True:
+                data = await reader.read(RECV_CHUNK)
+                if not data:
+                    return
+                self.reads += 1
+                self.parser.feed(data)
+                msg = self.parser.next_message()
+                while msg is not None:
+                    if not self.handle(msg):
+                        return
+                    msg = self.parser.next_message()
+        except ConnectionError:
+            self.stats.errors += 1
+        finally:
+            self.writer.close()
+
+    def send(self, data):
+        self.writer.write(data)
+
+    # A resposta ao palpite em voo é o próximo frame lido depois dele, exceto
+    # OP_HELLO e, em uma sala (server.py --sala), o OP_UPDATE do palpite de outro
+    # guesser (que pode ter chutado a mesma letra antes)
+    def _answers_guess(self, msg):
+        if self.reads == self.guess_read:
+            return False # Já estava no buffer quando o palpite saiu
+        if isinstance(msg, Update):
+            return msg.letter == self.guess_letter
+        return not isinstance(msg, Hello)
+
+    # Trata uma mensagem; False encerra o bot
+    def handle(self, msg):
+        now = time.perf_counter()
+
+        if self.guess_sent_at is not None and self._answers_guess(msg):
+            self.stats.guess_rtt.append(now - self.guess_sent_at)
+            self.guess_sent_at = None
+
+        if isinstance(msg, WaitingForPlayer):
+            if self.lobby_since is None: # Voltou ao lobby depois de uma sessão
+                self.lobby_since = now
+        elif isinstance(msg, PlayerRole):
+            if self.lobby_since is not None:
+                self.stats.pairing.append(now - self.lobby_since)
+                self.lobby_since = None
+            self.role = msg.role
+            if msg.role == ROLE_SETTER:
+                self.send(SetWord(random.choice(self.words)).encode())
+        elif isinstance(msg, Start):
+            self.display = ['_'] * msg.length
+            self.wrong = set()
+            self.tried = set()
+        elif isinstance(msg, GameState):
+            self.display = list(msg.display)
+            self.wrong = set(msg.wrong)
+            self.remaining = msg.remaining
+            if self.role == ROLE_GUESSER and msg.turn == 1:
+                self.guess()
+        elif isinstance(msg, Update):
+            if msg.hit:
+                for i in msg.positions:
+                    self.display[i] = msg.letter
+            else:
+                self.wrong.add(msg.letter)
+                self.remaining -= 1
+            # Com um palpite em voo, espera a resposta dele antes do próximo
+            if self.role == ROLE_GUESSER and self.guess_sent_at is None and '_' in self.display and self.remaining > 0:
+                self.guess()
+        elif isinstance(msg, (GameOverWin, GameOverLose)):
+            self.stats.rounds += 1
+            if isinstance(msg, GameOverWin):
+                self.stats.wins += 1
+        elif isinstance(msg, Restart):
+            self.send(Restart(1 if self.restart else 0).encode())
+        elif isinstance(msg, RestartConfirm):
+            if msg.flag == 0:
+                return False
+        elif isinstance(msg, Busy):
+            self.stats.rejected += 1
+            self.busy = True
+            return False
+        elif not isinstance(msg, (OpponentWon, OpponentLost, Hello)):
+            logging.warning(f"Bot recebeu mensagem inesperada: {msg!r}")
+        return True
+
+    def guess(self):
+        letter = self.pick_letter(self.display, self.wrong, self.tried)
+        self.tried.add(letter)
+        self.send_guess(letter)
+
+    def send_guess(self, letter):
+        self.guess_letter = letter.lower() # O servidor responde com a letra minúscula
+        self.guess_read = self.reads
+        self.guess_sent_at = time.perf_counter()
+        self.send(Guess(letter).encode())
+
+    @staticmethod
+    def _next_frequent_letter(display, wrong, tried):
+        for c in LETTER_ORDER:
+            if c not in tried and c not in wrong and c not in display:
+                return c
+        return 'a'
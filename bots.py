@@ -0,0 +1,77 @@
+import itertools
+import socket
+
+import metrics
+from connection import Connection
+from protocol import ROLE_SETTER, FrameParser, GameState, Guess, PlayerRole, Restart, SetWord
+
+# Oponentes bot do servidor. Um bot é uma Connection comum cujo socket é uma
+# ponta de um socketpair: as respostas do bot são escritas na outra ponta e lidas
+# por play_round / handle_game_session exatamente como as de um jogador (com os
+# mesmos prazos e o mesmo selector). O bot "joga" dentro de send(), na thread da
+# sessão, sem thread própria.
+
+_ids = itertools.count(1)
+
+
+class BotConnection(Connection):
+    __slots__ = ('_peer', '_parser')
+    is_bot = True
+    active_gauge = metrics.BOTS_ACTIVE
+
+    def __init__(self):
+        sock, self._peer = socket.socketpair()
+        super().__init__(sock, ('bot', next(_ids)))
+        self.reader.on_bytes = None # Bytes internos não entram em hagsman_bytes_in_total
+        self._parser = FrameParser()
+
+    # Recebe os frames que o servidor mandaria ao jogador e escreve as respostas
+    def send(self, data: bytes):
+        if self._closed:
+            return False
+        self._parser.feed(data)
+        msg = self._parser.next_message()
+        while msg is not None:
+            reply = self.respond(msg)
+            if reply is not None:
+                self._peer.sendall(reply.encode())
+            msg = self._parser.next_message()
+        return True
+
+    def respond(self, msg):
+        if isinstance(msg, Restart):
+            return Restart(1) # O bot aceita jogar de novo enquanto o jogador quiser
+        return None
+
+    def close(self):
+        super().close()
+        self._peer.close()
+
+
+# Bot que joga como SETTER (palavras de uma wordlist.WordList) e/ou como GUESSER
+# (solver.Solver). Com role=None joga os dois papéis, alternando como em uma
+# partida entre jogadores: é o modo de um jogador só.
+class ServerBot(BotConnection):
+    __slots__ = ('bot_role', 'words', 'level', 'guesser', 'tried')
+
+    def __init__(self, words, solver=None, level=None, role=ROLE_SETTER):
+        super().__init__()
+        self.bot_role = role
+        self.words = words
+        self.level = level
+        self.guesser = solver.guesser() if solver else None
+        self.tried = set()
+        # Sem OP_UPDATE: o GUESSER bot lê display e letras erradas do OP_GAME_STATE completo
+        self.features = 0
+
+    def respond(self, msg):
+        if isinstance(msg, PlayerRole):
+            if msg.role == ROLE_SETTER:
+                return SetWord(self.words.sample(level=self.level))
+            self.guesser.reset()
+            self.tried.clear()
+        elif isinstance(msg, GameState) and msg.turn == 1 and self.guesser is not None:
+            letter = self.guesser.pick_letter(msg.display, msg.wrong, self.tried)
+            self.tried.add(letter)
+            return Guess(letter)
+        return super().respond(msg)
@@ -1,44 +1,21 @@
+import argparse
 import socket
 import logging
 import os
+import time
 
-from server import OP_WAITING_FOR_PLAYER
+import logconfig
 
-# Configuração de logs
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='[%(asctime)s] %(levelname)s %(message)s',
-    datefmt='%H:%M:%S'
+from protocol import (
+    FEATURE_DELTA, FEATURE_RESUME, ROLE_SETTER, ROLE_GUESSER, FrameReader, SetWord, Guess, Hello, Login, Resume, Watch,
+    PlayerRole, Start, GameState, GameOverWin, GameOverLose, OpponentWon, OpponentLost,
+    Restart, RestartConfirm, WaitingForPlayer, Update, Busy, BUSY_CONNECTIONS, BUSY_SESSIONS, BUSY_RATE,
+    MAX_NAME, valid_name,
 )
 
 HOST = 'localhost'
 PORT = 12345
 
-# Opcodes (Certifique-se de que o servidor use os mesmos valores)
-OP_SETWORD         = 1
-OP_GUESS           = 2
-OP_UPDATE          = 3
-OP_RESTART         = 4
-OP_START           = 5
-OP_GAME_OVER_WIN   = 6
-OP_GAME_OVER_LOSE  = 7
-OP_PLAYER_ROLE     = 8
-OP_GAME_STATE      = 9
-OP_OPPONENT_WON    = 11
-OP_OPPONENT_LOST   = 12
-OP_RESTART_CONFIRM = 13
-OP_WAITING_FOR_PLAYER = 14
-
-def recv_exact(sock, n):
-    buf = b''
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
-            raise ConnectionError("Conexão encerrada pelo servidor")
-        buf += chunk
-    logging.debug(f"Recebido {buf!r}")
-    return buf
-
 def display_game_state(word_display, wrong_guesses, remaining_attempts):
     clear_screen()
     print("\n" + "="*30)
@@ -47,13 +24,89 @@ def display_game_state(word_display, wrong_guesses, remaining_attempts):
     print(f"❤️ Tentativas restantes: {remaining_attempts}")
     print("="*30)
 
+BUSY_REASONS = {
+    BUSY_CONNECTIONS: "conexões demais",
+    BUSY_SESSIONS: "partidas demais em andamento",
+    BUSY_RATE: "conexões demais deste endereço",
+}
+
+def print_busy(msg):
+    print(f"Servidor ocupado ({BUSY_REASONS.get(msg.reason, 'motivo desconhecido')}). Tente de novo mais tarde.")
+
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
-def main():
+# Pede uma letra ainda não tentada e envia o palpite
+def send_guess(s, current_word_display, wrong_guesses):
+    guess = ''
+    while len(guess) != 1 or not guess.isalpha() or guess in wrong_guesses or guess in current_word_display:
+        guess = input("Sua vez. Digite uma letra: ").strip().lower()
+        if guess in wrong_guesses or guess in current_word_display: # Validação local de letra já tentada
+            print(f"A letra '{guess}' já foi tentada ou está na palavra. Tente outra.")
+            guess = ''
+    s.sendall(Guess(guess).encode())
+    logging.debug(f"Enviou palpite '{guess}'")
+
+# Reconecta e apresenta o token de retomada; None se o servidor não responder
+def reconnect(host, port, hello, token, attempts=10):
+    for _ in range(attempts):
+        try:
+            s = socket.create_connection((host, port), timeout=5)
+        except OSError:
+            time.sleep(1)
+            continue
+        s.settimeout(None)
+        s.sendall(hello + Resume(token).encode())
+        return s
+    return None
+
+# Modo espectador: assiste uma partida (id de /games, ou a mais assistida) até
+# ela terminar. Recebe a visão do SETTER, sem a palavra antes do fim da rodada.
+def watch(host, port, game):
+    with socket.create_connection((host, port)) as s:
+        s.sendall(Watch(game).encode())
+        reader = FrameReader(s, (host, port))
+        try:
+            while True:
+                msg = reader.read_message()
+                if isinstance(msg, Busy):
+                    print_busy(msg)
+                    return
+                if isinstance(msg, Watch):
+                    if not msg.game:
+                        print("Nenhuma partida em andamento com esse id.")
+                        return
+                    game = msg.game
+                    print(f"Assistindo a partida {game}. Aguardando a próxima jogada...")
+                elif isinstance(msg, GameState):
+                    display_game_state(msg.display, msg.wrong, msg.remaining)
+                    print(f"👀 Assistindo a partida {game}")
+                elif isinstance(msg, OpponentWon):
+                    print(f"\nO GUESSER ADIVINHOU A PALAVRA: {msg.word.upper()}")
+                elif isinstance(msg, OpponentLost):
+                    print(f"\nO GUESSER NÃO ADIVINHOU A PALAVRA: {msg.word.upper()}")
+        except ConnectionError:
+            print("\nA partida terminou.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cliente do jogo da forca")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--nome', help="nome no placar do servidor (letras, dígitos, '_' e '-')")
+    parser.add_argument('--assistir', nargs='?', const='', metavar='PARTIDA',
+                        help="assiste uma partida em vez de jogar (id de /games; sem id, a mais assistida)")
+    logconfig.add_logging_args(parser, default_level='WARNING')
+    args = parser.parse_args(argv)
+    if args.nome and not valid_name(args.nome):
+        parser.error(f"--nome: até {MAX_NAME} letras, dígitos, '_' ou '-'")
+    logconfig.setup_from_args(args)
+    if args.assistir is not None:
+        watch(args.host, args.port, args.assistir)
+        return
+
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
-        s.connect((HOST, PORT))
+        s.connect((args.host, args.port))
         logging.info("Conectado ao servidor.")
 
         # Variáveis de estado do jogo no cliente
@@ -62,136 +115,148 @@ def main():
         remaining_attempts = 0
         is_setter = False
         
-        # Loop principal do cliente para gerenciar múltiplos jogos/reinícios
-        while True: 
-            logging.debug("Esperando opcode do servidor...")
-            op = recv_exact(s, 1)[0]
-            logging.debug(f"Opcode {op} recebido")
-
-            if op == OP_PLAYER_ROLE:
-                role_byte = recv_exact(s, 1)[0]
-                if role_byte == 1:
-                    is_setter = True
-                    clear_screen()
-                    print("\nVocê é o SETTER (quem escolhe a palavra).")
-                    word = ""
-                    while not word or not word.isalpha():
-                        word = input("🔒 Digite a palavra secreta: ").strip().lower()
-                        if not word.isalpha() or len(word) == 0:
-                            print("A palavra deve conter apenas letras e não pode ser vazia. Tente novamente.")
-                    s.sendall(bytes([OP_SETWORD, len(word)]) + word.encode('ascii'))
-                    logging.debug(f"Enviou palavra '{word}'")
-                    print("Palavra enviada. Aguardando o GUESSER começar...")
-                elif role_byte == 2:
-                    is_setter = False
-                    clear_screen()
-                    print("\nVocê é o GUESSER (quem adivinha a palavra).")
-                    print("Aguardando o SETTER definir a palavra e o jogo começar...")
-                else:
-                    logging.warning(f"Tipo de papel desconhecido recebido: {role_byte}")
-
-            elif op == OP_START:
-                length = recv_exact(s, 1)[0]
-                current_word_display = ['_'] * length
-                wrong_guesses = set()
-                remaining_attempts = 6
-
-                # O OP_START apenas informa o início, o OP_GAME_STATE fará a primeira exibição completa.
-                logging.debug(f"OP_START: length={length}")
-
-            elif op == OP_GAME_STATE:
-                len_word_display = recv_exact(s, 1)[0]
-                word_display_bytes = recv_exact(s, len_word_display)
-                current_word_display = list(word_display_bytes.decode('ascii'))
-
-                len_wrong_guesses = recv_exact(s, 1)[0]
-                wrong_guesses_bytes = recv_exact(s, len_wrong_guesses)
-                wrong_guesses = set(wrong_guesses_bytes.decode('ascii'))
-
-                remaining_attempts = recv_exact(s, 1)[0]
-
-                is_my_turn_flag = recv_exact(s, 1)[0]
-
-                display_game_state(current_word_display, wrong_guesses, remaining_attempts)
-
-                if is_setter:
-                    print("Aguardando a jogada do GUESSER...")
-                    continue # Volta para esperar o próximo opcode
-
-                if is_my_turn_flag == 1:
-                    guess = ''
-                    while len(guess) != 1 or not guess.isalpha() or guess in wrong_guesses or guess in current_word_display:
-                        guess = input("Sua vez. Digite uma letra: ").strip().lower()
-                        if guess in wrong_guesses or guess in current_word_display: # Validação local de letra já tentada
-                            print(f"A letra '{guess}' já foi tentada ou está na palavra. Tente outra.")
-                            guess = ''
-                    s.sendall(bytes([OP_GUESS]) + guess.encode('ascii'))
-                    logging.debug(f"Enviou palpite '{guess}'")
-                else:
-                    print("Aguardando a vez do outro jogador...")
-
-            elif op == OP_GAME_OVER_WIN:
-                final_word_len = recv_exact(s, 1)[0]
-                final_word = recv_exact(s, final_word_len).decode('ascii')
-                clear_screen()
-                print("\nPARABÉNS! VOCÊ ADIVINHOU A PALAVRA! 🎉")
-                print(f"A palavra era: {final_word.upper()}")
-
-            elif op == OP_GAME_OVER_LOSE:
-                final_word_len = recv_exact(s, 1)[0]
-                final_word = recv_exact(s, final_word_len).decode('ascii')
-                clear_screen()
-                print("\nVOCÊ PERDEU! 😭")
-                print(f"A palavra era: {final_word.upper()}")
-
-
-            elif op == OP_OPPONENT_WON:
-                final_word_len = recv_exact(s, 1)[0]
-                final_word = recv_exact(s, final_word_len).decode('ascii')
-                clear_screen()
-                print("\nO GUESSER ADIVINHOU A PALAVRA! 😥")
-                print(f"A palavra era: {final_word.upper()}")
-
-
-            elif op == OP_OPPONENT_LOST:
-                final_word_len = recv_exact(s, 1)[0]
-                final_word = recv_exact(s, final_word_len).decode('ascii')
-                clear_screen()
-                print("\nO GUESSER NÃO ADIVINHOU A PALAVRA. 😜")
-                print(f"A palavra era: {final_word.upper()}")
-
-
-            elif op == OP_RESTART:
-                # O servidor envia OP_RESTART com flag 1 (pedindo decisão) ou 0 (confirmando encerramento/reinício)
-                restart_ask_flag = recv_exact(s, 1)[0]
-                if restart_ask_flag == 1: # Servidor está perguntando se quer reiniciar
-                    ans = input("Jogar de novo? (1=sim / 0=não): ").strip()
-                    response_flag = 1 if ans == '1' else 0
-                    s.sendall(bytes([OP_RESTART, response_flag]))
-                    logging.debug(f"Respondeu restart={response_flag}")
-                else:
-                    logging.warning(f"Recebeu OP_RESTART com flag inesperada: {restart_ask_flag}. Deveria ser 1 (pergunta).")
-                    break
-
-            elif op == OP_RESTART_CONFIRM:
-                confirm_flag = recv_exact(s, 1)[0]
-                if confirm_flag == 1:
-                    print("\nO servidor confirmou o reinício. Nova rodada começando!")
-                elif confirm_flag == 0:
-                    print("\nO servidor confirmou o encerramento da sessão. Encerrando.")
-                    break
-
-            elif op == OP_WAITING_FOR_PLAYER:
-                print("Aguardando por outro jogador para iniciar a partida...")
-
-
-            elif op == OP_UPDATE:
-                logging.warning("Recebeu OP_UPDATE. O servidor deveria estar enviando OP_GAME_STATE.")
-                # Tenta consumir os bytes do OP_UPDATE para não bagunçar o fluxo
-                recv_exact(s, 1) # letter
-                recv_exact(s, 1) # flag
-            else:
-                logging.warning(f"Opcode desconhecido: {op}")
+        reader = FrameReader(s, (args.host, args.port))
+        # Pede ao servidor frames delta (OP_UPDATE) e um token de retomada (OP_RESUME)
+        hello = Hello(FEATURE_DELTA | FEATURE_RESUME).encode()
+        if args.nome:
+            hello += Login(args.nome).encode()
+        s.sendall(hello)
+        token = None
+
+        # Loop principal do cliente para gerenciar múltiplos jogos/reinícios. Se a
+        # conexão cair com um token de retomada, reconecta e o servidor reenvia o
+        # estado da rodada.
+        while True:
+            try:
+                while True: 
+                    logging.debug("Esperando mensagem do servidor...")
+                    msg = reader.read_message()
+
+                    if isinstance(msg, PlayerRole):
+                        if msg.role == ROLE_SETTER:
+                            is_setter = True
+                            clear_screen()
+                            print("\nVocê é o SETTER (quem escolhe a palavra).")
+                            word = ""
+                            while not word or not word.isalpha():
+                                word = input("🔒 Digite a palavra secreta: ").strip().lower()
+                                if not word.isalpha() or len(word) == 0:
+                                    print("A palavra deve conter apenas letras e não pode ser vazia. Tente novamente.")
+                            s.sendall(SetWord(word).encode())
+                            logging.debug(f"Enviou palavra '{word}'")
+                            print("Palavra enviada. Aguardando o GUESSER começar...")
+                        elif msg.role == ROLE_GUESSER:
+                            is_setter = False
+                            clear_screen()
+                            print("\nVocê é o GUESSER (quem adivinha a palavra).")
+                            print("Aguardando o SETTER definir a palavra e o jogo começar...")
+                        else:
+                            logging.warning(f"Tipo de papel desconhecido recebido: {msg.role}")
+
+                    elif isinstance(msg, Start):
+                        current_word_display = ['_'] * msg.length
+                        wrong_guesses = set()
+                        remaining_attempts = 6
+
+                        # O OP_START apenas informa o início, o OP_GAME_STATE fará a primeira exibição completa.
+                        logging.debug(f"OP_START: length={msg.length}")
+
+                    elif isinstance(msg, GameState):
+                        current_word_display = list(msg.display)
+                        wrong_guesses = set(msg.wrong)
+                        remaining_attempts = msg.remaining
+
+                        display_game_state(current_word_display, wrong_guesses, remaining_attempts)
+
+                        if is_setter:
+                            print("Aguardando a jogada do GUESSER...")
+                            continue # Volta para esperar o próximo opcode
+
+                        if msg.turn == 1:
+                            send_guess(s, current_word_display, wrong_guesses)
+                        else:
+                            print("Aguardando a vez do outro jogador...")
+
+                    elif isinstance(msg, GameOverWin):
+                        clear_screen()
+                        print("\nPARABÉNS! VOCÊ ADIVINHOU A PALAVRA! 🎉")
+                        print(f"A palavra era: {msg.word.upper()}")
+
+                    elif isinstance(msg, GameOverLose):
+                        clear_screen()
+                        print("\nVOCÊ PERDEU! 😭")
+                        print(f"A palavra era: {msg.word.upper()}")
+
+                    elif isinstance(msg, OpponentWon):
+                        clear_screen()
+                        print("\nO GUESSER ADIVINHOU A PALAVRA! 😥")
+                        print(f"A palavra era: {msg.word.upper()}")
+
+                    elif isinstance(msg, OpponentLost):
+                        clear_screen()
+                        print("\nO GUESSER NÃO ADIVINHOU A PALAVRA. 😜")
+                        print(f"A palavra era: {msg.word.upper()}")
+
+                    elif isinstance(msg, Restart):
+                        # O servidor envia OP_RESTART com flag 1 (pedindo decisão) ou 0 (confirmando encerramento/reinício)
+                        if msg.flag == 1: # Servidor está perguntando se quer reiniciar
+                            ans = input("Jogar de novo? (1=sim / 0=não): ").strip()
+                            response_flag = 1 if ans == '1' else 0
+                            s.sendall(Restart(response_flag).encode())
+                            logging.debug(f"Respondeu restart={response_flag}")
+                        else:
+                            logging.warning(f"Recebeu OP_RESTART com flag inesperada: {msg.flag}. Deveria ser 1 (pergunta).")
+                            break
+
+                    elif isinstance(msg, RestartConfirm):
+                        if msg.flag == 1:
+                            print("\nO servidor confirmou o reinício. Nova rodada começando!")
+                        elif msg.flag == 0:
+                            print("\nO servidor confirmou o encerramento da sessão. Encerrando.")
+                            break
+
+                    elif isinstance(msg, WaitingForPlayer):
+                        print("Aguardando por outro jogador para iniciar a partida...")
+
+                    elif isinstance(msg, Busy):
+                        print_busy(msg)
+                        break
+
+                    elif isinstance(msg, Update):
+                        # Delta do último palpite (negociado com OP_HELLO): aplica sobre o estado local
+                        if msg.hit:
+                            for i in msg.positions:
+                                current_word_display[i] = msg.letter
+                        else:
+                            wrong_guesses.add(msg.letter)
+                            remaining_attempts -= 1
+
+                        display_game_state(current_word_display, wrong_guesses, remaining_attempts)
+
+                        if is_setter:
+                            print("Aguardando a jogada do GUESSER...")
+                        elif '_' in current_word_display and remaining_attempts > 0:
+                            send_guess(s, current_word_display, wrong_guesses)
+
+                    elif isinstance(msg, Resume):
+                        token = msg.token or None # Vazio: o servidor não tinha mais o nosso lugar
+                        logging.debug(f"Token de retomada: {token}")
+
+                    elif isinstance(msg, Hello):
+                        logging.debug(f"Servidor aceitou recursos {msg.features:#04x}")
+                    else:
+                        logging.warning(f"Mensagem inesperada: {msg!r}")
+                break
+            except ConnectionError as e:
+                if token is None:
+                    raise
+                logging.warning(f"Conexão caiu ({e}); tentando retomar a partida.")
+                print("\nConexão perdida. Reconectando...")
+                s.close()
+                s = reconnect(args.host, args.port, hello, token)
+                if s is None:
+                    raise
+                reader = FrameReader(s, (args.host, args.port))
 
     except ConnectionError as e:
         logging.error(f"Conexão caiu: {e}")
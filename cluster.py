@@ -0,0 +1,294 @@
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import threading
+
+import journal
+import logconfig
+import metrics
+import resume
+import server
+import spectators
+from connection import Connection
+from matchmaking import Lobby
+
+# Modo multiprocesso (server.py --workers N): contorna o GIL rodando as sessões
+# em N processos filhos.
+# - Cada worker faz bind na mesma porta com SO_REUSEPORT; o kernel distribui as
+#   conexões novas entre eles.
+# - O lobby é único e fica no processo principal (broker). Quem entra no lobby em
+#   um worker tem o descritor do socket enviado ao broker por um socketpair Unix
+#   (SCM_RIGHTS, socket.send_fds); o broker reaproveita matchmaking.Lobby e, ao
+#   formar um par, devolve os dois descritores ao worker de quem chegou por último,
+#   que roda a sessão. Assim dois jogadores em workers diferentes ainda se encontram.
+# - Junto com cada descritor vão o endereço, os recursos negociados (OP_HELLO), o
+#   nome do jogador (OP_LOGIN), o rating (skill.py) e os bytes já lidos e não
+#   consumidos, para que nenhum frame se perca na troca, e o instante do fim da
+#   rodada de quem volta ao lobby (time.monotonic usa o mesmo relógio em todos
+#   os processos).
+# - Tokens de retomada (resume.py) começam com o índice do worker da sessão. Um
+#   OP_RESUME lido no lobby do broker faz a conexão ser encaminhada, com o token,
+#   a esse worker, que a coloca de volta no lugar (ou a devolve ao lobby).
+# - Ids de partida (spectators.py) também: um OP_WATCH lido no broker leva a
+#   conexão ao worker da partida. Sem id, vai ao worker que aceitou a conexão,
+#   que escolhe a sua partida mais assistida.
+
+MAX_MESSAGE = 64 * 1024
+
+
+def _pack(conns, requeued_at=None, resume_token=None, watch=None):
+    clients = []
+    for conn in conns:
+        if conn.is_bot:
+            clients.append({'bot': True}) # O worker cria o próprio bot
+            continue
+        features, data = conn.export_state()
+        clients.append({
+            'addr': list(conn.addr) if conn.addr else None,
+            'features': features,
+            'name': conn.name,
+            'rating': conn.rating,
+            'data': data.decode('latin-1'),
+            'requeued_at': requeued_at,
+            'resume': resume_token,
+            'watch': watch,
+        })
+    return json.dumps(clients).encode(), [conn.fileno() for conn in conns if not conn.is_bot]
+
+def _unpack(payload, fds):
+    entries = []
+    fds = iter(fds)
+    for info in json.loads(payload):
+        if 'bot' in info:
+            entries.append((server.make_bot(), None, None, None))
+            continue
+        sock = socket.socket(fileno=next(fds))
+        sock.settimeout(None) # O modo não bloqueante é do descritor, compartilhado entre processos
+        conn = Connection(sock, tuple(info['addr']) if info['addr'] else None)
+        conn.restore_state(info['features'], info['data'].encode('latin-1'))
+        conn.name = info['name']
+        conn.rating = info['rating']
+        entries.append((conn, info['requeued_at'], info['resume'], info['watch']))
+    return entries
+
+# Envia conexões pelo canal; a cópia local do descritor continua aberta até conn.close()
+def send_connections(channel, conns, requeued_at=None, resume_token=None, watch=None):
+    payload, fds = _pack(conns, requeued_at, resume_token, watch)
+    socket.send_fds(channel, [payload], fds)
+
+# Recebe [(conexão, requeued_at, token de retomada, partida a assistir)] do canal; None se o outro processo fechou o canal
+def recv_connections(channel):
+    payload, fds, _flags, _addr = socket.recv_fds(channel, MAX_MESSAGE, 2)
+    if not payload:
+        return None
+    return _unpack(payload, fds)
+
+
+# Lobby visto de dentro de um worker: mesma interface de matchmaking.Lobby
+# (join / close / len), mas a fila de espera mora no broker.
+class RemoteLobby:
+    def __init__(self, channel, on_pair):
+        self._channel = channel
+        self._on_pair = on_pair
+        self._receiver = threading.Thread(target=self._receive, name="lobby-remote", daemon=True)
+        self._receiver.start()
+
+    def __len__(self):
+        return 0 # A profundidade do lobby é exposta pelo broker
+
+    # Um único sendmsg por mensagem em SOCK_SEQPACKET: chamadas de threads
+    # diferentes não se misturam e dispensam lock
+    def join(self, conn, addr=None, requeued_at=None):
+        try:
+            send_connections(self._channel, [conn], requeued_at)
+        except OSError as e:
+            logging.error(f"Falha ao enviar {addr} para o lobby: {e}")
+        conn.close()
+
+    def close(self):
+        self._channel.close()
+
+    def _receive(self):
+        while True:
+            try:
+                entries = recv_connections(self._channel)
+            except OSError:
+                entries = None
+            if entries is None:
+                logging.error("Broker encerrado; finalizando worker.")
+                logconfig.shutdown()
+                os._exit(1)
+            conn, _, token, watch = entries[0]
+            if token is not None:
+                if resume.claim(token, conn):
+                    conn.close() # O socket passou para o lugar da sessão
+                else:
+                    self.join(conn, conn.addr) # Lugar expirado: entra no lobby como jogador novo
+            elif watch is not None:
+                spectators.watch(conn, watch)
+                conn.close() # O socket passou para o espectador (ou foi fechado, sem a partida)
+            else:
+                self._on_pair([conn for conn, _, _, _ in entries])
+
+
+# Lobby compartilhado no processo principal
+class Broker:
+    def __init__(self, channels):
+        self.lobby = Lobby(on_pair=self._dispatch, idle_timeout=server.LOBBY_IDLE_TIMEOUT,
+                           bot_after=server.BOT_AFTER, make_bot=server.make_bot, skill=server.skill_index())
+        self._channels = list(channels)
+        self._workers = list(channels) # Índice do worker -> canal (para os tokens de retomada)
+        resume.registry().forward = self._forward_resume
+        spectators.registry().forward = self._forward_watch
+        self._source = None # Canal do worker cuja conexão está sendo colocada no lobby
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        for channel in self._channels:
+            selector.register(channel, selectors.EVENT_READ)
+
+        while self._channels:
+            for key, _ in selector.select():
+                channel = key.fileobj
+                try:
+                    entries = recv_connections(channel)
+                except OSError:
+                    entries = None
+                if entries is None:
+                    logging.warning("Um worker encerrou; seu canal com o broker foi fechado.")
+                    selector.unregister(channel)
+                    channel.close()
+                    self._channels.remove(channel)
+                    continue
+                self._source = channel
+                for conn, requeued_at, _, _ in entries:
+                    self.lobby.join(conn, conn.addr, requeued_at)
+        selector.close()
+        self.lobby.close()
+
+    # Entrega o par ao worker de quem acabou de entrar (ou a outro, se ele caiu).
+    # Pares com bot são formados na thread da roda de tempo, daí a cópia da lista.
+    def _dispatch(self, pair):
+        channels = list(self._channels)
+        candidates = [self._source] + [c for c in channels if c is not self._source]
+        for channel in candidates:
+            if channel not in channels:
+                continue
+            try:
+                send_connections(channel, pair)
+                break
+            except OSError as e:
+                logging.warning(f"Falha ao entregar par a um worker: {e}")
+        else:
+            logging.error(f"Nenhum worker disponível para o par {pair[0].addr} / {pair[1].addr}.")
+        for conn in pair:
+            conn.close() # Fecha só a cópia do broker
+
+
+    # OP_RESUME lido no lobby: a sessão do token está no worker indicado pelo prefixo
+    def _forward_resume(self, token, conn):
+        channel = self._worker_of(token)
+        return channel is not None and self._forward(channel, conn, resume_token=token)
+
+    # OP_WATCH lido no lobby: a partida está no worker do prefixo do id; sem id,
+    # no worker que aceitou a conexão
+    def _forward_watch(self, game, conn):
+        channel = self._worker_of(game) if game else self._source
+        return channel in self._channels and self._forward(channel, conn, watch=game)
+
+    def _worker_of(self, key):
+        index, sep, _ = key.partition('.')
+        if not sep or not index.isdigit() or int(index) >= len(self._workers):
+            return None
+        channel = self._workers[int(index)]
+        return channel if channel in self._channels else None
+
+    def _forward(self, channel, conn, **route):
+        try:
+            send_connections(channel, [conn], **route)
+        except OSError as e:
+            logging.warning(f"Falha ao encaminhar {conn.addr} a um worker: {e}")
+            return False
+        conn.detach() # Fecha a cópia do broker; o lobby descarta a conexão
+        return True
+
+
+def _run_worker(index, channel, args):
+    logconfig.setup_from_args(args)
+    logconfig.install_level_toggle()
+    signal.signal(signal.SIGTERM, server.terminate) # Encerra pelo finally, gravando o placar
+    server.configure_leaderboard(args)
+    server.configure_journal(args, f'.{index}')
+    server.configure_diagnostics(args)
+    resume.registry().prefix = f'{index}.'
+    spectators.registry().prefix = f'{index}.'
+    if args.metrics_port:
+        metrics.add_route('/games', spectators.games_json, 'application/json')
+        metrics.serve(args.metrics_host, args.metrics_port + 1 + index)
+
+    remote = RemoteLobby(channel, on_pair=server.start_session)
+    srv = server.create_listener(args.host, args.port, reuse_port=True, backlog=args.backlog)
+    logging.info(f"Worker {index} (pid {os.getpid()}) em {args.host}:{args.port}")
+    server.serve(srv, remote)
+
+def main(args):
+    channels = []
+    pids = []
+    for index in range(args.workers):
+        parent_end, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        pid = os.fork()
+        if pid == 0:
+            parent_end.close()
+            for channel in channels:
+                channel.close()
+            code = 0
+            try:
+                _run_worker(index, child_end, args)
+            except SystemExit:
+                pass # SIGTERM (server.terminate)
+            except BaseException:
+                logging.exception(f"Worker {index} terminou com erro")
+                code = 1
+            finally:
+                server.ignore_terminate() # Um SystemExit aqui escaparia do os._exit
+                if server.leaderboard is not None:
+                    server.leaderboard.close() # os._exit não roda atexit
+                if journal.recorder is not None:
+                    journal.recorder.close()
+                logconfig.shutdown()
+                os._exit(code)
+        child_end.close()
+        channels.append(parent_end)
+        pids.append(pid)
+
+    logconfig.setup_from_args(args)
+    logconfig.install_level_toggle()
+    signal.signal(signal.SIGTERM, server.terminate)
+    server.configure_leaderboard(args) # Só lê o top-N gravado pelos workers
+    server.configure_diagnostics(args) # No broker só o profiler tem o que medir (o lobby)
+    broker = Broker(channels)
+    if args.metrics_port:
+        metrics.LOBBY_DEPTH.func = lambda: len(broker.lobby)
+        metrics.serve(args.metrics_host, args.metrics_port)
+    logging.info(f"Broker do lobby com {args.workers} workers em {args.host}:{args.port}")
+
+    try:
+        broker.run()
+    except KeyboardInterrupt:
+        logging.info("Servidor encerrado pelo usuário.")
+    finally:
+        server.ignore_terminate() # Termina de encerrar e esperar os workers
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        logging.info("Servidor finalizado.")
@@ -0,0 +1,350 @@
+import logging
+import socket
+import time
+
+import admission
+import journal
+import metrics
+import resume
+import skill
+import spectators
+import timers
+import tracing
+from logconfig import EVENT_FRAME_OUT
+from protocol import FEATURE_DELTA, FEATURE_RESUME, FrameReader, Hello, Login, ProtocolError, Resume, Watch, valid_name
+
+# Recursos opcionais que este servidor aceita negociar (FEATURE_RESUME só com
+# resume.GRACE > 0)
+SUPPORTED_FEATURES = FEATURE_DELTA | FEATURE_RESUME
+
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+FRAME_OUT = {'event': EVENT_FRAME_OUT}
+
+# Socket já fechado que fica no lugar do socket de uma conexão que o cedeu a
+# outra (resume.py): fileno() == -1, então ela passa a contar como fechada
+_DETACHED = socket.socket()
+_DETACHED.close()
+
+
+# Conexão de um jogador no servidor: socket, endereço (guardado uma vez, sem
+# getpeername a cada envio), o buffer de leitura de frames e os recursos
+# negociados com OP_HELLO. Clientes antigos nunca mandam OP_HELLO e continuam
+# recebendo apenas os frames completos. O nome vem do OP_LOGIN opcional e
+# identifica o jogador no placar (leaderboard.py).
+#
+# Durante uma sessão a conexão agrupa os envios (cork): send() só guarda o frame
+# e tudo o que a sessão produziu ao tratar um evento sai em uma única escrita,
+# antes da próxima leitura bloqueante dela ou do parceiro (flush_group). Fora da
+# sessão (lobby) cada send() escreve na hora.
+#
+# Com o diário ligado (journal.py) os frames recebidos e enviados são gravados
+# nos mesmos pontos; conexões de bots não entram no diário.
+#
+# __slots__ em vez de __dict__: com dezenas de milhares de jogadores parados no
+# lobby (benchmarks/memory.py) o dicionário de atributos de cada conexão pesa.
+class Connection:
+    __slots__ = ('sock', 'addr', 'reader', 'features', 'name', 'in_session', 'resume_token',
+                 'snapshot', 'moved', '_pending', '_incoming', 'corked', 'flush_group',
+                 '_out', '_closed', '_journal', 'journal_id', 'rating')
+    is_bot = False
+    bot_role = None # Papel fixo de um oponente bot (bots.py); None = qualquer papel
+    active_gauge = metrics.CONNECTIONS_ACTIVE
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.reader = FrameReader(sock, addr, metrics.BYTES_IN.inc)
+        self.features = 0
+        self.name = None
+        self.rating = skill.DEFAULT_RATING # Nível para o pareamento (skill.py), atualizado a cada rodada
+        self.in_session = False
+        self.resume_token = None
+        self.snapshot = None # resume.Snapshot enquanto o lugar pode ser retomado
+        self.moved = False   # O socket foi cedido ao lugar de uma sessão retomada
+        self._pending = None # Mensagem já lida ao processar mensagens de controle
+        self._incoming = None # Conexão nova que retomou o lugar, ainda não assumida pela sessão
+        self.corked = False
+        self.flush_group = None # Conexões escritas antes de uma leitura bloqueante desta (a sessão)
+        self._out = [] # Frames guardados enquanto corked
+        self._closed = False
+        self._journal = None if self.is_bot else journal.recorder
+        self.journal_id = self._journal.open(addr) if self._journal is not None else 0
+        self.active_gauge.inc()
+        if not self.is_bot:
+            admission.connection_opened()
+
+    def supports(self, feature):
+        return self.features & feature
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def is_closed(self):
+        return self.sock.fileno() == -1
+
+    # Envia dados para o socket lidando com possíveis erros de conexão; com a
+    # conexão agrupando, só guarda o frame até o próximo flush()
+    def send(self, data: bytes):
+        if self._incoming is not None:
+            self._resume()
+        if self.sock.fileno() == -1: # Verifica se o socket ainda está aberto
+            logging.warning(f"Tentativa de enviar para socket fechado: {self.addr}")
+            return False
+        metrics.FRAMES_OUT.inc()
+        if self._journal is not None:
+            self._journal.record(self.journal_id, journal.OUT, data)
+        if self.corked:
+            self._out.append(data)
+            return True
+        return self._write(data)
+
+    # Escreve de uma vez os frames guardados desde o último flush. Com
+    # block=False a escrita não espera o buffer do socket: se ele não aceitar
+    # tudo, devolve False e o fluxo de frames ficou pela metade (quem chama
+    # desconecta; ex.: um guesser atrasado em uma sala, rooms.py)
+    def flush(self, block=True):
+        if not self._out:
+            return True
+        out = self._out
+        data = out[0] if len(out) == 1 else b''.join(out)
+        out.clear()
+        if self.sock.fileno() == -1:
+            return False
+        return self._write(data, block)
+
+    def _write(self, data, block=True):
+        started = time.perf_counter() if tracing.enabled else 0.0
+        try:
+            if block:
+                self.sock.sendall(data)
+            elif self.sock.send(data, _MSG_DONTWAIT) != len(data):
+                raise BlockingIOError("Buffer do socket cheio")
+        except Exception as e:
+            logging.warning(f"Falha ao enviar para {self.addr}: {e}")
+            return False
+        if started:
+            tracing.wrote(time.perf_counter() - started)
+        metrics.SOCKET_WRITES.inc()
+        metrics.BYTES_OUT.inc(len(data))
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f"Enviado {data!r} para {self.addr}", extra=FRAME_OUT)
+        return True
+
+    # Passa a agrupar os envios; `group` são as conexões escritas antes de cada
+    # leitura bloqueante desta (as da sessão, incluindo ela mesma)
+    def cork(self, group):
+        self.corked = True
+        self.flush_group = group
+
+    # Volta a escrever na hora, começando pelo que estiver guardado
+    def uncork(self):
+        self.corked = False
+        self.flush_group = None
+        self.flush()
+
+    def flush_before_read(self):
+        for conn in self.flush_group or (self,):
+            conn.flush()
+
+    # Próxima mensagem de jogo; mensagens de controle (OP_HELLO, OP_LOGIN) são tratadas aqui
+    # e nunca chegam a play_round / handle_game_session.
+    # Com `timeout`, o prazo fica na roda de tempo (timers.py) em vez de um
+    # settimeout por leitura; se vencer, a leitura é interrompida e levanta
+    # socket.timeout. A conexão expirada não serve mais para leitura.
+    # Se a conexão cair com o lugar aberto para retomada, espera o jogador
+    # reconectar (resume.py), reenvia o estado da rodada e lê de novo.
+    def read_message(self, timeout=None):
+        while True:
+            if self._incoming is not None:
+                self._resume()
+            self.flush_before_read()
+            try:
+                return self._read_message(timeout)
+            except ProtocolError:
+                raise
+            except ConnectionError:
+                if not resume.wait(self):
+                    raise
+
+    def _read_message(self, timeout):
+        msg, self._pending = self._pending, None
+        if msg is not None:
+            return msg
+        if not timeout:
+            return self._read_game_message()
+
+        timer = timers.schedule(timeout, self._expire)
+        try:
+            msg = self._read_game_message()
+        except ConnectionError:
+            if timers.cancel(timer):
+                raise
+            raise socket.timeout(f"Prazo de {timeout}s esgotado") from None
+        if not timers.cancel(timer):
+            raise socket.timeout(f"Prazo de {timeout}s esgotado")
+        return msg
+
+    def _read_game_message(self):
+        msg = None
+        while msg is None:
+            msg = self.reader.read_message()
+            if self._journal is not None:
+                self._journal.record(self.journal_id, journal.IN, msg.encode())
+            if self._handle_control(msg):
+                if self.moved:
+                    raise ConnectionError("Conexão cedida a uma sessão retomada")
+                msg = None
+        return msg
+
+    # Chamado pela roda de tempo: SHUT_RD acorda o recv bloqueado (que retorna 0)
+    # sem impedir o envio do frame de encerramento
+    def _expire(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+
+    def _handle_control(self, msg):
+        if isinstance(msg, Hello):
+            self.features = msg.features & SUPPORTED_FEATURES
+            if not resume.GRACE:
+                self.features &= ~FEATURE_RESUME
+            logging.debug("Cliente %s negociou recursos %#04x", self.addr, self.features)
+            self.send(Hello(self.features).encode())
+            if self.in_session:
+                resume.issue(self) # OP_HELLO chegou depois do início da sessão
+            return True
+        if isinstance(msg, Login):
+            if valid_name(msg.name):
+                self.name = msg.name
+                logging.debug("Cliente %s entrou como '%s'", self.addr, self.name)
+            else:
+                logging.warning(f"Nome inválido de {self.addr}: {msg.name!r}; jogando sem placar")
+            return True
+        if isinstance(msg, Resume):
+            resume.claim(msg.token, self)
+            return True
+        if isinstance(msg, Watch):
+            if self.in_session:
+                logging.warning(f"OP_WATCH de {self.addr} durante uma sessão; ignorado.")
+                self.send(Watch('').encode())
+            else:
+                spectators.watch(self, msg.game)
+            return True
+        return False
+
+    # Lê o que já estiver disponível sem bloquear e trata as mensagens de controle
+    # que estiverem no buffer; False se o outro lado fechou
+    def poll(self):
+        try:
+            if not self.reader.fill(_MSG_DONTWAIT):
+                return False
+        except BlockingIOError:
+            pass
+        except OSError:
+            return False
+        try:
+            while self._pending is None and self.reader.buffered():
+                msg = self.reader.next_message()
+                if msg is None:
+                    break
+                if self._journal is not None:
+                    self._journal.record(self.journal_id, journal.IN, msg.encode())
+                if not self._handle_control(msg):
+                    self._pending = msg
+                elif self.moved:
+                    return False
+        except ProtocolError as e:
+            logging.warning(f"Frame inválido de {self.addr}: {e}")
+            return False
+        return True
+
+    def has_pending(self):
+        return self._pending is not None
+
+    # Mensagem de jogo já lida por poll(), sem bloquear (None se não houver)
+    def pending_message(self):
+        msg, self._pending = self._pending, None
+        return msg
+
+    # Estado que precisa acompanhar o socket quando a conexão muda de processo:
+    # recursos negociados e bytes já lidos mas ainda não consumidos
+    def export_state(self):
+        data = self._pending.encode() if self._pending is not None else b''
+        self._pending = None
+        return self.features, data + self.reader.take_buffered()
+
+    def restore_state(self, features, data):
+        self.features = features
+        if data:
+            self.reader.feed(data)
+
+    # Recebe o socket, o leitor e os recursos de `other`, a conexão nova do mesmo
+    # jogador (resume.claim, com o lock do registro e fora da thread da sessão).
+    # A troca em si é feita pela thread da sessão em _resume, antes do próximo
+    # envio ou leitura, então ela nunca lê do socket novo sem antes reenviar o
+    # estado. O shutdown do socket antigo acorda uma leitura bloqueada nele.
+    def adopt(self, other):
+        if self._incoming is not None:
+            self._incoming[0].close() # Reconectou de novo antes de a sessão assumir a anterior
+        self._incoming = (other.sock, other.reader, other.addr, other.features, other._pending)
+        other._detach()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # Cede o socket: a conexão passa a contar como fechada sem fechar o descritor
+    def _detach(self):
+        self.moved = True
+        self._pending = None
+        self.sock = _DETACHED
+        self.reader = FrameReader(_DETACHED, self.addr)
+
+    # Entrega o socket a quem vai usá-lo daqui em diante (um espectador, spectators.py)
+    def take_socket(self):
+        sock = self.sock
+        self._detach()
+        return sock
+
+    # Entregou o descritor a outro processo (cluster.py) ou não vai mais usá-lo:
+    # fecha o socket e a conexão deixa o lobby como se o tivesse cedido
+    def detach(self):
+        sock = self.sock
+        self._detach()
+        sock.close()
+
+    # Thread da sessão: assume a conexão nova, confirma o token (OP_RESUME) e
+    # reenvia papel e estado da rodada. O que foi enviado ao socket antigo
+    # depois da queda está coberto pelo estado completo.
+    def _resume(self):
+        incoming = resume.take(self)
+        if incoming is None:
+            return
+        old = self.sock
+        self._out.clear() # Nunca chegou ao cliente e está coberto pelo estado reenviado
+        self.sock, self.reader, self.addr, self.features, pending = incoming
+        self._pending = pending
+        old.close()
+        frames = [Resume(self.resume_token or '').encode()]
+        if self.snapshot is not None:
+            frames += self.snapshot.frames()
+        self.send(b''.join(frames))
+
+    def close(self):
+        self.flush() # Ex.: OP_RESTART_CONFIRM 0 guardado logo antes de desconectar
+        if not self._closed:
+            self._closed = True
+            self.active_gauge.dec()
+            if not self.is_bot:
+                admission.connection_closed()
+            resume.release(self)
+            if self._journal is not None:
+                self._journal.record(self.journal_id, journal.CLOSE)
+        incoming = resume.take(self)
+        if incoming is not None:
+            incoming[0].close()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
@@ -0,0 +1,84 @@
+from protocol import OP_GAME_STATE
+
+MAX_ERRORS = 6
+
+# Estado de uma rodada. O índice letra -> posições é montado uma vez por palavra,
+# então cada palpite é resolvido com uma consulta ao dicionário. As letras já
+# tentadas e as erradas ficam em bitmasks (bit 0 = 'a') e a exibição em um bytearray.
+class WordGame:
+    __slots__ = ('word', 'index', 'display', 'hidden', 'guessed', 'wrong', 'errors', 'max_errors', '_frames')
+
+    def __init__(self, word: str, max_errors=MAX_ERRORS):
+        self.word = word
+        index = {}
+        for i, c in enumerate(word):
+            index.setdefault(c, []).append(i)
+        self.index = {c: tuple(positions) for c, positions in index.items()}
+        self.display = bytearray(95 if c.isalpha() else ord(c) for c in word) # 95 = '_'
+        self.hidden = self.display.count(b'_')
+        self.guessed = 0
+        self.wrong = 0
+        self.errors = 0
+        self.max_errors = max_errors
+        self._frames = None
+
+    @property
+    def remaining(self):
+        return self.max_errors - self.errors
+
+    @property
+    def won(self):
+        return self.hidden == 0
+
+    @property
+    def lost(self):
+        return self.errors >= self.max_errors
+
+    @property
+    def over(self):
+        return self.hidden == 0 or self.errors >= self.max_errors
+
+    def display_str(self):
+        return self.display.decode('ascii')
+
+    def wrong_str(self):
+        return letters_from_mask(self.wrong)
+
+    # Aplica um palpite. Devolve (acertou, posições) ou None se a letra for
+    # inválida ou repetida (o estado não muda).
+    def guess(self, ch: str):
+        if len(ch) != 1 or not ('a' <= ch <= 'z'):
+            return None
+        bit = 1 << (ord(ch) - 97)
+        if self.guessed & bit:
+            return None
+        self.guessed |= bit
+        self._frames = None
+
+        positions = self.index.get(ch)
+        if positions:
+            code = ord(ch)
+            display = self.display
+            for i in positions:
+                display[i] = code
+            self.hidden -= len(positions)
+            return True, positions
+
+        self.wrong |= bit
+        self.errors += 1
+        return False, ()
+
+    # Frames OP_GAME_STATE completos para o guesser (com a vez) e para o setter
+    # (nunca chuta), codificados uma vez por mudança de estado. O frame do setter
+    # é o mesmo objeto enviado aos espectadores (spectators.py).
+    def state_frames(self, is_guesser_turn=True):
+        frames = self._frames
+        if frames is None:
+            wrong = self.wrong_str().encode('ascii')
+            base = (bytes([OP_GAME_STATE, len(self.display)]) + self.display
+                    + bytes([len(wrong)]) + wrong + bytes([self.remaining]))
+            frames = self._frames = (base + b'\x01', base + b'\x00')
+        return frames if is_guesser_turn else (frames[1], frames[1])
+
+def letters_from_mask(mask: int) -> str:
+    return ''.join(chr(97 + i) for i in range(26) if mask >> i & 1)
@@ -0,0 +1,125 @@
+import itertools
+import logging
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import metrics
+
+# Diário binário do servidor (server.py --diario ARQUIVO): todos os frames
+# recebidos e enviados pelas conexões de jogadores, com instante, em um arquivo
+# só de acréscimo. Com --workers cada worker grava o próprio arquivo (ARQUIVO.N).
+# benchmarks/replay.py lê o diário com mmap para estatísticas das rodadas e para
+# reproduzir as partidas contra um servidor local.
+#
+# Formato: MAGIC e depois registros [tamanho u32][instante f64][conexão u32][tipo u8][dados],
+# little-endian. `conexão` é um id por processo (0 = nenhuma); a cada abertura do
+# arquivo vem um registro START e os ids recomeçam.
+#
+# record() só anexa uma tupla a um deque, sem I/O nem struct na thread de jogo;
+# uma thread de escrita empacota e grava tudo a cada `flush_interval`.
+
+MAGIC = b'HGJ1'
+RECORD = struct.Struct('<IdIB')
+PAIR = struct.Struct('<II')
+
+START = 0   # dados: pid do processo (texto)
+OPEN = 1    # dados: endereço do cliente (texto)
+IN = 2      # dados: um frame recebido
+OUT = 3     # dados: um ou mais frames enviados em um send()
+CLOSE = 4
+SESSION = 5 # conexão 0; dados: PAIR com os ids dos dois jogadores (0 = bot)
+
+
+class Recorder:
+    def __init__(self, path, flush_interval=0.2):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._ids = itertools.count(1)
+        self._pending = deque()
+        self._stop = threading.Event()
+        self._file = open(path, 'ab') # Erros de arquivo aparecem na inicialização
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self.record(0, START, str(os.getpid()).encode())
+        self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    # Novo id de conexão, com o registro OPEN
+    def open(self, addr):
+        conn_id = next(self._ids)
+        self.record(conn_id, OPEN, str(addr).encode())
+        return conn_id
+
+    # Caminho quente: não bloqueia nem aloca além da tupla
+    def record(self, conn_id, kind, data=b''):
+        self._pending.append((time.time(), conn_id, kind, data))
+
+    def session(self, conn_ids):
+        self.record(0, SESSION, PAIR.pack(*conn_ids))
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        pending = self._pending
+        if not pending:
+            return
+        out = bytearray()
+        pack = RECORD.pack
+        try:
+            while True:
+                ts, conn_id, kind, data = pending.popleft()
+                out += pack(len(data), ts, conn_id, kind)
+                out += data
+        except IndexError:
+            pass
+        try:
+            self._file.write(out)
+            self._file.flush()
+        except OSError as e:
+            logging.error(f"Falha ao gravar o diário {self.path}: {e}")
+            return
+        metrics.JOURNAL_BYTES.inc(len(out))
+
+
+# Percorre os registros de um diário (bytes, mmap ou memoryview) sem copiar os
+# dados: gera (instante, conexão, tipo, dados) com `dados` como memoryview
+def records(buf):
+    view = memoryview(buf)
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Arquivo não é um diário do servidor")
+    pos = len(MAGIC)
+    end = len(view)
+    header = RECORD.size
+    unpack = RECORD.unpack_from
+    while pos + header <= end:
+        size, ts, conn_id, kind = unpack(view, pos)
+        start = pos + header
+        pos = start + size
+        if pos > end:
+            break # Último registro incompleto (servidor encerrado no meio da gravação)
+        yield ts, conn_id, kind, view[start:pos]
+
+
+recorder = None # Recorder do processo (None = diário desligado)
+
+def configure(path):
+    global recorder
+    recorder = Recorder(path)
+    return recorder
+
+def session(conns):
+    if recorder is not None:
+        recorder.session([conn.journal_id for conn in conns])
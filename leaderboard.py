@@ -0,0 +1,128 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics
+
+# Placar persistente (SQLite) dos jogadores identificados com OP_LOGIN.
+#
+# As threads de jogo nunca tocam no disco: record() só enfileira o resultado da
+# rodada. Uma thread de escrita esvazia a fila a cada `flush_interval`, soma os
+# resultados por jogador e grava tudo em uma única transação (um UPSERT por
+# jogador do lote, não por rodada). O top-N é lido do índice por pontuação a
+# cada `refresh_interval` e fica em memória, já serializado em JSON para o
+# endpoint HTTP, então consultas ao placar também não vão ao disco.
+#
+# Com --workers cada processo tem a própria conexão e thread de escrita sobre o
+# mesmo arquivo (modo WAL; escritores concorrentes esperam pelo lock).
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    name    TEXT PRIMARY KEY,
+    score   INTEGER NOT NULL DEFAULT 0,
+    rounds  INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS players_by_score ON players (score DESC, rounds);
+"""
+
+UPSERT = """
+INSERT INTO players (name, score, rounds, updated) VALUES (?, ?, ?, ?)
+ON CONFLICT (name) DO UPDATE SET
+    score = score + excluded.score,
+    rounds = rounds + excluded.rounds,
+    updated = excluded.updated
+"""
+
+TOP = "SELECT name, score, rounds FROM players ORDER BY score DESC, rounds LIMIT ?"
+
+
+class Leaderboard:
+    def __init__(self, path, top_n=10, flush_interval=0.5, refresh_interval=5.0):
+        self.path = path
+        self.top_n = top_n
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self._queue = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._top = []
+        self._top_json = b'[]'
+        self._db = self._connect() # Criado aqui para que erros de arquivo apareçam na inicialização
+        self._refresh()
+        self._thread = threading.Thread(target=self._run, name="leaderboard-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL") # Com WAL, perde no máximo o último lote em queda de energia
+        db.executescript(SCHEMA)
+        return db
+
+    # Resultado de uma rodada para um jogador; não bloqueia
+    def record(self, name, points, rounds=1):
+        self._queue.put((name, points, rounds))
+
+    # Top-N em cache: [(nome, pontos, rodadas)]
+    def top(self):
+        return self._top
+
+    def top_json(self):
+        return self._top_json
+
+    # Grava o que estiver na fila e encerra a thread de escrita
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        self._db.close()
+
+    def _run(self):
+        next_refresh = time.monotonic()
+        while not self._stop.wait(self.flush_interval):
+            self._flush()
+            # Também sem escritas locais: com --workers outros processos gravam no mesmo arquivo
+            if time.monotonic() >= next_refresh:
+                self._refresh()
+                next_refresh = time.monotonic() + self.refresh_interval
+        self._flush()
+
+    # Esvazia a fila e grava o lote somado por jogador
+    def _flush(self):
+        batch = {}
+        try:
+            while True:
+                name, points, rounds = self._queue.get_nowait()
+                total = batch.get(name)
+                batch[name] = (points, rounds) if total is None else (total[0] + points, total[1] + rounds)
+        except queue.Empty:
+            pass
+        if not batch:
+            return
+
+        started = time.monotonic()
+        now = time.time()
+        try:
+            with self._db:
+                self._db.executemany(UPSERT, [(name, p, r, now) for name, (p, r) in batch.items()])
+        except sqlite3.Error as e:
+            # O lote volta para a fila e é tentado de novo no próximo ciclo
+            logging.error(f"Falha ao gravar o placar ({len(batch)} jogadores): {e}")
+            for name, (p, r) in batch.items():
+                self._queue.put((name, p, r))
+            return
+        metrics.LEADERBOARD_FLUSH_SECONDS.observe(time.monotonic() - started)
+        metrics.LEADERBOARD_WRITES.inc(len(batch))
+
+    def _refresh(self):
+        try:
+            rows = self._db.execute(TOP, (self.top_n,)).fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Falha ao ler o placar: {e}")
+            return
+        self._top = rows
+        self._top_json = json.dumps([{'nome': n, 'pontos': s, 'rodadas': r} for n, s, r in rows]).encode()
@@ -0,0 +1,157 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import signal
+import sys
+import threading
+
+# Configuração de logs do servidor e do cliente, feita em tempo de execução:
+# - as threads do jogo só colocam o registro em uma fila (QueueHandler); a escrita
+#   no stderr acontece em uma thread de fundo (QueueListener);
+# - linhas de debug por frame são marcadas com extra={'event': ...} e podem ser
+#   amostradas por tipo de evento (ex.: 1 a cada 100 frame_out);
+# - saída estruturada (JSON por linha) é opcional.
+# Quem loga por frame deve checar logging.root.isEnabledFor(logging.DEBUG) antes
+# de montar a mensagem, para não formatar nada com o nível desligado.
+
+TEXT_FORMAT = '[%(asctime)s] %(levelname)s %(message)s'
+DATE_FORMAT = '%H:%M:%S'
+QUEUE_SIZE = 10000
+
+# Tipos de evento usados nas linhas de debug por frame
+EVENT_FRAME_IN = 'frame_in'
+EVENT_FRAME_OUT = 'frame_out'
+
+_listener = None
+_handler = None
+_base_level = logging.INFO
+
+
+# Mantém 1 a cada N registros de cada tipo de evento; registros sem evento passam sempre
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self._counters = {}
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        rate = self.rates.get(event, 1) if event else 1
+        if rate <= 1:
+            return True
+        # Contagem sem lock: uma amostragem aproximada sob concorrência é aceitável
+        count = self._counters.get(event, 0) + 1
+        self._counters[event] = count
+        return count % rate == 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': record.created,
+            'level': record.levelname,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        event = getattr(record, 'event', None)
+        if event:
+            entry['event'] = event
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# QueueHandler que não bloqueia nem formata na thread do jogo: a mensagem é
+# montada pelo formatter na thread de fundo e, com a fila cheia, o registro é descartado.
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Tracebacks não podem cruzar threads com segurança; viram texto aqui
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# Lê "evento=N,evento=N" (ex.: "frame_in=100,frame_out=100")
+def parse_sampling(spec):
+    rates = {}
+    for item in filter(None, (spec or '').split(',')):
+        event, _, rate = item.partition('=')
+        rates[event.strip()] = max(1, int(rate))
+    return rates
+
+def setup_logging(level='INFO', structured=False, sampling=None, stream=None):
+    global _listener, _handler, _base_level
+
+    shutdown()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if structured else logging.Formatter(TEXT_FORMAT, DATE_FORMAT))
+
+    _handler = _NonBlockingQueueHandler(queue.Queue(QUEUE_SIZE))
+    _handler.addFilter(SamplingFilter(sampling))
+    root.addHandler(_handler)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown)
+
+    _base_level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+    root.setLevel(_base_level)
+
+# Esvazia a fila de logs; para quem sai com os._exit (ex.: processos filhos do fork)
+def shutdown():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def set_level(level):
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    logging.getLogger().setLevel(level)
+    logging.info(f"Nível de log alterado para {logging.getLevelName(level)}")
+
+def set_sampling(event, rate):
+    for log_filter in _handler.filters if _handler else ():
+        if isinstance(log_filter, SamplingFilter):
+            log_filter.rates[event] = max(1, int(rate))
+
+# SIGUSR1 alterna entre o nível configurado e DEBUG sem reiniciar o processo
+def install_level_toggle(signum=getattr(signal, 'SIGUSR1', None)):
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return
+
+    def toggle(_signum, _frame):
+        root = logging.getLogger()
+        set_level(_base_level if root.level == logging.DEBUG else logging.DEBUG)
+
+    signal.signal(signum, toggle)
+
+# Argumentos de linha de comando comuns a servidor e cliente
+def add_logging_args(parser, default_level='INFO'):
+    parser.add_argument('--log-level', default=default_level,
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper)
+    parser.add_argument('--log-json', action='store_true', help="uma linha JSON por registro")
+    parser.add_argument('--log-amostra', default='', metavar='EVENTO=N,...',
+                        help=f"mantém 1 a cada N linhas de debug por evento ({EVENT_FRAME_IN}, {EVENT_FRAME_OUT})")
+
+def setup_from_args(args):
+    setup_logging(args.log_level, args.log_json, parse_sampling(args.log_amostra))
@@ -0,0 +1,275 @@
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+
+import metrics
+import timers
+
+# Lobby orientado a eventos: os clientes esperando não têm thread própria.
+# Trabalha com objetos de conexão (connection.Connection): fileno(), poll(),
+# has_pending(), moved e close().
+# - A fila é FIFO (OrderedDict): parear e remover um cliente são O(1).
+# - Quem chega pareia na hora com o cliente mais antigo da fila e a sessão é
+#   entregue ao callback on_pair (no servidor, uma thread por sessão).
+# - Uma única thread observadora usa selectors para perceber quando um cliente
+#   que está esperando fecha o socket, sem polling.
+# - Com idle_timeout, quem espera mais que isso é removido e desconectado; o
+#   prazo fica na roda de tempo (timers.py), sem thread por cliente.
+# - Com bot_after e make_bot, quem espera bot_after segundos sem par é pareado
+#   com make_bot() (um oponente do servidor, bots.py).
+# - Com place, quem chega sem ninguém esperando é oferecido a place(conn) antes
+#   de entrar na fila (no servidor, uma sala de vários guessers com lugar, rooms.py).
+# - Com skill (skill.SkillIndex), quem chega pareia com o jogador de rating mais
+#   próximo dentro da janela, e não com o mais antigo; quem espera refaz a
+#   busca pela roda de tempo a cada alargamento da janela.
+
+_REGISTER = 'register'
+_UNREGISTER = 'unregister'
+
+
+# Cliente na fila do lobby
+class _Waiting:
+    __slots__ = ('addr', 'joined_at', 'requeued_at', 'timers')
+
+    def __init__(self, addr, joined_at, requeued_at):
+        self.addr = addr
+        self.joined_at = joined_at
+        self.requeued_at = requeued_at # Fim da rodada anterior de quem volta de uma sessão
+        self.timers = []
+
+    def cancel_timers(self):
+        for timer in self.timers:
+            timers.cancel(timer)
+
+    def observe_pairing(self, now):
+        metrics.PAIR_SECONDS.observe(now - self.joined_at)
+        if self.requeued_at is not None:
+            metrics.REPAIR_SECONDS.observe(now - self.requeued_at)
+
+
+class Lobby:
+    def __init__(self, on_pair, idle_timeout=0, bot_after=0, make_bot=None, place=None, skill=None):
+        self._on_pair = on_pair
+        self._place = place
+        self._skill = skill
+        self._idle_timeout = idle_timeout
+        self._bot_after = bot_after if make_bot else 0
+        self._make_bot = make_bot
+        self._lock = threading.Lock()
+        self._waiting = OrderedDict() # conexão -> _Waiting
+
+        # O selector só é manipulado pela thread observadora; as outras threads
+        # enfileiram as operações e a acordam pelo socketpair.
+        self._selector = selectors.DefaultSelector()
+        self._ops = deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._running = True
+        self._watcher = threading.Thread(target=self._watch, name="lobby-watcher", daemon=True)
+        self._watcher.start()
+
+    def __len__(self):
+        return len(self._waiting)
+
+    # Coloca o cliente no lobby. Se já houver alguém esperando, forma o par e
+    # chama on_pair([mais_antigo, conn]) (com skill, o de rating mais próximo na
+    # janela); caso contrário o cliente vai para place (se aceitar) ou fica na fila.
+    # requeued_at (time.monotonic) marca o fim da rodada de quem volta de uma
+    # sessão, para medir o tempo até o novo par.
+    def join(self, conn, addr=None, requeued_at=None):
+        # Processa o que o cliente já mandou antes de parear: um OP_RESUME de quem
+        # está reconectando leva a conexão de volta à sessão dela (resume.py) e um
+        # OP_WATCH a transforma em espectador (spectators.py)
+        conn.poll()
+        if conn.moved:
+            conn.close()
+            return None
+        pair = None
+        now = time.monotonic()
+        with self._lock:
+            partner = self._pop_partner(conn, self._skill.window if self._skill else 0, now)
+            if partner is not None:
+                pair = [partner, conn]
+                metrics.PAIR_SECONDS.observe(0.0)
+                if requeued_at is not None:
+                    metrics.REPAIR_SECONDS.observe(now - requeued_at)
+            else:
+                if self._place is not None and self._place(conn):
+                    metrics.PAIR_SECONDS.observe(0.0)
+                    if requeued_at is not None:
+                        metrics.REPAIR_SECONDS.observe(now - requeued_at)
+                    return None
+                entry = self._waiting[conn] = _Waiting(addr, now, requeued_at)
+                if self._idle_timeout:
+                    entry.timers.append(timers.schedule(self._idle_timeout, lambda: self._expire(conn)))
+                if self._bot_after:
+                    entry.timers.append(timers.schedule(self._bot_after, lambda: self._pair_with_bot(conn)))
+                if self._skill is not None:
+                    self._skill.add(conn, now)
+                    delay = self._skill.next_widen(0)
+                    if delay:
+                        entry.timers.append(timers.schedule(delay, lambda: self._widen(conn)))
+                self._enqueue_op(_REGISTER, conn)
+
+        if pair:
+            self._on_pair(pair)
+        return pair
+
+    # Retira da fila o parceiro de `conn` (o mais antigo, ou com skill o de
+    # rating mais próximo a até `window` pontos), descartando quem já fechou; None se não houver
+    def _pop_partner(self, conn, window, now):
+        while True:
+            if self._skill is None:
+                if not self._waiting:
+                    return None
+                partner, entry = self._waiting.popitem(last=False)
+            else:
+                partner = self._skill.pop_closest(conn.rating, window, exclude=conn)
+                if partner is None:
+                    return None
+                entry = self._waiting.pop(partner)
+            self._enqueue_op(_UNREGISTER, partner)
+            entry.cancel_timers()
+            if partner.fileno() != -1:
+                entry.observe_pairing(now)
+                if self._skill is not None:
+                    metrics.PAIR_RATING_GAP.observe(abs(partner.rating - conn.rating))
+                return partner
+
+    # A janela de quem espera alargou (chamado pela roda de tempo): busca de
+    # novo um parceiro com a janela nova
+    def _widen(self, conn):
+        pair = None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._waiting.get(conn)
+            if entry is None:
+                return
+            waited = now - entry.joined_at
+            partner = self._pop_partner(conn, self._skill.window_after(waited), now)
+            if partner is not None:
+                del self._waiting[conn]
+                self._skill.remove(conn)
+                self._enqueue_op(_UNREGISTER, conn)
+                entry.cancel_timers()
+                entry.observe_pairing(now)
+                pair = [partner, conn]
+            else:
+                entry.timers = [timer for timer in entry.timers if timer.active]
+                delay = self._skill.next_widen(waited)
+                if delay:
+                    entry.timers.append(timers.schedule(delay, lambda: self._widen(conn)))
+        if pair:
+            self._on_pair(pair)
+
+    # Remove o cliente do lobby (se ainda estiver esperando)
+    def leave(self, conn):
+        entry = self._remove(conn)
+        if entry is None:
+            return False
+        entry.cancel_timers()
+        return True
+
+    def _remove(self, conn):
+        with self._lock:
+            entry = self._waiting.pop(conn, None)
+            if entry is not None:
+                self._enqueue_op(_UNREGISTER, conn)
+                if self._skill is not None:
+                    self._skill.remove(conn)
+        return entry
+
+    # Prazo de espera no lobby vencido (chamado pela roda de tempo)
+    def _expire(self, conn):
+        entry = self._remove(conn)
+        if entry is None:
+            return
+        entry.cancel_timers()
+        metrics.TIMEOUTS.inc()
+        logging.info(f"Cliente {entry.addr} esperou mais de {self._idle_timeout}s no lobby; desconectando.")
+        conn.close()
+
+    # Ninguém apareceu em bot_after segundos: o cliente joga contra um bot
+    def _pair_with_bot(self, conn):
+        entry = self._remove(conn)
+        if entry is None:
+            return
+        entry.cancel_timers()
+        entry.observe_pairing(time.monotonic())
+        logging.info(f"Cliente {entry.addr} esperou {self._bot_after}s no lobby; pareando com um bot.")
+        self._on_pair([conn, self._make_bot()])
+
+    def close(self):
+        self._running = False
+        self._wakeup()
+
+    def _enqueue_op(self, op, conn):
+        self._ops.append((op, conn))
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass # Já existe um byte pendente acordando a thread
+
+    def _apply_ops(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        while self._ops:
+            op, conn = self._ops.popleft()
+            try:
+                if op is _REGISTER:
+                    self._selector.register(conn, selectors.EVENT_READ)
+                else:
+                    self._selector.unregister(conn)
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def _watch(self):
+        while self._running:
+            events = self._selector.select()
+            self._apply_ops()
+            for key, _ in events:
+                if key.fileobj is self._wake_r:
+                    continue
+                self._check_waiting(key.fileobj)
+        self._selector.close()
+
+    # Um cliente na fila ficou legível: fechou a conexão, mandou mensagens de
+    # controle (OP_HELLO, OP_LOGIN, que poll() já trata) ou mandou dados fora de hora
+    def _check_waiting(self, conn):
+        with self._lock:
+            info = self._waiting.get(conn)
+            if info is None:
+                return # Já foi pareado; o unregister está na fila de operações
+
+            closed = not conn.poll()
+            if not closed and not conn.has_pending():
+                return # Só mensagens de controle: continua observando o socket
+            # A conexão sai do selector; uma mensagem de jogo fora de hora fica
+            # na conexão para a sessão tratar.
+            try:
+                self._selector.unregister(conn)
+            except (KeyError, ValueError):
+                pass
+            if not closed:
+                return
+            del self._waiting[conn]
+            if self._skill is not None:
+                self._skill.remove(conn)
+        info.cancel_timers()
+
+        if conn.moved:
+            logging.info(f"Cliente {info.addr} saiu do lobby (retomou uma sessão ou passou a assistir uma partida).")
+        else:
+            logging.info(f"Cliente {info.addr} desconectou enquanto esperava no lobby.")
+        conn.close()
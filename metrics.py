@@ -0,0 +1,223 @@
+import bisect
+import logging
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# Métricas do servidor (contadores, gauges e histogramas) expostas em texto no
+# formato do Prometheus por um endpoint HTTP local em porta separada.
+#
+# As atualizações não usam lock: cada thread escreve no seu próprio shard
+# (threading.local) e só a leitura (/metrics) soma os shards. O shard de uma
+# thread é consolidado quando ela termina (o threading.local dela é liberado),
+# então threads de sessão de vida curta não acumulam memória, com ou sem coleta.
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+class _Sharded:
+    def __init__(self, name, help_text, size):
+        self.name = name
+        self.help = help_text
+        self._size = size
+        self._local = threading.local()
+        self._shards = {} # id(shard) -> shard das threads vivas
+        self._retired = [0] * size # Soma dos shards de threads encerradas
+        self._lock = threading.Lock() # Só para registrar shards e ler
+        with _registry_lock:
+            _registry.append(self)
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = [0] * self._size
+            with self._lock:
+                self._shards[id(shard)] = shard
+            _thread_shards().append((self, shard))
+            return shard
+
+    # A thread do shard terminou: soma o shard nos totais das threads encerradas
+    def _retire(self, shard):
+        with self._lock:
+            del self._shards[id(shard)]
+            self._retired = [a + b for a, b in zip(self._retired, shard)]
+
+    def _totals(self):
+        with self._lock:
+            totals = list(self._retired)
+            for shard in self._shards.values():
+                totals = [a + b for a, b in zip(totals, shard)]
+        return totals
+
+
+# Só existe no threading.local de uma thread: é coletado quando ela termina
+class _Owner:
+    __slots__ = ('__weakref__',)
+
+_threads = threading.local()
+
+# Shards da thread atual [(métrica, shard)], aposentados quando ela termina
+def _thread_shards():
+    try:
+        return _threads.shards
+    except AttributeError:
+        shards = _threads.shards = []
+        _threads.owner = _Owner()
+        weakref.finalize(_threads.owner, _retire_all, shards).atexit = False
+        return shards
+
+def _retire_all(shards):
+    for metric, shard in shards:
+        metric._retire(shard)
+
+
+class Counter(_Sharded):
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text, 1)
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+    def value(self):
+        return self._totals()[0]
+
+    def render(self):
+        return [f"{self.name} {self.value()}"]
+
+
+class Gauge(_Sharded):
+    kind = 'gauge'
+
+    # Com `func`, o valor é lido na hora da coleta (ex.: tamanho do lobby)
+    def __init__(self, name, help_text, func=None):
+        super().__init__(name, help_text, 1)
+        self.func = func
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+    def dec(self, amount=1):
+        self._shard()[0] -= amount
+
+    def value(self):
+        if self.func is not None:
+            return self.func()
+        return self._totals()[0]
+
+    def render(self):
+        return [f"{self.name} {self.value()}"]
+
+
+class Histogram(_Sharded):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets):
+        self.buckets = tuple(sorted(buckets))
+        # Um contador por bucket + o bucket +Inf, a soma e a contagem
+        super().__init__(name, help_text, len(self.buckets) + 3)
+
+    def observe(self, value):
+        shard = self._shard()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+    def render(self):
+        totals = self._totals()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), totals):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {totals[-2]}")
+        lines.append(f"{self.name}_count {totals[-1]}")
+        return lines
+
+
+def render_all():
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 10, 13, 16, 20, 26)
+ROOM_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+RATING_BUCKETS = (0, 25, 50, 100, 200, 400, 800)
+
+CONNECTIONS_ACTIVE = Gauge('hagsman_connections_active', "Conexões de jogadores abertas")
+BOTS_ACTIVE = Gauge('hagsman_bots_active', "Oponentes bot do servidor em jogo")
+CONNECTIONS_TOTAL = Counter('hagsman_connections_total', "Conexões aceitas")
+CONNECTIONS_REJECTED = Counter('hagsman_connections_rejected_total', "Conexões recusadas no accept com OP_BUSY (controle de admissão)")
+LOBBY_DEPTH = Gauge('hagsman_lobby_depth', "Jogadores esperando no lobby", func=lambda: 0)
+SESSIONS_ACTIVE = Gauge('hagsman_sessions_active', "Sessões de jogo em andamento")
+PAIR_SECONDS = Histogram('hagsman_time_to_pair_seconds', "Tempo de espera no lobby até formar par", SECONDS_BUCKETS)
+PAIR_RATING_GAP = Histogram('hagsman_pair_rating_gap', "Diferença de rating entre os jogadores de cada par formado no lobby (--nivel)", RATING_BUCKETS)
+REPAIR_SECONDS = Histogram('hagsman_time_to_repair_seconds', "Tempo entre o fim da rodada (OP_RESTART) e o novo par de quem voltou ao lobby", SECONDS_BUCKETS)
+ROUND_SECONDS = Histogram('hagsman_round_duration_seconds', "Duração das rodadas completas", SECONDS_BUCKETS)
+GUESSES_PER_ROUND = Histogram('hagsman_guesses_per_round', "Palpites válidos por rodada completa", COUNT_BUCKETS)
+ROOM_GUESSERS_PER_ROUND = Histogram('hagsman_room_guessers_per_round', "GUESSERs ao fim de cada rodada completa das salas (--sala)", ROOM_BUCKETS)
+ROUNDS_WON = Counter('hagsman_rounds_won_total', "Rodadas vencidas pelo guesser")
+ROUNDS_LOST = Counter('hagsman_rounds_lost_total', "Rodadas perdidas pelo guesser")
+ROUNDS_ABORTED = Counter('hagsman_rounds_aborted_total', "Rodadas encerradas por erro de conexão ou timeout")
+SPECTATORS = Gauge('hagsman_spectators_active', "Espectadores assistindo partidas")
+SPECTATOR_FRAMES_DROPPED = Counter('hagsman_spectator_frames_dropped_total', "Frames pulados por espectadores atrasados (coalescidos no estado mais recente)")
+RESUMES = Counter('hagsman_resumes_total', "Jogadores que reconectaram e retomaram o lugar na rodada")
+TIMEOUTS = Counter('hagsman_timeouts_total', "Timeouts esperando jogadores")
+PROTOCOL_ERRORS = Counter('hagsman_protocol_errors_total', "Mensagens inválidas ou fora de ordem")
+BYTES_IN = Counter('hagsman_bytes_in_total', "Bytes recebidos dos jogadores")
+BYTES_OUT = Counter('hagsman_bytes_out_total', "Bytes enviados aos jogadores")
+FRAMES_OUT = Counter('hagsman_frames_out_total', "Envios (send) de frames aos jogadores")
+SOCKET_WRITES = Counter('hagsman_socket_writes_total', "Escritas em sockets de jogadores (os envios de um mesmo evento da sessão saem juntos)")
+LEADERBOARD_WRITES = Counter('hagsman_leaderboard_writes_total', "Linhas de jogador gravadas no placar (uma por jogador por lote)")
+JOURNAL_BYTES = Counter('hagsman_journal_bytes_total', "Bytes gravados no diário de frames (--diario)")
+LEADERBOARD_FLUSH_SECONDS = Histogram('hagsman_leaderboard_flush_seconds', "Duração de cada gravação em lote do placar", SECONDS_BUCKETS)
+
+
+# Caminho -> (função que devolve o corpo em bytes, Content-Type)
+_routes = {'/metrics': (lambda: render_all().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8', False)}
+
+# Publica outro recurso no mesmo servidor HTTP (ex.: /leaderboard). Com
+# params=True, render recebe os parâmetros da query string ({nome: valor}),
+# para comandos de administração (ex.: /profile?segundos=30)
+def add_route(path, render, content_type, params=False):
+    _routes[path] = (render, content_type, params)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        route = _routes.get(path)
+        if route is None:
+            self.send_error(404)
+            return
+        render, content_type, params = route
+        body = render({name: values[-1] for name, values in parse_qs(query).items()}) if params else render()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Coletas periódicas não devem poluir o log do jogo
+
+
+# Sobe o endpoint /metrics em uma thread de fundo
+def serve(host, port):
+    httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    logging.info(f"Métricas em http://{host}:{port}/metrics")
+    return httpd
@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Profiler por amostragem para o servidor em produção (/profile?segundos=N na
+# porta de métricas): uma thread de fundo lê a pilha de todas as threads
+# (sys._current_frames) a cada INTERVAL segundos durante N segundos e grava as
+# pilhas em formato "folded" (uma linha "f1;f2;f3 amostras" por pilha), que
+# flamegraph.pl e speedscope leem. Só existe enquanto está medindo: desligado,
+# não custa nada. As threads paradas em recv/accept também aparecem (o tempo é
+# de parede, não de CPU).
+
+INTERVAL = 0.005
+MAX_SECONDS = 300
+
+_lock = threading.Lock()
+_running = None # Caminho do arquivo da medição em andamento
+
+
+# Começa uma medição de `seconds` segundos que grava em `directory`; devolve o
+# caminho do arquivo, ou None se já houver uma medição em andamento
+def start(seconds, directory='.', interval=INTERVAL):
+    global _running
+    seconds = min(max(seconds, interval), MAX_SECONDS)
+    path = os.path.join(directory, f'perfil-{os.getpid()}-{int(time.time())}.txt')
+    with _lock:
+        if _running is not None:
+            return None
+        _running = path
+    threading.Thread(target=_run, args=(seconds, path, interval), name="profiler", daemon=True).start()
+    logging.info(f"Profiler ligado por {seconds:g}s; resultado em {path}.")
+    return path
+
+def running():
+    return _running
+
+def _run(seconds, path, interval):
+    global _running
+    me = threading.get_ident()
+    counts = Counter() # tupla de code objects (da raiz para a folha) -> amostras
+    samples = 0
+    deadline = time.monotonic() + seconds
+    try:
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                stack.reverse()
+                counts[tuple(stack)] += 1
+            samples += 1
+            time.sleep(interval)
+        _write(path, counts)
+        logging.info(f"Profiler: {samples} amostras de {len(counts)} pilhas gravadas em {path}.")
+    except Exception:
+        logging.exception("Erro no profiler")
+    finally:
+        with _lock:
+            _running = None
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _write(path, counts):
+    labels = {}
+    with open(path, 'w') as f:
+        for stack, count in counts.most_common():
+            names = []
+            for code in stack:
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _label(code)
+                names.append(label)
+            f.write(f"{';'.join(names)} {count}\n")
+
+# Rota /profile da porta de métricas: ?segundos=N (padrão 10)
+def render(params, directory='.'):
+    try:
+        seconds = float(params.get('segundos', 10))
+    except ValueError:
+        seconds = 10.0
+    path = start(seconds, directory)
+    if path is None:
+        return json.dumps({'erro': "medição em andamento", 'arquivo': _running}).encode()
+    return json.dumps({'arquivo': path, 'segundos': min(max(seconds, INTERVAL), MAX_SECONDS)}).encode()
@@ -0,0 +1,365 @@
+import logging
+import struct
+import threading
+from typing import NamedTuple
+
+from logconfig import EVENT_FRAME_IN
+
+# Codec do protocolo (ver README): opcodes, mensagens tipadas, codificação e um
+# leitor com buffer por conexão que lê blocos grandes do socket e separa os
+# frames completos com struct/memoryview, em vez de um recv por campo.
+
+# Opcodes
+OP_SETWORD         = 1
+OP_GUESS           = 2
+OP_UPDATE          = 3
+OP_RESTART         = 4
+OP_START           = 5
+OP_GAME_OVER_WIN   = 6
+OP_GAME_OVER_LOSE  = 7
+OP_PLAYER_ROLE     = 8
+OP_GAME_STATE      = 9
+OP_OPPONENT_WON    = 11
+OP_OPPONENT_LOST   = 12
+OP_RESTART_CONFIRM = 13
+OP_WAITING_FOR_PLAYER = 14
+OP_HELLO           = 15
+OP_LOGIN           = 16
+OP_RESUME          = 17
+OP_WATCH           = 18
+OP_BUSY            = 19
+
+# Recursos opcionais negociados com OP_HELLO (bitmask)
+FEATURE_DELTA = 0x01 # OP_UPDATE em vez de OP_GAME_STATE completo a cada palpite
+FEATURE_RESUME = 0x02 # Token de retomada (OP_RESUME) para reconectar na mesma rodada
+
+ROLE_SETTER  = 1
+ROLE_GUESSER = 2
+
+# Motivo do OP_BUSY (conexão recusada no accept, admission.py)
+BUSY_CONNECTIONS = 1 # Limite de conexões abertas
+BUSY_SESSIONS    = 2 # Limite de sessões em andamento
+BUSY_RATE        = 3 # Conexões novas demais do mesmo IP
+
+RECV_CHUNK = 64 * 1024
+READ_CHUNK = 4 * 1024 # Bloco de leitura do FrameReader: o maior frame tem poucas centenas de bytes
+
+MAX_NAME = 32 # Nome de jogador (OP_LOGIN): letras, dígitos, '_' e '-'
+
+FRAME_IN = {'event': EVENT_FRAME_IN}
+
+
+class ProtocolError(ConnectionError):
+    pass
+
+
+# Mensagens tipadas. Campos de texto já chegam decodificados em ASCII.
+class SetWord(NamedTuple):
+    word: str
+
+    def encode(self):
+        data = self.word.encode('ascii')
+        return bytes([OP_SETWORD, len(data)]) + data
+
+class Guess(NamedTuple):
+    letter: str
+
+    def encode(self):
+        return bytes([OP_GUESS]) + self.letter.encode('ascii')
+
+class Update(NamedTuple):
+    letter: str
+    hit: bool
+    positions: tuple
+
+    def encode(self):
+        return bytes([OP_UPDATE, ord(self.letter), 1 if self.hit else 0, len(self.positions)]) + bytes(self.positions)
+
+class Restart(NamedTuple):
+    flag: int
+
+    def encode(self):
+        return bytes([OP_RESTART, self.flag])
+
+class Start(NamedTuple):
+    length: int
+
+    def encode(self):
+        return bytes([OP_START, self.length])
+
+class GameOverWin(NamedTuple):
+    word: str
+
+    def encode(self):
+        return encode_word_frame(OP_GAME_OVER_WIN, self.word)
+
+class GameOverLose(NamedTuple):
+    word: str
+
+    def encode(self):
+        return encode_word_frame(OP_GAME_OVER_LOSE, self.word)
+
+class PlayerRole(NamedTuple):
+    role: int
+
+    def encode(self):
+        return bytes([OP_PLAYER_ROLE, self.role])
+
+class GameState(NamedTuple):
+    display: str
+    wrong: str
+    remaining: int
+    turn: int
+
+    def encode(self):
+        return encode_game_state(self.display, self.wrong, self.remaining, self.turn)
+
+class OpponentWon(NamedTuple):
+    word: str
+
+    def encode(self):
+        return encode_word_frame(OP_OPPONENT_WON, self.word)
+
+class OpponentLost(NamedTuple):
+    word: str
+
+    def encode(self):
+        return encode_word_frame(OP_OPPONENT_LOST, self.word)
+
+class RestartConfirm(NamedTuple):
+    flag: int
+
+    def encode(self):
+        return bytes([OP_RESTART_CONFIRM, self.flag])
+
+class WaitingForPlayer(NamedTuple):
+    status: int
+
+    def encode(self):
+        return bytes([OP_WAITING_FOR_PLAYER, self.status])
+
+class Hello(NamedTuple):
+    features: int
+
+    def encode(self):
+        return bytes([OP_HELLO, self.features])
+
+class Login(NamedTuple):
+    name: str
+
+    def encode(self):
+        return encode_word_frame(OP_LOGIN, self.name)
+
+class Resume(NamedTuple):
+    token: str # Vazio na resposta do servidor = token recusado
+
+    def encode(self):
+        return encode_word_frame(OP_RESUME, self.token)
+
+class Watch(NamedTuple):
+    game: str # Id da partida; vazio no pedido = a mais assistida, na resposta = partida não encontrada
+
+    def encode(self):
+        return encode_word_frame(OP_WATCH, self.game)
+
+class Busy(NamedTuple):
+    reason: int # BUSY_*; o servidor fecha a conexão logo depois
+
+    def encode(self):
+        return bytes([OP_BUSY, self.reason])
+
+
+def valid_name(name: str) -> bool:
+    return 0 < len(name) <= MAX_NAME and name.replace('_', '').replace('-', '').isalnum()
+
+# Frame de opcode + palavra com 1 byte de tamanho (SETWORD, GAME_OVER_*, OPPONENT_*)
+def encode_word_frame(op, word: str) -> bytes:
+    data = word.encode('ascii')
+    return bytes([op, len(data)]) + data
+
+# OP_GAME_STATE: exibição e letras erradas com 1 byte de tamanho, tentativas e vez
+def encode_game_state(display: str, wrong: str, remaining: int, turn: int) -> bytes:
+    display_bytes = display.encode('ascii')
+    wrong_bytes = wrong.encode('ascii')
+    return (bytes([OP_GAME_STATE, len(display_bytes)]) + display_bytes
+            + bytes([len(wrong_bytes)]) + wrong_bytes + bytes([remaining, turn]))
+
+
+_U8x2 = struct.Struct('BB')
+_U8x3 = struct.Struct('BBB')
+
+def _decode_ascii(data) -> str:
+    try:
+        return str(data, 'ascii')
+    except UnicodeDecodeError:
+        raise ProtocolError(f"Texto não-ASCII no frame: {bytes(data)!r}")
+
+# Cada parser recebe o buffer e a posição logo após o opcode e devolve
+# (mensagem, posição final) ou None se o frame ainda não chegou inteiro.
+def _parse_flag(cls):
+    def parse(buf, pos):
+        if len(buf) - pos < 1:
+            return None
+        return cls(buf[pos]), pos + 1
+    return parse
+
+def _parse_word(cls):
+    def parse(buf, pos):
+        if len(buf) - pos < 1:
+            return None
+        end = pos + 1 + buf[pos]
+        if len(buf) < end:
+            return None
+        return cls(_decode_ascii(buf[pos + 1:end])), end
+    return parse
+
+def _parse_guess(buf, pos):
+    if len(buf) - pos < 1:
+        return None
+    return Guess(_decode_ascii(buf[pos:pos + 1])), pos + 1
+
+def _parse_update(buf, pos):
+    if len(buf) - pos < 3:
+        return None
+    letter, hit, count = _U8x3.unpack_from(buf, pos)
+    end = pos + 3 + count
+    if len(buf) < end:
+        return None
+    return Update(chr(letter), hit == 1, tuple(buf[pos + 3:end])), end
+
+def _parse_game_state(buf, pos):
+    size = len(buf)
+    if size - pos < 1:
+        return None
+    wrong_at = pos + 1 + buf[pos]
+    if size - wrong_at < 1:
+        return None
+    tail = wrong_at + 1 + buf[wrong_at]
+    if size - tail < 2:
+        return None
+    remaining, turn = _U8x2.unpack_from(buf, tail)
+    display = _decode_ascii(buf[pos + 1:wrong_at])
+    wrong = _decode_ascii(buf[wrong_at + 1:tail])
+    return GameState(display, wrong, remaining, turn), tail + 2
+
+_PARSERS = {
+    OP_SETWORD: _parse_word(SetWord),
+    OP_GUESS: _parse_guess,
+    OP_UPDATE: _parse_update,
+    OP_RESTART: _parse_flag(Restart),
+    OP_START: _parse_flag(Start),
+    OP_GAME_OVER_WIN: _parse_word(GameOverWin),
+    OP_GAME_OVER_LOSE: _parse_word(GameOverLose),
+    OP_PLAYER_ROLE: _parse_flag(PlayerRole),
+    OP_GAME_STATE: _parse_game_state,
+    OP_OPPONENT_WON: _parse_word(OpponentWon),
+    OP_OPPONENT_LOST: _parse_word(OpponentLost),
+    OP_RESTART_CONFIRM: _parse_flag(RestartConfirm),
+    OP_WAITING_FOR_PLAYER: _parse_flag(WaitingForPlayer),
+    OP_HELLO: _parse_flag(Hello),
+    OP_LOGIN: _parse_word(Login),
+    OP_RESUME: _parse_word(Resume),
+    OP_WATCH: _parse_word(Watch),
+    OP_BUSY: _parse_flag(Busy),
+}
+
+
+# Parser sem I/O: recebe bytes em feed() e devolve mensagens completas em next_message()
+class FrameParser:
+    __slots__ = ('_buf', '_pos')
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def feed(self, data):
+        # Descarta o que já foi consumido antes de crescer o buffer
+        if self._pos:
+            if self._pos == len(self._buf):
+                self._buf.clear()
+            else:
+                del self._buf[:self._pos]
+            self._pos = 0
+        self._buf += data
+
+    def buffered(self):
+        return len(self._buf) - self._pos
+
+    # Retira os bytes ainda não consumidos (ex.: para entregar a conexão a outro processo)
+    def take(self):
+        data = bytes(self._buf[self._pos:])
+        self._buf.clear()
+        self._pos = 0
+        return data
+
+    def next_message(self):
+        buf, pos = self._buf, self._pos
+        if pos >= len(buf):
+            return None
+        op = buf[pos]
+        parser = _PARSERS.get(op)
+        if parser is None:
+            raise ProtocolError(f"Opcode desconhecido: {op}")
+        result = parser(buf, pos + 1)
+        if result is None:
+            return None
+        msg, self._pos = result
+        return msg
+
+
+# Bloco de leitura por thread, e não por conexão: o parser copia os bytes
+# lidos para o buffer da conexão antes da próxima leitura, então uma conexão
+# parada só guarda o que ainda não foi consumido
+_scratch = threading.local()
+
+def _recv_chunk():
+    chunk = getattr(_scratch, 'chunk', None)
+    if chunk is None:
+        chunk = _scratch.chunk = bytearray(READ_CHUNK)
+        _scratch.view = memoryview(chunk)
+    return chunk
+
+
+# Leitor bloqueante com buffer por conexão: uma chamada recv_into por leitura de rede
+class FrameReader:
+    __slots__ = ('sock', 'peer', 'on_bytes', '_parser')
+
+    def __init__(self, sock, peer=None, on_bytes=None):
+        self.sock = sock
+        self.peer = peer
+        self.on_bytes = on_bytes # Chamado com o número de bytes de cada leitura
+        self._parser = FrameParser()
+
+    def buffered(self):
+        return self._parser.buffered()
+
+    def take_buffered(self):
+        return self._parser.take()
+
+    # Alimenta o parser com bytes recebidos por outro leitor
+    def feed(self, data):
+        self._parser.feed(data)
+
+    # Lê do socket uma vez e alimenta o parser; False se a conexão foi fechada
+    def fill(self, flags=0):
+        n = self.sock.recv_into(_recv_chunk(), 0, flags)
+        if n == 0:
+            return False
+        if self.on_bytes is not None:
+            self.on_bytes(n)
+        self._parser.feed(_scratch.view[:n])
+        return True
+
+    # Mensagem completa já no buffer, sem ler do socket (None se não houver)
+    def next_message(self):
+        return self._parser.next_message()
+
+    def read_message(self):
+        msg = self._parser.next_message()
+        while msg is None:
+            if not self.fill():
+                raise ConnectionError("Conexão fechada pelo outro lado")
+            msg = self._parser.next_message()
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f"Recebido {msg!r} de {self.peer}", extra=FRAME_IN)
+        return msg
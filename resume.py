@@ -0,0 +1,148 @@
+import logging
+import secrets
+import threading
+
+import metrics
+from protocol import FEATURE_RESUME, ROLE_GUESSER, ROLE_SETTER, PlayerRole, Resume, Start
+
+# Retomada de sessão. Cada jogador que negociou FEATURE_RESUME recebe, no início
+# da sessão, um token (OP_RESUME). Se a conexão cair durante uma rodada, a thread
+# da sessão espera até GRACE segundos: um cliente que reconecta e manda
+# OP_RESUME com o token volta ao mesmo lugar, na mesma rodada.
+#
+# O lugar é a própria Connection da sessão: claim() entrega a ela o socket e o
+# leitor da conexão nova, então play_round / handle_game_session continuam
+# usando o mesmo objeto (e as mesmas chaves em players_data). O socket antigo
+# leva shutdown, o que acorda uma leitura bloqueada nele; antes do próximo
+# envio ou leitura a thread da sessão troca os sockets, reenvia o estado da
+# rodada (Snapshot) e segue.
+#
+# Com --workers o token começa com o índice do worker que roda a sessão; o
+# broker, que lê o OP_RESUME no lobby, encaminha a conexão para esse worker.
+
+GRACE = 0 # Segundos de espera por uma reconexão (0 = desligado); server.py --prazo-retomada
+
+
+# Estado mínimo para recolocar um jogador na rodada: o papel e o jogo em curso
+# (None enquanto o SETTER não escolheu a palavra). Os frames são gerados na hora
+# do reenvio a partir do WordGame, que já guarda o OP_GAME_STATE codificado.
+class Snapshot:
+    __slots__ = ('role', 'game')
+
+    def __init__(self, role, game=None):
+        self.role = role
+        self.game = game
+
+    def frames(self):
+        if self.game is None:
+            return [PlayerRole(self.role).encode()] # O cliente volta a pedir a palavra / a esperar por ela
+        guesser_frame, setter_frame = self.game.state_frames(True)
+        if self.role == ROLE_SETTER:
+            return [setter_frame] # Reenviar o papel faria o cliente pedir outra palavra
+        return [PlayerRole(ROLE_GUESSER).encode(), Start(len(self.game.word)).encode(), guesser_frame]
+
+
+class SeatRegistry:
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.forward = None # forward(token, conn) -> bool para tokens de outro processo
+        self._lock = threading.Condition()
+        self._seats = {} # token -> Connection
+
+    # Dá um token à conexão (se ela negociou a retomada) e o envia ao cliente
+    def issue(self, conn):
+        if not GRACE or not conn.supports(FEATURE_RESUME) or conn.resume_token is not None:
+            return None
+        token = self.prefix + secrets.token_hex(8)
+        with self._lock:
+            self._seats[token] = conn
+        conn.resume_token = token
+        conn.send(Resume(token).encode())
+        return token
+
+    def release(self, conn):
+        conn.in_session = False
+        token = conn.resume_token
+        if token is None:
+            return
+        conn.resume_token = None
+        with self._lock:
+            if self._seats.get(token) is conn:
+                del self._seats[token]
+
+    # Início e fim da janela em que o lugar pode ser retomado (a rodada)
+    def open_seat(self, conn, snapshot):
+        with self._lock:
+            conn.snapshot = snapshot
+
+    def close_seat(self, conn):
+        with self._lock:
+            conn.snapshot = None
+
+    # Thread da sessão, com a conexão do lugar caída: espera até GRACE segundos
+    # que o jogador reconecte. True se o lugar foi retomado.
+    def wait(self, conn):
+        if conn.resume_token is None or conn.snapshot is None:
+            return False
+        logging.info(f"Conexão de {conn.addr} caiu durante a rodada; aguardando reconexão por até {GRACE}s.")
+        with self._lock:
+            resumed = self._lock.wait_for(lambda: conn._incoming is not None, GRACE)
+        if resumed:
+            return True
+        logging.info(f"Jogador de {conn.addr} não reconectou a tempo.")
+        return False
+
+    # Conexão nova entregue por claim() e ainda não assumida pelo lugar (ou None)
+    def take(self, conn):
+        with self._lock:
+            incoming, conn._incoming = conn._incoming, None
+        return incoming
+
+    # A conexão nova `conn` apresentou `token`: assume o lugar se ele existir e
+    # estiver em uma rodada. Responde OP_RESUME com o token se deu certo e vazio
+    # se não (o cliente segue como jogador novo, no lobby).
+    def claim(self, token, conn):
+        with self._lock:
+            seat = self._seats.get(token)
+            if seat is not None and seat.snapshot is not None and not seat.is_closed():
+                seat.adopt(conn)
+                self._lock.notify_all()
+                claimed = True
+            else:
+                claimed = False
+        if claimed:
+            metrics.RESUMES.inc()
+            logging.info(f"Jogador retomou o lugar na rodada a partir de {conn.addr}.")
+            return True
+        if self.forward is not None and self.forward(token, conn):
+            return True
+        logging.info(f"Token de retomada inválido ou expirado de {conn.addr}; seguindo como jogador novo.")
+        conn.send(Resume('').encode())
+        return False
+
+
+_registry = SeatRegistry()
+
+def registry():
+    return _registry
+
+def issue(conn):
+    return _registry.issue(conn)
+
+def release(conn):
+    _registry.release(conn)
+
+def open_seat(conn, snapshot):
+    _registry.open_seat(conn, snapshot)
+
+def close_seat(conn):
+    _registry.close_seat(conn)
+
+def claim(token, conn):
+    return _registry.claim(token, conn)
+
+def wait(conn):
+    return _registry.wait(conn)
+
+def take(conn):
+    return _registry.take(conn)
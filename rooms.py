@@ -0,0 +1,90 @@
+import socket
+import threading
+from collections import OrderedDict, deque
+
+# Salas de vários GUESSERs (server.py --sala N): um SETTER contra até N
+# guessers na mesma palavra, todos atendidos pela thread da sessão.
+# - A sala nasce de um par formado no lobby. Quem chega ao lobby sem ninguém
+#   esperando entra na sala aberta mais antiga que tiver lugar (place), inclusive
+#   no meio de uma rodada; só quando todas estão cheias o cliente vai para a fila.
+# - place() só anexa a conexão à fila de entrada da sala e acorda a thread da
+#   sessão pelo socketpair (wake_r), que está no mesmo selector dos palpites.
+# - Os lugares livres são contados aqui, sob um lock: a sala sai do índice de
+#   salas abertas quando enche e volta quando alguém sai.
+
+
+class Room:
+    __slots__ = ('capacity', 'seats', 'closed', 'wake_r', '_wake_w', '_joining')
+
+    def __init__(self, capacity, members):
+        self.capacity = capacity # Jogadores na sala, contando o SETTER
+        self.seats = capacity - members
+        self.closed = False
+        self._joining = deque() # Conexões colocadas pelo lobby, ainda não assumidas pela sessão
+        self.wake_r, self._wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+    # Thread da sessão: conexões que entraram desde a última chamada
+    def take_joining(self):
+        try:
+            while self.wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        with _lock:
+            joining = list(self._joining)
+            self._joining.clear()
+        return joining
+
+    # `count` jogadores saíram da sala: os lugares voltam para o lobby
+    def free(self, count=1):
+        if not count:
+            return
+        with _lock:
+            if self.closed:
+                return
+            self.seats += count
+            _open[self] = None
+
+    # Fecha a sala para novas entradas; devolve quem foi colocado nela e não
+    # chegou a entrar (volta para o lobby)
+    def close(self):
+        with _lock:
+            self.closed = True
+            _open.pop(self, None)
+            joining = list(self._joining)
+            self._joining.clear()
+        self.wake_r.close()
+        self._wake_w.close()
+        return joining
+
+    def _wakeup(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass # Já existe um byte pendente acordando a thread
+
+
+_lock = threading.Lock()
+_open = OrderedDict() # Salas com lugar, da mais antiga para a mais nova (valores não usados)
+
+def open_room(capacity, members=2):
+    room = Room(capacity, members)
+    if room.seats > 0:
+        with _lock:
+            _open[room] = None
+    return room
+
+# Coloca a conexão na sala aberta mais antiga; False se todas estão cheias
+def place(conn):
+    with _lock:
+        if not _open:
+            return False
+        room = next(iter(_open))
+        room.seats -= 1
+        if room.seats <= 0:
+            del _open[room]
+        room._joining.append(conn)
+    room._wakeup()
+    return True
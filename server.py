@@ -1,347 +1,833 @@
+import argparse
+import atexit
+import itertools
+import os
 import socket
+import sys
 import threading
-import time
 import logging
 import random
+import selectors
+import signal
+import time
 
-# Configuração do logger
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='[%(asctime)s] %(levelname)s %(message)s',
-    datefmt='%H:%M:%S'
+import admission
+import journal
+import logconfig
+import metrics
+import profiler
+import resume
+import rooms
+import skill
+import spectators
+import tracing
+import wordlist
+from bot_client import WORDS
+from bots import ServerBot
+from connection import Connection
+from engine import MAX_ERRORS, WordGame
+from leaderboard import Leaderboard
+from matchmaking import Lobby
+from solver import Solver
+from protocol import (
+    OP_RESTART, OP_START, OP_GAME_OVER_WIN, OP_GAME_OVER_LOSE, OP_PLAYER_ROLE,
+    OP_OPPONENT_WON, OP_OPPONENT_LOST, OP_RESTART_CONFIRM, OP_WAITING_FOR_PLAYER,
+    FEATURE_DELTA, ROLE_SETTER, ROLE_GUESSER, ProtocolError, SetWord, Guess, Restart, Update,
+    encode_word_frame,
 )
 
 HOST = '0.0.0.0'
 PORT = 12345
 
-# Opcodes
-OP_SETWORD         = 1
-OP_GUESS           = 2
-OP_UPDATE          = 3
-OP_RESTART         = 4
-OP_START           = 5
-OP_GAME_OVER_WIN   = 6
-OP_GAME_OVER_LOSE  = 7
-OP_PLAYER_ROLE     = 8
-OP_GAME_STATE      = 9
-OP_OPPONENT_WON    = 11
-OP_OPPONENT_LOST   = 12
-OP_RESTART_CONFIRM = 13
-OP_WAITING_FOR_PLAYER = 14
-
-MAX_ERRORS = 6
-TIMEOUT    = 60
-
-# Envia dados para o socket lidando com possíveis erros de conexão
-def sendall_safe(sock, data: bytes):
-    try:
-        if sock.fileno() == -1: # Verifica se o socket ainda está aberto
-            logging.warning(f"Tentativa de enviar para socket fechado: {sock.getpeername()}")
-            return False
-        sock.sendall(data)
-        logging.debug(f"Enviado {data!r} para {sock.getpeername()}")
-        return True
-    except Exception as e:
-        logging.warning(f"Falha ao enviar para {sock.getpeername()}: {e}")
-        return False
-
-# Recebe exatamente n bytes do socket
-def recv_exact(sock, n: int) -> bytes:
-    buf = b''
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
-            raise ConnectionError("Conexão fechada pelo cliente")
-        buf += chunk
-    logging.debug(f"Recebido {buf!r} de {sock.getpeername()}")
-    return buf
-
-# Envia dados do estado do jogo para ambos os jogadores
-def send_game_state(guesser_sock, setter_sock, current_word_display, wrong_guesses_set, remaining_attempts, is_guesser_turn):
-    word_display_str = "".join(current_word_display)
-    wrong_guesses_str = "".join(sorted(list(wrong_guesses_set)))
-
-    base_data = bytes([OP_GAME_STATE])
-    base_data += bytes([len(word_display_str)]) + word_display_str.encode('ascii')
-    base_data += bytes([len(wrong_guesses_str)]) + wrong_guesses_str.encode('ascii')
-    base_data += bytes([remaining_attempts])
-
-    guesser_data = base_data + bytes([1 if is_guesser_turn else 0])
-    sendall_safe(guesser_sock, guesser_data)
-
-    setter_data = base_data + bytes([0]) # Sempre 0 para o Setter, pois ele não chuta
-    sendall_safe(setter_sock, setter_data)
-
-
-def play_round(setter_sock, guesser_sock, players_data):
+TIMEOUT = 60
+BACKLOG = 128 # Fila do listen (--backlog)
+
+# Prazos em segundos de cada espera, configuráveis pela linha de comando
+SETWORD_TIMEOUT = TIMEOUT    # SETTER escolher a palavra
+GUESS_TIMEOUT = TIMEOUT      # GUESSER mandar cada palpite
+RESTART_TIMEOUT = TIMEOUT    # decisão de jogar de novo
+LOBBY_IDLE_TIMEOUT = 0       # espera máxima no lobby (0 = sem limite)
+RESUME_GRACE = 20            # reconexão de quem caiu no meio da rodada (resume.py; 0 = desligado)
+
+# Pilha de cada thread (uma por sessão): o padrão do sistema reserva 8 MiB de
+# memória virtual por thread, e as sessões nunca descem fundo na pilha
+THREAD_STACK_SIZE = 512 * 1024
+
+# Frames de cada evento da sessão saem em uma escrita por conexão (Connection.cork);
+# --envio-imediato volta a uma escrita por frame, para comparação
+COALESCE = True
+
+# Oponente bot (bots.py) para quem espera sozinho no lobby
+BOT_AFTER = 0                # segundos de espera até entrar um bot (0 = desligado)
+bot_role = ROLE_SETTER       # papel do bot (None = os dois, modo de um jogador só)
+bot_words = None             # wordlist.WordList usada pelo SETTER bot
+bot_level = None             # dificuldade das palavras do bot (None = qualquer)
+bot_solver = None            # solver.Solver usado pelo GUESSER bot
+BOT_ROLES = {'setter': ROLE_SETTER, 'guesser': ROLE_GUESSER, 'ambos': None}
+
+leaderboard = None           # leaderboard.Leaderboard (--placar); None = sem placar persistente
+
+# Salas de vários guessers (rooms.py): um SETTER contra até ROOM_GUESSERS
+# guessers na mesma palavra (0 = sessões de dois jogadores)
+ROOM_GUESSERS = 0
+
+# Pareamento por nível (skill.py): distância de rating aceita por quem acaba de
+# chegar ao lobby (0 = fila FIFO, sem rating), quanto ela cresce por segundo de
+# espera e a espera a partir da qual qualquer rating serve
+SKILL_WINDOW = 0
+SKILL_WIDEN = 100.0
+SKILL_MAX_WAIT = 10.0
+
+# Número e pontos de um jogador dentro da sessão (players_data: conexão -> Player)
+class Player:
+    __slots__ = ('id', 'score')
+
+    def __init__(self, id):
+        self.id = id
+        self.score = 0
+
+# Envia o estado completo do jogo para os guessers e o setter (codificado uma
+# vez); os espectadores recebem o mesmo frame do setter
+def send_game_state(guessers, setter, game, is_guesser_turn, room):
+    guesser_frame, setter_frame = game.state_frames(is_guesser_turn)
+    for guesser in guessers:
+        guesser.send(guesser_frame)
+    setter.send(setter_frame)
+    room.publish(setter_frame)
+
+# Envia o resultado de um palpite: OP_UPDATE para quem negociou o delta,
+# OP_GAME_STATE completo para os clientes antigos e para os espectadores (que
+# podem pular frames, então nunca recebem delta). Cada frame é codificado uma
+# vez para todos os destinatários.
+def send_guess_result(guessers, setter, game, ch, hit, positions, room):
+    update_frame = None
+    guesser_frame, setter_frame = game.state_frames(True)
+    for conn in itertools.chain(guessers, (setter,)):
+        if conn.supports(FEATURE_DELTA):
+            if update_frame is None:
+                update_frame = Update(ch, hit, positions).encode()
+            conn.send(update_frame)
+        else:
+            conn.send(setter_frame if conn is setter else guesser_frame)
+    room.publish(setter_frame)
+
+# Resultados de vários palpites de uma vez (uma passada do selector em uma
+# sala): os OP_UPDATE, já codificados, vão juntos em um só buffer para quem
+# negociou o delta, e os clientes antigos e os espectadores recebem só o estado
+# completo final, que já inclui todos. O custo é O(palpites + jogadores) por
+# passada, e não O(palpites * jogadores).
+def send_guess_updates(guessers, setter, game, updates, room):
+    update_data = updates[0] if len(updates) == 1 else b''.join(updates)
+    guesser_frame, setter_frame = game.state_frames(True)
+    for conn in itertools.chain(guessers, (setter,)):
+        if conn.supports(FEATURE_DELTA):
+            conn.send(update_data)
+        else:
+            conn.send(setter_frame if conn is setter else guesser_frame)
+    room.publish(setter_frame)
+
+# Fim da rodada: o resultado do setter (OP_OPPONENT_*) vai também aos espectadores
+def send_game_over(guessers, setter, game, room):
+    if game.won:
+        guesser_op, setter_op = OP_GAME_OVER_WIN, OP_OPPONENT_WON
+    else:
+        guesser_op, setter_op = OP_GAME_OVER_LOSE, OP_OPPONENT_LOST
+    guesser_frame = encode_word_frame(guesser_op, game.word)
+    setter_frame = encode_word_frame(setter_op, game.word)
+    for guesser in guessers:
+        guesser.send(guesser_frame)
+    setter.send(setter_frame)
+    room.publish(setter_frame)
+
+
+# Registra uma rodada completa no placar persistente: um ponto para cada GUESSER
+# se a palavra foi descoberta, uma rodada jogada para todos. Só pontua quem
+# mandou OP_LOGIN; bots não têm nome. record() só enfileira, a gravação é da
+# thread do placar. Com --nivel, atualiza também o rating de pareamento.
+def record_round(setter, guessers, won):
+    if SKILL_WINDOW:
+        skill.update(setter, guessers, won)
+    if leaderboard is None:
+        return
+    for guesser in guessers:
+        if guesser.name:
+            leaderboard.record(guesser.name, 1 if won else 0)
+    if setter.name:
+        leaderboard.record(setter.name, 0)
+
+# Espera a palavra do SETTER; uma palavra inválida faz o pedido de novo
+def read_word(setter, players_data):
+    logging.debug("Esperando OP_SETWORD do SETTER.")
+    while True:
+        msg = setter.read_message(SETWORD_TIMEOUT)
+
+        if not isinstance(msg, SetWord):
+            logging.warning(f"Mensagem inesperada ({msg!r}) do SETTER, esperando OP_SETWORD.")
+            raise ProtocolError("Protocolo inesperado do SETTER")
+
+        word = msg.word.lower()
+        if word.isalpha() and len(word) > 0: # Garante que a palavra não é vazia
+            logging.debug("Player%s escolheu: '%s'", players_data[setter].id, word)
+            return word
+        logging.warning(f"Palavra inválida recebida: '{word}'. Pedindo novamente.")
+        setter.send(bytes([OP_PLAYER_ROLE, ROLE_SETTER])) # Pede para o setter de novo (induz novo input no cliente)
+
+def play_round(setter, guesser, players_data, room):
+    round_started = time.monotonic()
+    setter_seat, guesser_seat = resume.Snapshot(ROLE_SETTER), resume.Snapshot(ROLE_GUESSER)
+    trace = tracing.start_round(room.id)
+    outcome = 'abortada'
     try:
         # Atribuição de papéis (enviada novamente em cada rodada para reiniciar estado do cliente)
-        sendall_safe(setter_sock, bytes([OP_PLAYER_ROLE, 1])) # 1 para SETTER
-        sendall_safe(guesser_sock, bytes([OP_PLAYER_ROLE, 2])) # 2 para GUESSER
-        logging.debug(f"Player {players_data[setter_sock]['id']} é o SETTER. Player {players_data[guesser_sock]['id']} é o GUESSER.")
+        setter.send(bytes([OP_PLAYER_ROLE, ROLE_SETTER]))
+        guesser.send(bytes([OP_PLAYER_ROLE, ROLE_GUESSER]))
+        # Daqui até o fim da rodada, quem cair pode reconectar e retomar o lugar
+        resume.open_seat(setter, setter_seat)
+        resume.open_seat(guesser, guesser_seat)
+        logging.debug("Player %s é o SETTER. Player %s é o GUESSER.", players_data[setter].id, players_data[guesser].id)
 
         # 1) SETTER escolhe a palavra
-        logging.debug("Esperando OP_SETWORD do SETTER.")
-        word = ""
-        while not word:
-            setter_sock.settimeout(TIMEOUT)
-            op_byte_word = recv_exact(setter_sock, 1)[0]
-
-            if op_byte_word == OP_SETWORD:
-                word_len_byte = recv_exact(setter_sock, 1)[0]
-                word_bytes = recv_exact(setter_sock, word_len_byte)
-                word = word_bytes.decode('ascii').lower()
-
-                if word.isalpha() and len(word) > 0: # Garante que a palavra não é vazia
-                    logging.debug(f"Player{players_data[setter_sock]['id']} escolheu: '{word}'")
-                    break
-                else:
-                    logging.warning(f"Palavra inválida recebida: '{word}'. Pedindo novamente.")
-                    sendall_safe(setter_sock, bytes([OP_PLAYER_ROLE, 1])) # Pede para o setter de novo (induz novo input no cliente)
-                    word = "" # Resetar para continuar o loop
-            else:
-                logging.warning(f"Opcode inesperado ({op_byte_word}) do SETTER, esperando OP_SETWORD.")
-                raise ConnectionError("Protocolo inesperado do SETTER")
-        setter_sock.settimeout(None)
+        word = read_word(setter, players_data)
+        if trace:
+            trace.phase('palavra')
 
-        word_len = len(word)
-        hidden_word_list = ['_' if c.isalpha() else c for c in word]
-        guessed_letters_set = set()
-        wrong_guesses_set = set()
-        errors = 0
+        game = WordGame(word, MAX_ERRORS)
+        setter_seat.game = guesser_seat.game = game
 
-        sendall_safe(guesser_sock, bytes([OP_START, word_len]))
-        logging.debug(f">> OP_START enviado ao guesser com length={word_len}")
+        # Processa um OP_HELLO que o guesser já tenha mandado, para que o delta valha desde o primeiro palpite
+        guesser.poll()
 
-        send_game_state(guesser_sock, setter_sock, hidden_word_list, wrong_guesses_set, MAX_ERRORS - errors, True)
+        guesser.send(bytes([OP_START, len(word)]))
+        logging.debug(">> OP_START enviado ao guesser com length=%s", len(word))
 
-        while '_' in hidden_word_list and errors < MAX_ERRORS:
-            logging.debug(f"Aguardando OP_GUESS do GUESSER ({players_data[guesser_sock]['id']}).")
+        send_game_state((guesser,), setter, game, True, room)
 
-            guesser_sock.settimeout(TIMEOUT)
-            hdr = recv_exact(guesser_sock, 2)
-            guesser_sock.settimeout(None)
+        while not game.over:
+            if trace:
+                trace.phase('processamento')
+            logging.debug("Aguardando OP_GUESS do GUESSER (%s).", players_data[guesser].id)
 
-            op, letter_byte = hdr[0], hdr[1:2]
+            msg = guesser.read_message(GUESS_TIMEOUT)
+            if trace:
+                trace.phase('palpite')
 
-            if op != OP_GUESS:
-                logging.warning(f"Operação inesperada {op} do GUESSER, esperando OP_GUESS.")
-                raise ConnectionError("Protocolo inesperado do GUESSER durante palpite")
+            if not isinstance(msg, Guess):
+                logging.warning(f"Mensagem inesperada {msg!r} do GUESSER, esperando OP_GUESS.")
+                raise ProtocolError("Protocolo inesperado do GUESSER durante palpite")
 
-            ch = letter_byte.decode('ascii').lower()
-            logging.debug(f"Palpite '{ch}' recebido do GUESSER.")
+            ch = msg.letter.lower()
+            logging.debug("Palpite '%s' recebido do GUESSER.", ch)
 
-            if not ch.isalpha() or len(ch) != 1 or ch in guessed_letters_set:
+            result = game.guess(ch)
+            if result is None:
                 logging.debug("Letra inválida, não é letra, ou repetida; ignorando.")
-                send_game_state(guesser_sock, setter_sock, hidden_word_list, wrong_guesses_set, MAX_ERRORS - errors, True)
+                send_game_state((guesser,), setter, game, True, room)
                 continue
 
-            guessed_letters_set.add(ch)
-
-            if ch in word:
-                positions = [i for i, c in enumerate(word) if c == ch]
-                for i in positions:
-                    hidden_word_list[i] = ch
-                logging.debug(f"Acerto da letra '{ch}' em posições {positions}")
+            hit, positions = result
+            if hit:
+                logging.debug("Acerto da letra '%s' em posições %s", ch, positions)
             else:
-                errors += 1
-                wrong_guesses_set.add(ch)
-                logging.debug(f"Erro #{errors} com a letra '{ch}'")
+                logging.debug("Erro #%d com a letra '%s'", game.errors, ch)
 
             # Verifica condição de fim de jogo antes de pedir próximo input
-            won = "_" not in hidden_word_list
-            if won:
-                logging.info(f"GUESSER ({players_data[guesser_sock]['id']}) VENCEU o turno! Palavra: {word}")
-                sendall_safe(guesser_sock, bytes([OP_GAME_OVER_WIN, len(word)]) + word.encode('ascii'))
-                sendall_safe(setter_sock, bytes([OP_OPPONENT_WON, len(word)]) + word.encode('ascii'))
-                players_data[guesser_sock]['score'] += 1
-                break
-            elif errors >= MAX_ERRORS:
-                logging.info(f"GUESSER ({players_data[guesser_sock]['id']}) PERDEU o turno! Max erros atingido. Palavra: {word}")
-                sendall_safe(guesser_sock, bytes([OP_GAME_OVER_LOSE, len(word)]) + word.encode('ascii'))
-                sendall_safe(setter_sock, bytes([OP_OPPONENT_LOST, len(word)]) + word.encode('ascii'))
-                break
+            if game.won:
+                logging.info(f"GUESSER ({players_data[guesser].id}) VENCEU o turno! Palavra: {word}")
+                send_game_over((guesser,), setter, game, room)
+                players_data[guesser].score += 1
+                metrics.ROUNDS_WON.inc()
+            elif game.lost:
+                logging.info(f"GUESSER ({players_data[guesser].id}) PERDEU o turno! Max erros atingido. Palavra: {word}")
+                send_game_over((guesser,), setter, game, room)
+                metrics.ROUNDS_LOST.inc()
             else:
-                send_game_state(guesser_sock, setter_sock, hidden_word_list, wrong_guesses_set, MAX_ERRORS - errors, True)
-
+                send_guess_result((guesser,), setter, game, ch, hit, positions, room)
+
+        if trace:
+            trace.phase('processamento')
+        outcome = 'vitoria' if game.won else 'derrota'
+        metrics.ROUND_SECONDS.observe(time.monotonic() - round_started)
+        metrics.GUESSES_PER_ROUND.observe(game.guessed.bit_count())
+        record_round(setter, (guesser,), game.won)
         return True
 
     except (ConnectionError, socket.timeout) as e:
-        logging.error(f"Erro de conexão/timeout durante a rodada: {e}. Player {players_data.get(guesser_sock, {}).get('id', 'N/A')} ou {players_data.get(setter_sock, {}).get('id', 'N/A')} desconectou/travou.")
+        metrics.ROUNDS_ABORTED.inc()
+        if isinstance(e, socket.timeout):
+            metrics.TIMEOUTS.inc()
+        elif isinstance(e, ProtocolError):
+            metrics.PROTOCOL_ERRORS.inc()
+        logging.error(f"Erro de conexão/timeout durante a rodada: {e}. Player {getattr(players_data.get(guesser), 'id', 'N/A')} ou {getattr(players_data.get(setter), 'id', 'N/A')} desconectou/travou.")
         return False
     except Exception as e:
+        metrics.ROUNDS_ABORTED.inc()
         logging.exception(f"Erro inesperado durante a rodada: {e}.")
         return False
+    finally:
+        if trace:
+            tracing.finish_round(trace, outcome)
+        resume.close_seat(setter)
+        resume.close_seat(guesser)
 
-def handle_game_session(client_sockets):
-    p1_sock, p2_sock = client_sockets
-    players_data = {
-        p1_sock: {"id": 1, "score": 0},
-        p2_sock: {"id": 2, "score": 0}
-    }
+def handle_game_session(clients, room):
+    p1, p2 = clients
+    players_data = {p1: Player(1), p2: Player(2)}
 
-    current_players = [p1_sock, p2_sock] # Cópia mutável para alternar papéis
+    current_players = [p1, p2] # Cópia mutável para alternar papéis
 
     while True:
 
         if random.random() < 0.5: # Alterna aleatoriamente para cada nova rodada
-            setter_sock, guesser_sock = current_players[0], current_players[1]
+            setter, guesser = current_players[0], current_players[1]
         else:
-            setter_sock, guesser_sock = current_players[1], current_players[0]
+            setter, guesser = current_players[1], current_players[0]
+        if setter.bot_role == ROLE_GUESSER or guesser.bot_role == ROLE_SETTER:
+            setter, guesser = guesser, setter # Um bot só joga o papel que conhece
 
-        logging.info(f"Iniciando rodada: Player {players_data[setter_sock]['id']} (SETTER), Player {players_data[guesser_sock]['id']} (GUESSER).")
+        logging.info(f"Iniciando rodada: Player {players_data[setter].id} (SETTER), Player {players_data[guesser].id} (GUESSER).")
 
-        round_ok = play_round(setter_sock, guesser_sock, players_data)
+        round_ok = play_round(setter, guesser, players_data, room)
 
         if not round_ok:
-            logging.info("Rodada encerrada devido a erro. Retornando sockets restantes para o lobby.")
-            for sock in client_sockets:
-                if sock.fileno() != -1:
-                    try:
-                        sock.close()
-                    except:
-                        pass
-            return []
+            if any(conn.moved for conn in clients):
+                # Um jogador desta sessão retomou o lugar em outra: o parceiro não
+                # teve culpa e volta ao lobby
+                partners = [conn for conn in clients if not conn.moved and not conn.is_closed()]
+                logging.info("Jogador voltou à sessão anterior; parceiro volta ao lobby.")
+                return partners, None
+            logging.info("Rodada encerrada devido a erro. Encerrando conexões da sessão.")
+            for conn in clients:
+                conn.close()
+            return [], None
 
         logging.info(">> Enviando OP_RESTART a ambos para decisão de nova partida.")
+        for conn in clients:
+            conn.send(bytes([OP_RESTART, 1]))
+        round_ended = time.monotonic()
 
-        restart_decisions = {}
-        for sock in client_sockets:
-            sendall_safe(sock, bytes([OP_RESTART, 1]))
-
-        for sock in client_sockets:
-            try:
-                sock.settimeout(TIMEOUT)
-                hdr = recv_exact(sock, 2)
-                sock.settimeout(None)
-                op_restart_resp, flag = hdr[0], hdr[1]
-                if op_restart_resp == OP_RESTART:
-                    restart_decisions[sock] = (flag == 1)
-                    logging.info(f"Player{players_data[sock]['id']} escolheu {'continuar' if flag else 'sair'}")
-                else:
-                    logging.warning(f"Opcode inesperado {op_restart_resp} durante RESTART de Player{players_data[sock]['id']}. Assumindo 'sair'.")
-                    restart_decisions[sock] = False
-            except (ConnectionError, socket.timeout):
-                logging.warning(f"Conexão do Player{players_data[sock]['id']} caiu ou não respondeu durante RESTART. Assumindo 'sair'.")
-                restart_decisions[sock] = False
-            except Exception as e:
-                logging.exception(f"Erro inesperado ao receber RESTART de Player{players_data[sock]['id']}: {e}. Assumindo 'sair'.")
-                restart_decisions[sock] = False
-
-        p1_restart = restart_decisions.get(client_sockets[0], False)
-        p2_restart = restart_decisions.get(client_sockets[1], False)
-
-        sockets_to_return = []
-
-        if p1_restart and p2_restart:
-            logging.info("Ambos os jogadores querem reiniciar. Enviando confirmação.")
-            sendall_safe(client_sockets[0], bytes([OP_RESTART_CONFIRM, 1]))
-            sendall_safe(client_sockets[1], bytes([OP_RESTART_CONFIRM, 1]))
-            sockets_to_return.extend(client_sockets) # Ambos voltam para uma nova rodada
-        else:
-            if p1_restart: # p1 quer continuar, p2 não
-                logging.info(f"Player{players_data[client_sockets[0]]['id']} quer continuar, Player{players_data[client_sockets[1]]['id']} não. Adicionando P1 ao lobby.")
-                sendall_safe(client_sockets[0], bytes([OP_RESTART_CONFIRM, 1])) # Confirma que P1 vai para o lobby
-                sendall_safe(client_sockets[1], bytes([OP_RESTART_CONFIRM, 0])) # Informa P2 que vai encerrar
-                try: client_sockets[1].close() # Fecha o socket do P2
-                except: pass
-                sockets_to_return.append(client_sockets[0]) # Apenas P1 volta
-            elif p2_restart: # p2 quer continuar, p1 não
-                logging.info(f"Player{players_data[client_sockets[1]]['id']} quer continuar, Player{players_data[client_sockets[0]]['id']} não. Adicionando P2 ao lobby.")
-                sendall_safe(client_sockets[1], bytes([OP_RESTART_CONFIRM, 1])) # Confirma que P2 vai para o lobby
-                sendall_safe(client_sockets[0], bytes([OP_RESTART_CONFIRM, 0])) # Informa P1 que vai encerrar
-                try: client_sockets[0].close() # Fecha o socket do P1
-                except: pass
-                sockets_to_return.append(client_sockets[1]) # Apenas P2 volta
-            else: # Ambos não querem reiniciar
-                logging.info("Ambos os jogadores não querem reiniciar. Encerrando conexões.")
-                sendall_safe(client_sockets[0], bytes([OP_RESTART_CONFIRM, 0]))
-                sendall_safe(client_sockets[1], bytes([OP_RESTART_CONFIRM, 0]))
-                try: client_sockets[0].close()
-                except: pass
-                try: client_sockets[1].close()
-                except: pass
-
-            # Se um ou ambos não quiserem, a sessão atual termina.
-            return sockets_to_return
-
-def handle_client_thread(client_sock, client_addr):
-    global waiting_clients
-    global waiting_clients_lock
-
-    logging.info(f"Cliente {client_addr} conectado, adicionado ao lobby.")
+        restart_decisions = collect_restart_decisions(clients, players_data)
 
-    # Adiciona o cliente à lista de espera e informa que está aguardando
-    with waiting_clients_lock:
-        waiting_clients.append(client_sock)
-    sendall_safe(client_sock, bytes([OP_WAITING_FOR_PLAYER, 0]))
-
-    # Loop para tentar formar pares ou ser pareado
-    while True:
-        paired_clients = []
-        with waiting_clients_lock:
-            # Tenta encontrar um par para o cliente atual
-            # Remove o cliente atual da lista temporariamente para não pareá-lo consigo mesmo
-            if client_sock in waiting_clients and len(waiting_clients) >= 2:
-                temp_waiting_clients = [s for s in waiting_clients if s != client_sock]
-                if temp_waiting_clients: # Se há pelo menos mais um cliente esperando
-                    paired_clients = [client_sock, temp_waiting_clients[0]]
-                    # Remove os clientes pareados da lista global
-                    waiting_clients.remove(client_sock)
-                    waiting_clients.remove(temp_waiting_clients[0])
-            elif client_sock.fileno() == -1: # Se o próprio socket foi fechado por outra thread
-                logging.info(f"Cliente {client_addr} foi fechado por outra thread, encerrando thread do cliente.")
-                break # Sai do loop da thread do cliente
-
-        if len(paired_clients) == 2:
-            logging.info(f"Formado par com {paired_clients[0].getpeername()} e {paired_clients[1].getpeername()}. Iniciando sessão de jogo.")
-            try:
-                # A thread que chamou handle_game_session assume a responsabilidade pelos sockets
-                remaining_sockets = handle_game_session(paired_clients)
-
-                with waiting_clients_lock:
-                    for s in remaining_sockets:
-                        if s.fileno() != -1:
-                            waiting_clients.append(s)
-                            sendall_safe(s, bytes([OP_WAITING_FOR_PLAYER, 0]))
-                            logging.info(f"Cliente {s.getpeername()} voltou para o lobby.")
-
-            except Exception as e:
-                logging.exception(f"Erro ao gerenciar sessão de jogo: {e}")
-                for s in paired_clients:
-                    try:
-                        s.close()
-                    except:
-                        pass
-            break # A thread do cliente atual encerra após tentar formar um par
-        else:
-            time.sleep(1)
-    if client_sock.fileno() != -1:
-        with waiting_clients_lock:
-            if client_sock not in waiting_clients: # Se ele não voltou para o lobby (encerrou)
+        if all(restart_decisions.values()):
+            logging.info("Ambos os jogadores querem reiniciar. Enviando confirmação.")
+            p1.send(bytes([OP_RESTART_CONFIRM, 1]))
+            p2.send(bytes([OP_RESTART_CONFIRM, 1]))
+            continue
+
+        # Se um ou ambos não quiserem, a sessão atual termina; quem recusou já foi
+        # desconectado por collect_restart_decisions e quem quer continuar volta ao lobby.
+        clients_to_return = [conn for conn in clients if restart_decisions[conn]]
+        for conn in clients_to_return:
+            logging.info(f"Player{players_data[conn].id} quer continuar e o outro jogador não. Adicionando ao lobby.")
+            conn.send(bytes([OP_RESTART_CONFIRM, 1]))
+        if not clients_to_return:
+            logging.info("Ambos os jogadores não querem reiniciar. Encerrando conexões.")
+        return clients_to_return, round_ended
+
+# Lê a decisão de reinício dos dois jogadores ao mesmo tempo (selectors), sob um
+# único prazo: um jogador lento ou morto não atrasa a leitura do outro. Quem
+# recusa, cai ou não responde a tempo recebe OP_RESTART_CONFIRM 0 e é
+# desconectado na hora. Com late_guesses, OP_GUESS que cruzou com o fim da
+# rodada (em uma sala, os guessers chutam ao mesmo tempo) é descartado.
+# Devolve {conexão: quer continuar}.
+def collect_restart_decisions(clients, players_data, late_guesses=False):
+    decisions = {}
+    deadline = time.monotonic() + RESTART_TIMEOUT
+    for conn in clients:
+        conn.flush() # Fim da rodada e OP_RESTART em uma escrita
+
+    def decide(conn, wants_restart):
+        decisions[conn] = wants_restart
+        if not wants_restart:
+            conn.send(bytes([OP_RESTART_CONFIRM, 0]))
+            conn.close()
+
+    with selectors.DefaultSelector() as selector:
+        for conn in clients:
+            selector.register(conn, selectors.EVENT_READ)
+        ready = list(clients) # Uma resposta pode já estar no buffer da conexão
+
+        while True:
+            for conn in ready:
                 try:
-                    client_sock.close()
-                    logging.info(f"Cliente {client_addr} desconectado (thread finalizada).")
-                except Exception as e:
-                    logging.warning(f"Erro ao fechar socket final para {client_addr}: {e}")
+                    if not conn.poll():
+                        raise ConnectionError("Conexão fechada pelo cliente")
+                    msg = conn.pending_message()
+                    while late_guesses and isinstance(msg, Guess):
+                        if not conn.poll():
+                            raise ConnectionError("Conexão fechada pelo cliente")
+                        msg = conn.pending_message()
+                    if msg is None:
+                        continue # Frame incompleto ou só mensagens de controle
+                    if isinstance(msg, Restart):
+                        logging.info(f"Player{players_data[conn].id} escolheu {'continuar' if msg.flag else 'sair'}")
+                        wants_restart = msg.flag == 1
+                    else:
+                        metrics.PROTOCOL_ERRORS.inc()
+                        logging.warning(f"Mensagem inesperada {msg!r} durante RESTART de Player{players_data[conn].id}. Assumindo 'sair'.")
+                        wants_restart = False
+                except ConnectionError:
+                    logging.warning(f"Conexão do Player{players_data[conn].id} caiu durante RESTART. Assumindo 'sair'.")
+                    wants_restart = False
+                selector.unregister(conn)
+                decide(conn, wants_restart)
+
+            if len(decisions) == len(clients):
+                return decisions
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ready = [key.fileobj for key, _ in selector.select(remaining)]
+
+    for conn in clients:
+        if conn not in decisions:
+            metrics.TIMEOUTS.inc()
+            logging.warning(f"Player{players_data[conn].id} não respondeu ao RESTART a tempo. Assumindo 'sair'.")
+            decide(conn, False)
+    return decisions
+
+# Executa a sessão de um par formado no lobby e devolve ao lobby quem quiser continuar
+def run_session(paired_clients):
+    room = spectators.open_room() # Sala dos espectadores, aberta enquanto durar a sessão
+    logging.info(f"Formado par com {paired_clients[0].addr} e {paired_clients[1].addr}. Iniciando sessão de jogo (partida {room.id}).")
+    metrics.SESSIONS_ACTIVE.inc()
+    admission.session_started()
+    for conn in paired_clients:
+        conn.in_session = True
+        if COALESCE:
+            conn.cork(paired_clients)
+        resume.issue(conn) # Token de retomada, válido enquanto durar a sessão
+    journal.session(paired_clients)
+    try:
+        # A thread da sessão assume a responsabilidade pelas conexões
+        remaining_clients, round_ended = handle_game_session(paired_clients, room)
+    except Exception as e:
+        logging.exception(f"Erro ao gerenciar sessão de jogo: {e}")
+        for conn in paired_clients:
+            conn.close()
+        return
+    finally:
+        room.close()
+        metrics.SESSIONS_ACTIVE.dec()
+        admission.session_ended()
+        for conn in paired_clients:
+            resume.release(conn)
+
+    return_to_lobby(remaining_clients, round_ended)
+
+# Quem continua depois de uma sessão volta ao lobby (ou a uma sala com lugar)
+def return_to_lobby(clients, round_ended):
+    for conn in clients:
+        if conn.is_bot:
+            conn.close() # Bots não voltam ao lobby
+        elif not conn.is_closed():
+            conn.send(bytes([OP_WAITING_FOR_PLAYER, 0]))
+            conn.uncork() # No lobby cada envio volta a sair na hora
+            logging.info(f"Cliente {conn.addr} voltou para o lobby.")
+            lobby.join(conn, conn.addr, requeued_at=round_ended)
+
+
+# Salas de vários guessers (--sala N, rooms.py). A sala nasce de um par do lobby
+# e recebe quem chegar depois enquanto houver lugar. O SETTER muda a cada
+# rodada, em rodízio; todos os outros são GUESSERs da mesma palavra. Uma única
+# thread atende a sala inteira: os palpites são lidos com selectors, sem thread
+# (nem leitura bloqueante) por guesser. Na falha de uma rodada sai só quem a
+# causou; os outros voltam ao lobby. Salas não têm retomada (resume.py).
+
+# Assume quem o lobby colocou na sala (rooms.place). Com a rodada em andamento,
+# o novo guesser recebe o papel, o tamanho da palavra e o estado atual; entre
+# rodadas, ele joga a partir da próxima.
+def admit_joiners(game_room, members, players_data, game=None):
+    joined = []
+    for conn in game_room.take_joining():
+        if conn.is_closed():
+            game_room.free()
+            continue
+        players_data[conn] = Player(len(players_data) + 1)
+        conn.in_session = True
+        if COALESCE:
+            conn.cork(members)
+        members.append(conn)
+        joined.append(conn)
+        logging.info(f"Cliente {conn.addr} entrou na sala como Player{players_data[conn].id} ({len(members)} jogadores).")
+    if game is not None and joined:
+        frames = (bytes([OP_PLAYER_ROLE, ROLE_GUESSER, OP_START, len(game.word)])
+                  + game.state_frames(True)[0])
+        for conn in joined:
+            conn.poll() # OP_HELLO que já tenha chegado vale desde o primeiro palpite
+            conn.send(frames)
+    return joined
+
+def play_room_round(game_room, members, players_data, room, setter):
+    round_started = time.monotonic()
+    guessers = [conn for conn in members if conn is not setter]
+    trace = tracing.start_round(room.id)
+    try:
+        setter.send(bytes([OP_PLAYER_ROLE, ROLE_SETTER]))
+        role_frame = bytes([OP_PLAYER_ROLE, ROLE_GUESSER])
+        for guesser in guessers:
+            guesser.send(role_frame)
+        logging.debug("Player %s é o SETTER da sala, contra %s GUESSERs.", players_data[setter].id, len(guessers))
+
+        word = read_word(setter, players_data)
+        if trace:
+            trace.phase('palavra')
+        game = WordGame(word, MAX_ERRORS)
+        start_frame = bytes([OP_START, len(word)])
+        for guesser in guessers:
+            guesser.poll() # Processa um OP_HELLO pendente, como em play_round
+            guesser.send(start_frame)
+        send_game_state(guessers, setter, game, True, room)
+
+        if not arbitrate_guesses(game_room, members, guessers, setter, game, players_data, room, trace):
+            metrics.ROUNDS_ABORTED.inc()
+            logging.info("Rodada da sala encerrada sem guessers.")
+            if trace:
+                tracing.finish_round(trace, 'abortada')
+            return False
 
+    except (ConnectionError, socket.timeout) as e:
+        # Só o SETTER chega aqui: problemas dos guessers ficam em arbitrate_guesses
+        metrics.ROUNDS_ABORTED.inc()
+        if isinstance(e, socket.timeout):
+            metrics.TIMEOUTS.inc()
+        elif isinstance(e, ProtocolError):
+            metrics.PROTOCOL_ERRORS.inc()
+        logging.error(f"Erro de conexão/timeout do SETTER da sala: {e}. Player {players_data[setter].id} sai da sala.")
+        if trace:
+            tracing.finish_round(trace, 'abortada')
+        members.remove(setter)
+        game_room.free()
+        setter.close()
+        return False
+    except Exception as e:
+        metrics.ROUNDS_ABORTED.inc()
+        logging.exception(f"Erro inesperado durante a rodada da sala: {e}.")
+        if trace:
+            tracing.finish_round(trace, 'abortada')
+        for conn in members:
+            conn.close()
+        members.clear()
+        return False
 
-waiting_clients = []
-waiting_clients_lock = threading.Lock()
+    if game.won:
+        logging.info(f"Os {len(guessers)} GUESSERs da sala VENCERAM o turno! Palavra: {word}")
+        for guesser in guessers:
+            players_data[guesser].score += 1
+        metrics.ROUNDS_WON.inc()
+    else:
+        logging.info(f"Os {len(guessers)} GUESSERs da sala PERDERAM o turno! Palavra: {word}")
+        metrics.ROUNDS_LOST.inc()
+    send_game_over(guessers, setter, game, room)
+    if trace:
+        trace.phase('processamento')
+        tracing.finish_round(trace, 'vitoria' if game.won else 'derrota')
+    metrics.ROUND_SECONDS.observe(time.monotonic() - round_started)
+    metrics.GUESSES_PER_ROUND.observe(game.guessed.bit_count())
+    metrics.ROOM_GUESSERS_PER_ROUND.observe(len(guessers))
+    record_round(setter, guessers, game.won)
+    return True
+
+# Lê os palpites de todos os guessers ao mesmo tempo (selectors) e aplica cada
+# um no jogo compartilhado na ordem em que foi lido. Os OP_UPDATE de uma
+# passada do selector são juntados e vão para todos de uma vez no fim dela
+# (send_guess_updates), em uma escrita sem bloqueio por jogador; quem não dá
+# conta de ler é desconectado em vez de atrasar a sala. Letra repetida (às
+# vezes de outro guesser) só devolve o estado a quem chutou, depois dos
+# OP_UPDATE da passada (o estado completo já os inclui). O prazo é da sala: se ninguém
+# fizer um palpite válido em GUESS_TIMEOUT, os guessers são desconectados.
+# True quando o jogo acaba; False se a sala ficou sem guessers. Problemas do
+# SETTER levantam ConnectionError. Com `trace` (tracing.py), cada espera no
+# selector é uma fase 'palpite' e cada passada, uma fase 'processamento'.
+def arbitrate_guesses(game_room, members, guessers, setter, game, players_data, room, trace=None):
+    deadline = time.monotonic() + GUESS_TIMEOUT
+
+    with selectors.DefaultSelector() as selector:
+        def drop(conn, reason):
+            logging.warning(f"Player{players_data[conn].id} sai da sala: {reason}.")
+            selector.unregister(conn)
+            guessers.remove(conn)
+            members.remove(conn)
+            game_room.free()
+            conn.close()
+
+        updates = [] # OP_UPDATE da passada, ainda não enviados
+        repeated = set() # Quem chutou uma letra repetida na passada
+
+        # Envia o que a passada acumulou; antes de qualquer frame que mostre o
+        # estado completo, para que nenhum cliente aplique um delta duas vezes
+        def publish():
+            if updates:
+                send_guess_updates(guessers, setter, game, updates, room)
+                updates.clear()
+            if repeated:
+                guesser_frame = game.state_frames(True)[0]
+                for conn in repeated:
+                    if not conn.is_closed():
+                        conn.send(guesser_frame)
+                repeated.clear()
+
+        selector.register(game_room.wake_r, selectors.EVENT_READ)
+        selector.register(setter, selectors.EVENT_READ)
+        for guesser in guessers:
+            selector.register(guesser, selectors.EVENT_READ)
+        ready = list(guessers) # Palpites podem já estar no buffer das conexões
+
+        while True:
+            for conn in ready:
+                if conn is game_room.wake_r:
+                    publish() # Quem entra recebe o estado completo atual
+                    joined = admit_joiners(game_room, members, players_data, game)
+                    for guesser in joined:
+                        selector.register(guesser, selectors.EVENT_READ)
+                    guessers.extend(joined)
+                    ready.extend(joined) # Tratados ainda nesta passada
+                    continue
+                if conn is setter:
+                    if not setter.poll():
+                        raise ConnectionError("SETTER desconectou durante os palpites")
+                    if setter.pending_message() is not None:
+                        raise ProtocolError("Protocolo inesperado do SETTER durante os palpites")
+                    continue
+                while not game.over:
+                    if not conn.poll():
+                        drop(conn, "conexão caiu")
+                        break
+                    msg = conn.pending_message()
+                    if msg is None:
+                        break
+                    if not isinstance(msg, Guess):
+                        metrics.PROTOCOL_ERRORS.inc()
+                        drop(conn, f"mensagem inesperada {msg!r}, esperando OP_GUESS")
+                        break
+                    ch = msg.letter.lower()
+                    result = game.guess(ch)
+                    if result is None:
+                        repeated.add(conn)
+                        continue
+                    deadline = time.monotonic() + GUESS_TIMEOUT
+                    if not game.over:
+                        hit, positions = result
+                        updates.append(Update(ch, hit, positions).encode())
+                if game.over:
+                    publish()
+                    return True
+
+            publish()
+            for conn in list(members):
+                if conn.flush(block=False):
+                    continue
+                if conn is setter:
+                    raise ConnectionError("Falha ao enviar ao SETTER")
+                drop(conn, "não acompanhou os frames da sala")
+            if not guessers:
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                metrics.TIMEOUTS.inc()
+                for conn in list(guessers):
+                    drop(conn, f"nenhum palpite na sala em {GUESS_TIMEOUT}s")
+                return False
+            if trace:
+                trace.phase('processamento')
+            ready = [key.fileobj for key, _ in selector.select(remaining)]
+            if trace:
+                trace.phase('palpite')
+
+def handle_room_session(game_room, members, room):
+    players_data = {conn: Player(i) for i, conn in enumerate(members, 1)}
+    setters = itertools.count()
+    round_ended = None
 
-def main():
+    while True:
+        admit_joiners(game_room, members, players_data)
+        if len(members) < 2:
+            return list(members), round_ended
+
+        setter = members[next(setters) % len(members)]
+        logging.info(f"Iniciando rodada da sala: Player {players_data[setter].id} (SETTER) e {len(members) - 1} GUESSERs.")
+
+        if not play_room_round(game_room, members, players_data, room, setter):
+            logging.info("Rodada da sala encerrada devido a erro. Os outros jogadores voltam ao lobby.")
+            return [conn for conn in members if not conn.is_closed()], None
+
+        for conn in members:
+            conn.send(bytes([OP_RESTART, 1]))
+        round_ended = time.monotonic()
+
+        # Quem recusou já foi desconectado; a lista é a mesma do cork (flush_group)
+        restart_decisions = collect_restart_decisions(members, players_data, late_guesses=True)
+        members[:] = [conn for conn in members if restart_decisions[conn]]
+        game_room.free(len(restart_decisions) - len(members))
+        for conn in members:
+            conn.send(bytes([OP_RESTART_CONFIRM, 1]))
+
+# Executa a sala formada por um par do lobby; quem quiser continuar quando ela
+# fechar (e quem foi colocado nela sem chegar a entrar) volta ao lobby
+def run_room(paired_clients):
+    room = spectators.open_room()
+    game_room = rooms.open_room(ROOM_GUESSERS + 1, len(paired_clients))
+    members = list(paired_clients)
+    logging.info(f"Formada sala com {paired_clients[0].addr} e {paired_clients[1].addr}, "
+                 f"até {ROOM_GUESSERS} guessers (partida {room.id}).")
+    metrics.SESSIONS_ACTIVE.inc()
+    admission.session_started()
+    for conn in members:
+        conn.in_session = True
+        if COALESCE:
+            conn.cork(members)
+    try:
+        remaining_clients, round_ended = handle_room_session(game_room, members, room)
+    except Exception as e:
+        logging.exception(f"Erro ao gerenciar sala: {e}")
+        for conn in members:
+            conn.close()
+        remaining_clients, round_ended = [], None
+    finally:
+        joining = game_room.close()
+        room.close()
+        metrics.SESSIONS_ACTIVE.dec()
+        admission.session_ended()
+        for conn in members:
+            resume.release(conn)
+
+    return_to_lobby(remaining_clients, round_ended)
+    for conn in joining:
+        lobby.join(conn, conn.addr)
+
+def make_bot():
+    return ServerBot(bot_words, bot_solver, bot_level, bot_role)
+
+# Cada par formado ganha uma thread própria; clientes esperando no lobby não ocupam thread.
+# Com --sala o par vira uma sala de vários guessers (partidas contra bots continuam em pares).
+def start_session(paired_clients):
+    target = run_session
+    if ROOM_GUESSERS and not any(conn.is_bot for conn in paired_clients):
+        target = run_room
+    session_thread = threading.Thread(target=target, args=(paired_clients,))
+    session_thread.daemon = True
+    session_thread.start()
+
+def handle_client(client_sock, client_addr):
+    logging.info(f"Cliente {client_addr} conectado, adicionado ao lobby.")
+    metrics.CONNECTIONS_TOTAL.inc()
+    # Os frames já saem agrupados por evento: Nagle só atrasaria a única escrita
+    client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    conn = Connection(client_sock, client_addr)
+    conn.send(bytes([OP_WAITING_FOR_PLAYER, 0]))
+    lobby.join(conn, client_addr)
+
+
+lobby = None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor do jogo da forca")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--modo', choices=['threads', 'asyncio'], default='threads',
+                        help="threads: uma thread por conexão; asyncio: todas as conexões em um único event loop")
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help="porta do endpoint HTTP /metrics (0 desativa)")
+    parser.add_argument('--metrics-host', default='127.0.0.1')
+    parser.add_argument('--backlog', type=int, default=BACKLOG,
+                        help="fila de conexões pendentes do listen (SYNs além dela esperam o cliente repetir)")
+    parser.add_argument('--max-conexoes', type=int, default=0,
+                        help="conexões de jogadores abertas ao mesmo tempo; acima disso as novas recebem OP_BUSY (0 = sem limite)")
+    parser.add_argument('--max-sessoes', type=int, default=0,
+                        help="sessões em andamento; acima disso as conexões novas recebem OP_BUSY (0 = sem limite)")
+    parser.add_argument('--limite-ip', type=float, default=0, metavar='TAXA',
+                        help="conexões novas por segundo de cada IP (token bucket; 0 = sem limite)")
+    parser.add_argument('--rajada-ip', type=int, default=10,
+                        help="conexões seguidas que um IP pode abrir antes de --limite-ip valer")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="processos de jogo com a porta compartilhada (SO_REUSEPORT) e lobby único; 0 = um só processo")
+    parser.add_argument('--prazo-palavra', type=float, default=SETWORD_TIMEOUT,
+                        help="segundos para o SETTER escolher a palavra")
+    parser.add_argument('--prazo-palpite', type=float, default=GUESS_TIMEOUT,
+                        help="segundos para o GUESSER mandar cada palpite")
+    parser.add_argument('--prazo-restart', type=float, default=RESTART_TIMEOUT,
+                        help="segundos para decidir se joga de novo")
+    parser.add_argument('--prazo-retomada', type=float, default=RESUME_GRACE,
+                        help="segundos para um jogador que caiu no meio da rodada reconectar e retomar o lugar (0 desliga)")
+    parser.add_argument('--prazo-lobby', type=float, default=LOBBY_IDLE_TIMEOUT,
+                        help="segundos máximos de espera no lobby (0 = sem limite)")
+    parser.add_argument('--bot-apos', type=float, default=BOT_AFTER,
+                        help="segundos sozinho no lobby até jogar contra um bot (0 = desligado)")
+    parser.add_argument('--bot-papel', choices=list(BOT_ROLES), default='setter',
+                        help="papel do bot; 'ambos' alterna os papéis como em uma partida normal")
+    parser.add_argument('--bot-palavras', metavar='ARQUIVO',
+                        help="lista binária de palavras do bot (wordlist.py build); padrão: lista embutida")
+    parser.add_argument('--bot-dificuldade', type=int, choices=range(wordlist.DIFFICULTIES),
+                        help="dificuldade das palavras do bot (0 fácil .. 2 difícil); padrão: qualquer")
+    parser.add_argument('--envio-imediato', action='store_true',
+                        help="uma escrita por frame, sem agrupar os envios de cada evento (para comparação)")
+    parser.add_argument('--placar', metavar='ARQUIVO',
+                        help="banco SQLite do placar persistente dos jogadores com nome (OP_LOGIN); padrão: desligado")
+    parser.add_argument('--placar-top', type=int, default=10,
+                        help="tamanho do top-N em cache, servido em /leaderboard na porta de métricas")
+    parser.add_argument('--sala', type=int, default=ROOM_GUESSERS, metavar='N',
+                        help="salas com um SETTER contra até N GUESSERs na mesma palavra, formadas no lobby "
+                             "(0 = partidas de dois jogadores)")
+    parser.add_argument('--nivel', type=float, default=SKILL_WINDOW, metavar='PONTOS',
+                        help="pareia pelo rating (Elo) quem estiver a até PONTOS de distância; "
+                             "0 = ordem de chegada")
+    parser.add_argument('--nivel-alargar', type=float, default=SKILL_WIDEN, metavar='PONTOS',
+                        help="pontos que a janela de --nivel cresce por segundo de espera no lobby")
+    parser.add_argument('--nivel-max-espera', type=float, default=SKILL_MAX_WAIT, metavar='SEGUNDOS',
+                        help="espera no lobby a partir da qual --nivel aceita qualquer rating (0 = nunca)")
+    parser.add_argument('--rastreio', action='store_true',
+                        help="registra a duração de cada fase das rodadas desde o início (também ligável por "
+                             "/trace?ligar=1 na porta de métricas; SIGUSR2 grava em arquivo)")
+    parser.add_argument('--diagnostico-dir', default='.', metavar='DIR',
+                        help="diretório dos arquivos de rastreio (SIGUSR2) e do profiler (/profile?segundos=N)")
+    parser.add_argument('--diario', metavar='ARQUIVO',
+                        help="grava todos os frames dos jogadores em um diário binário (ARQUIVO.N por worker); "
+                             "veja benchmarks/replay.py")
+    logconfig.add_logging_args(parser)
+    args = parser.parse_args(argv)
+    if args.workers and args.modo != 'threads':
+        parser.error("--workers só é suportado com --modo threads")
+    if args.bot_apos and args.modo != 'threads':
+        parser.error("--bot-apos só é suportado com --modo threads")
+    if args.diario and args.modo != 'threads':
+        parser.error("--diario só é suportado com --modo threads")
+    if args.backlog < 1 or min(args.max_conexoes, args.max_sessoes, args.limite_ip, args.rajada_ip) < 0:
+        parser.error("--backlog deve ser >= 1 e os limites de admissão >= 0")
+    if args.sala < 0:
+        parser.error("--sala deve ser >= 0")
+    if min(args.nivel, args.nivel_alargar, args.nivel_max_espera) < 0:
+        parser.error("--nivel, --nivel-alargar e --nivel-max-espera devem ser >= 0")
+    if args.nivel and args.modo != 'threads':
+        parser.error("--nivel só é suportado com --modo threads")
+    if args.sala and (args.modo != 'threads' or args.workers):
+        parser.error("--sala só é suportado com --modo threads, sem --workers")
+    if args.workers and not (hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT')):
+        parser.error("--workers requer fork e SO_REUSEPORT (Linux/BSD)")
+    return args
+
+# Socket de escuta; com reuse_port vários processos fazem bind na mesma porta
+# e o kernel distribui as conexões novas entre eles (SO_REUSEPORT)
+def create_listener(host, port, reuse_port=False, backlog=BACKLOG):
     srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    srv.bind((HOST, PORT))
-    srv.listen(10)
-    logging.info(f"Servidor em {HOST}:{PORT}, aguardando pares...")
+    if reuse_port:
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    srv.bind((host, port))
+    srv.listen(backlog)
+    return srv
+
+# Laço de accept do modo com threads; as conexões aceitas vão para
+# `lobby_instance`, ou são recusadas com OP_BUSY pelo controle de admissão
+def serve(srv, lobby_instance):
+    global lobby
+    lobby = lobby_instance
 
     while True:
         try:
             conn, addr = srv.accept()
-            # Thread para lidar com o cliente
-            client_thread = threading.Thread(target=handle_client_thread, args=(conn, addr))
-            client_thread.daemon = True
-            client_thread.start()
+            reason = admission.check(addr)
+            if reason:
+                admission.reject(conn, addr, reason)
+                continue
+            handle_client(conn, addr)
         except KeyboardInterrupt:
             logging.info("Servidor encerrado pelo usuário.")
             break
@@ -349,7 +835,131 @@ def main():
             logging.error(f"Erro ao aceitar nova conexão: {e}")
 
     srv.close()
-    logging.info("Servidor finalizado.")
+    lobby.close()
+
+def configure_timeouts(args):
+    global SETWORD_TIMEOUT, GUESS_TIMEOUT, RESTART_TIMEOUT, LOBBY_IDLE_TIMEOUT, RESUME_GRACE, COALESCE, ROOM_GUESSERS
+    SETWORD_TIMEOUT = args.prazo_palavra
+    GUESS_TIMEOUT = args.prazo_palpite
+    RESTART_TIMEOUT = args.prazo_restart
+    LOBBY_IDLE_TIMEOUT = args.prazo_lobby
+    ROOM_GUESSERS = args.sala
+    # O modo asyncio e as salas não têm retomada
+    RESUME_GRACE = args.prazo_retomada if args.modo == 'threads' and not ROOM_GUESSERS else 0
+    resume.GRACE = RESUME_GRACE
+    COALESCE = not args.envio_imediato
+
+# Limites de admissão; com --workers os contadores são compartilhados entre os
+# processos (chamado antes do fork)
+def configure_admission(args):
+    if args.max_conexoes or args.max_sessoes or args.limite_ip:
+        admission.configure(args.max_conexoes, args.max_sessoes, args.limite_ip, args.rajada_ip,
+                            shared=bool(args.workers))
+
+def configure_skill(args):
+    global SKILL_WINDOW, SKILL_WIDEN, SKILL_MAX_WAIT
+    SKILL_WINDOW = args.nivel
+    SKILL_WIDEN = args.nivel_alargar
+    SKILL_MAX_WAIT = args.nivel_max_espera
+
+# Índice de nível do lobby (None = fila FIFO)
+def skill_index():
+    return skill.SkillIndex(SKILL_WINDOW, SKILL_WIDEN, SKILL_MAX_WAIT) if SKILL_WINDOW else None
+
+# Abre a lista do bot antes do fork dos workers: o mmap é herdado e compartilhado
+def configure_bots(args):
+    global BOT_AFTER, bot_role, bot_words, bot_level, bot_solver
+    BOT_AFTER = args.bot_apos
+    bot_role = BOT_ROLES[args.bot_papel]
+    bot_level = args.bot_dificuldade
+    if BOT_AFTER:
+        bot_words = wordlist.WordList.open(args.bot_palavras) if args.bot_palavras else wordlist.WordList.from_words(WORDS)
+        if bot_role != ROLE_SETTER:
+            bot_solver = Solver(bot_words).warm()
+
+# Abre o placar no processo atual (depois do fork: a conexão SQLite e a thread
+# de escrita não atravessam fork) e publica o top-N no servidor HTTP de métricas
+def configure_leaderboard(args):
+    global leaderboard
+    if not args.placar:
+        return
+    leaderboard = Leaderboard(args.placar, top_n=args.placar_top)
+    atexit.register(leaderboard.close) # Grava o último lote ao encerrar
+    metrics.add_route('/leaderboard', leaderboard.top_json, 'application/json')
+
+# Abre o diário de frames no processo que atende os jogadores (com --workers,
+# um arquivo por worker: a thread de escrita não atravessa fork)
+def configure_journal(args, suffix=''):
+    if not args.diario:
+        return
+    recorder = journal.configure(args.diario + suffix)
+    atexit.register(recorder.close) # Grava o que estiver na fila ao encerrar
+
+# Rastreio das rodadas e profiler sob demanda (tracing.py, profiler.py): rotas
+# /trace e /profile na porta de métricas e SIGUSR2 gravando o rastreio em
+# arquivo. Chamado em cada processo que atende jogadores (e no broker, para que
+# SIGUSR2 não o encerre).
+def configure_diagnostics(args):
+    tracing.enabled = args.rastreio
+    directory = args.diagnostico_dir
+    metrics.add_route('/trace', tracing.render, 'application/json', params=True)
+    metrics.add_route('/profile', lambda params: profiler.render(params, directory), 'application/json', params=True)
+    if hasattr(signal, 'SIGUSR2') and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR2, lambda _signum, _frame: tracing.dump_to_file(directory))
+
+# SIGTERM encerra como Ctrl+C: SystemExit passa pelo laço de accept e roda os
+# atexit (último lote do placar, fila de logs). Uma vez começado o encerramento,
+# outro SIGTERM é ignorado: um SystemExit no meio da limpeza a interromperia.
+def terminate(_signum, _frame):
+    ignore_terminate()
+    raise SystemExit(0)
+
+def ignore_terminate():
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+def main(argv=None):
+    args = parse_args(argv)
+    threading.stack_size(THREAD_STACK_SIZE) # Vale para as threads criadas daqui em diante, inclusive nos workers
+    configure_timeouts(args)
+    configure_bots(args)
+    configure_skill(args)
+    configure_admission(args)
+    if args.workers:
+        # Cada processo configura logs e métricas depois do fork
+        import cluster
+        cluster.main(args)
+        return
+
+    logconfig.setup_from_args(args)
+    logconfig.install_level_toggle()
+    configure_leaderboard(args)
+    configure_journal(args)
+    configure_diagnostics(args)
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        if args.metrics_port:
+            metrics.add_route('/games', spectators.games_json, 'application/json')
+            metrics.serve(args.metrics_host, args.metrics_port)
+
+        if args.modo == 'asyncio':
+            import server_async
+            server_async.main(args.host, args.port, args.backlog)
+            return
+
+        local_lobby = Lobby(on_pair=start_session, idle_timeout=LOBBY_IDLE_TIMEOUT,
+                            bot_after=BOT_AFTER, make_bot=make_bot,
+                            place=rooms.place if ROOM_GUESSERS else None, skill=skill_index())
+        metrics.LOBBY_DEPTH.func = lambda: len(local_lobby)
+
+        srv = create_listener(args.host, args.port, backlog=args.backlog)
+        logging.info(f"Servidor em {args.host}:{args.port}, aguardando pares...")
+        serve(srv, local_lobby)
+        logging.info("Servidor finalizado.")
+    finally:
+        ignore_terminate() # Também depois de Ctrl+C: a espera pelas threads e os atexit vêm a seguir
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # cluster.py e server_async.py fazem `import server`: reaproveita este módulo
+    # em vez de carregar uma segunda cópia com os prazos padrão
+    sys.modules.setdefault('server', sys.modules[__name__])
+    main()
@@ -0,0 +1,466 @@
+import asyncio
+import itertools
+import logging
+import random
+import time
+from collections import OrderedDict
+
+import admission
+import metrics
+import tracing
+
+from protocol import (
+    OP_RESTART, OP_START, OP_GAME_OVER_WIN, OP_GAME_OVER_LOSE, OP_PLAYER_ROLE,
+    OP_OPPONENT_WON, OP_OPPONENT_LOST, OP_RESTART_CONFIRM, OP_WAITING_FOR_PLAYER,
+    FEATURE_DELTA, FEATURE_RESUME, ROLE_SETTER, ROLE_GUESSER, RECV_CHUNK, FrameParser, SetWord, Guess,
+    Restart, Update, Hello, Login, Watch, Busy, FRAME_IN, ProtocolError, encode_word_frame, valid_name,
+)
+from connection import FRAME_OUT, SUPPORTED_FEATURES
+from engine import MAX_ERRORS, WordGame
+import server
+from server import HOST, PORT
+
+# Servidor em modo asyncio: mesmo protocolo e mesma lógica de play_round / handle_game_session
+# do servidor com threads, mas todas as conexões vivem em um único event loop.
+# Os prazos são os mesmos do server.py (server.*_TIMEOUT): wait_for nas leituras
+# e loop.call_later para a espera no lobby, ambos já baseados no timer do event loop.
+# Como no modo threads, os envios de cada evento da sessão são agrupados
+# (client.corked) e saem em um write antes da próxima leitura; o asyncio já
+# liga TCP_NODELAY nos transportes TCP.
+
+
+# Cliente conectado ao event loop (par reader/writer do asyncio + parser de frames)
+class AsyncClient:
+    __slots__ = ('reader', 'writer', 'addr', 'parser', 'features', 'name', 'joined_lobby_at',
+                 'lobby_timer', 'lobby_task', 'requeued_at', 'pending', 'corked', 'flush_group', 'out', '_closed')
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info('peername')
+        self.parser = FrameParser()
+        self.features = 0
+        self.name = None
+        self.joined_lobby_at = None
+        self.lobby_timer = None
+        self.lobby_task = None # watch_lobby enquanto espera no lobby
+        self.requeued_at = None
+        self.pending = None # Mensagem de jogo lida por watch_lobby, entregue à sessão
+        self.corked = False
+        self.flush_group = None # Clientes escritos antes de uma leitura deste (a sessão)
+        self.out = [] # Frames guardados enquanto corked
+        self._closed = False
+        metrics.CONNECTIONS_TOTAL.inc()
+        metrics.CONNECTIONS_ACTIVE.inc()
+        admission.connection_opened()
+
+    def is_closed(self):
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            metrics.CONNECTIONS_ACTIVE.dec()
+            admission.connection_closed()
+        try:
+            if self.out and not self.writer.is_closing():
+                write(self, b''.join(self.out)) # O transporte envia antes de fechar
+            self.out.clear()
+            self.writer.close()
+        except Exception:
+            pass
+
+
+# Envia dados para o cliente lidando com possíveis erros de conexão; com o
+# cliente agrupando, só guarda o frame até o próximo flush
+async def sendall_safe(client, data: bytes):
+    try:
+        if client.writer.is_closing(): # Verifica se o socket ainda está aberto
+            logging.warning(f"Tentativa de enviar para socket fechado: {client.addr}")
+            return False
+        metrics.FRAMES_OUT.inc()
+        if client.corked:
+            client.out.append(data)
+            return True
+        started = time.perf_counter() if tracing.enabled else 0.0
+        write(client, data)
+        await client.writer.drain()
+        if started:
+            tracing.wrote(time.perf_counter() - started)
+        return True
+    except Exception as e:
+        logging.warning(f"Falha ao enviar para {client.addr}: {e}")
+        return False
+
+def write(client, data):
+    client.writer.write(data)
+    metrics.SOCKET_WRITES.inc()
+    metrics.BYTES_OUT.inc(len(data))
+    if logging.root.isEnabledFor(logging.DEBUG):
+        logging.debug(f"Enviado {data!r} para {client.addr}", extra=FRAME_OUT)
+
+# Escreve de uma vez os frames guardados de cada cliente
+async def flush(*clients):
+    for client in clients:
+        if not client.out:
+            continue
+        data = client.out[0] if len(client.out) == 1 else b''.join(client.out)
+        client.out.clear()
+        try:
+            if client.writer.is_closing():
+                continue
+            started = time.perf_counter() if tracing.enabled else 0.0
+            write(client, data)
+            await client.writer.drain()
+            if started:
+                tracing.wrote(time.perf_counter() - started)
+        except Exception as e:
+            logging.warning(f"Falha ao enviar para {client.addr}: {e}")
+
+# Lê a próxima mensagem de jogo do cliente, com timeout opcional; antes, escreve
+# o que a sessão guardou para ele e para o parceiro
+async def read_message(client, timeout=None):
+    await flush(*(client.flush_group or (client,)))
+    return await asyncio.wait_for(_read_message(client), timeout)
+
+async def _read_message(client):
+    if client.pending is not None:
+        msg, client.pending = client.pending, None
+        return msg
+    while True:
+        msg = client.parser.next_message()
+        while msg is None:
+            data = await client.reader.read(RECV_CHUNK)
+            if not data:
+                raise ConnectionError("Conexão fechada pelo cliente")
+            metrics.BYTES_IN.inc(len(data))
+            client.parser.feed(data)
+            msg = client.parser.next_message()
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f"Recebido {msg!r} de {client.addr}", extra=FRAME_IN)
+        if isinstance(msg, Login):
+            if valid_name(msg.name):
+                client.name = msg.name
+            else:
+                logging.warning(f"Nome inválido de {client.addr}: {msg.name!r}; jogando sem placar")
+            continue
+        if isinstance(msg, Watch):
+            await sendall_safe(client, Watch('').encode()) # Espectadores só no modo threads
+            continue
+        if not isinstance(msg, Hello):
+            return msg
+        client.features = msg.features & SUPPORTED_FEATURES & ~FEATURE_RESUME # Retomada só no modo threads
+        await sendall_safe(client, Hello(client.features).encode())
+
+# Envia o estado completo do jogo para ambos os jogadores (codificado uma vez)
+async def send_game_state(guesser, setter, game, is_guesser_turn):
+    guesser_frame, setter_frame = game.state_frames(is_guesser_turn)
+    await sendall_safe(guesser, guesser_frame)
+    await sendall_safe(setter, setter_frame)
+
+# OP_UPDATE para quem negociou o delta, OP_GAME_STATE completo para os demais
+async def send_guess_result(guesser, setter, game, ch, hit, positions):
+    update_frame = None
+    for i, client in enumerate((guesser, setter)):
+        if client.features & FEATURE_DELTA:
+            if update_frame is None:
+                update_frame = Update(ch, hit, positions).encode()
+            await sendall_safe(client, update_frame)
+        else:
+            await sendall_safe(client, game.state_frames(True)[i]) # Só monta o estado completo se alguém precisar
+
+
+async def play_round(setter, guesser, players_data, game_id):
+    round_started = time.monotonic()
+    trace = tracing.start_round(game_id)
+    outcome = 'abortada'
+    try:
+        await sendall_safe(setter, bytes([OP_PLAYER_ROLE, ROLE_SETTER]))
+        await sendall_safe(guesser, bytes([OP_PLAYER_ROLE, ROLE_GUESSER]))
+        logging.debug("Player %s é o SETTER. Player %s é o GUESSER.", players_data[setter].id, players_data[guesser].id)
+
+        # 1) SETTER escolhe a palavra
+        word = ""
+        while not word:
+            msg = await read_message(setter, server.SETWORD_TIMEOUT)
+
+            if isinstance(msg, SetWord):
+                word = msg.word.lower()
+
+                if word.isalpha() and len(word) > 0:
+                    logging.debug("Player%s escolheu: '%s'", players_data[setter].id, word)
+                    break
+                else:
+                    logging.warning(f"Palavra inválida recebida: '{word}'. Pedindo novamente.")
+                    await sendall_safe(setter, bytes([OP_PLAYER_ROLE, ROLE_SETTER]))
+                    word = ""
+            else:
+                logging.warning(f"Mensagem inesperada ({msg!r}) do SETTER, esperando OP_SETWORD.")
+                raise ProtocolError("Protocolo inesperado do SETTER")
+        if trace:
+            trace.phase('palavra')
+
+        game = WordGame(word, MAX_ERRORS)
+
+        await sendall_safe(guesser, bytes([OP_START, len(word)]))
+        logging.debug(">> OP_START enviado ao guesser com length=%s", len(word))
+
+        await send_game_state(guesser, setter, game, True)
+
+        while not game.over:
+            if trace:
+                trace.phase('processamento')
+            msg = await read_message(guesser, server.GUESS_TIMEOUT)
+            if trace:
+                trace.phase('palpite')
+
+            if not isinstance(msg, Guess):
+                logging.warning(f"Mensagem inesperada {msg!r} do GUESSER, esperando OP_GUESS.")
+                raise ProtocolError("Protocolo inesperado do GUESSER durante palpite")
+
+            ch = msg.letter.lower()
+            logging.debug("Palpite '%s' recebido do GUESSER.", ch)
+
+            result = game.guess(ch)
+            if result is None:
+                logging.debug("Letra inválida, não é letra, ou repetida; ignorando.")
+                await send_game_state(guesser, setter, game, True)
+                continue
+
+            hit, positions = result
+            if game.won:
+                logging.info(f"GUESSER ({players_data[guesser].id}) VENCEU o turno! Palavra: {word}")
+                await sendall_safe(guesser, encode_word_frame(OP_GAME_OVER_WIN, word))
+                await sendall_safe(setter, encode_word_frame(OP_OPPONENT_WON, word))
+                players_data[guesser].score += 1
+                metrics.ROUNDS_WON.inc()
+            elif game.lost:
+                logging.info(f"GUESSER ({players_data[guesser].id}) PERDEU o turno! Max erros atingido. Palavra: {word}")
+                await sendall_safe(guesser, encode_word_frame(OP_GAME_OVER_LOSE, word))
+                await sendall_safe(setter, encode_word_frame(OP_OPPONENT_LOST, word))
+                metrics.ROUNDS_LOST.inc()
+            else:
+                await send_guess_result(guesser, setter, game, ch, hit, positions)
+
+        if trace:
+            trace.phase('processamento')
+        outcome = 'vitoria' if game.won else 'derrota'
+        metrics.ROUND_SECONDS.observe(time.monotonic() - round_started)
+        metrics.GUESSES_PER_ROUND.observe(game.guessed.bit_count())
+        server.record_round(setter, (guesser,), game.won) # Só enfileira: não bloqueia o event loop
+        return True
+
+    except (ConnectionError, asyncio.TimeoutError) as e:
+        metrics.ROUNDS_ABORTED.inc()
+        if isinstance(e, asyncio.TimeoutError):
+            metrics.TIMEOUTS.inc()
+        elif isinstance(e, ProtocolError):
+            metrics.PROTOCOL_ERRORS.inc()
+        logging.error(f"Erro de conexão/timeout durante a rodada: {e!r}. Player {getattr(players_data.get(guesser), 'id', 'N/A')} ou {getattr(players_data.get(setter), 'id', 'N/A')} desconectou/travou.")
+        return False
+    except Exception as e:
+        metrics.ROUNDS_ABORTED.inc()
+        logging.exception(f"Erro inesperado durante a rodada: {e}.")
+        return False
+    finally:
+        if trace:
+            tracing.finish_round(trace, outcome)
+
+# Lê a decisão de reinício de um jogador até o prazo `deadline` (relógio do loop);
+# 'sair' em caso de erro ou timeout
+async def recv_restart_decision(client, players_data, deadline):
+    try:
+        timeout = max(0.0, deadline - asyncio.get_running_loop().time())
+        msg = await read_message(client, timeout)
+        if isinstance(msg, Restart):
+            logging.info(f"Player{players_data[client].id} escolheu {'continuar' if msg.flag else 'sair'}")
+            return client, msg.flag == 1
+        metrics.PROTOCOL_ERRORS.inc()
+        logging.warning(f"Mensagem inesperada {msg!r} durante RESTART de Player{players_data[client].id}. Assumindo 'sair'.")
+    except (ConnectionError, asyncio.TimeoutError) as e:
+        if isinstance(e, asyncio.TimeoutError):
+            metrics.TIMEOUTS.inc()
+        logging.warning(f"Conexão do Player{players_data[client].id} caiu ou não respondeu durante RESTART. Assumindo 'sair'.")
+    except Exception as e:
+        logging.exception(f"Erro inesperado ao receber RESTART de Player{players_data[client].id}: {e}. Assumindo 'sair'.")
+    return client, False
+
+# Lê as duas decisões ao mesmo tempo sob um único prazo; quem recusa é
+# desconectado assim que responde, sem esperar o outro jogador
+async def collect_restart_decisions(clients, players_data):
+    deadline = asyncio.get_running_loop().time() + server.RESTART_TIMEOUT
+    decisions = {}
+    for next_decision in asyncio.as_completed([recv_restart_decision(c, players_data, deadline) for c in clients]):
+        client, wants_restart = await next_decision
+        decisions[client] = wants_restart
+        if not wants_restart:
+            await sendall_safe(client, bytes([OP_RESTART_CONFIRM, 0]))
+            client.close()
+    return decisions
+
+async def handle_game_session(clients):
+    p1, p2 = clients
+    players_data = {p1: server.Player(1), p2: server.Player(2)}
+    game_id = f"a{next(_game_ids)}" # Identifica a sessão no rastreio (tracing.py)
+
+    while True:
+        if random.random() < 0.5: # Alterna aleatoriamente para cada nova rodada
+            setter, guesser = p1, p2
+        else:
+            setter, guesser = p2, p1
+
+        logging.info(f"Iniciando rodada: Player {players_data[setter].id} (SETTER), Player {players_data[guesser].id} (GUESSER).")
+
+        if not await play_round(setter, guesser, players_data, game_id):
+            logging.info("Rodada encerrada devido a erro. Encerrando conexões da sessão.")
+            for client in clients:
+                client.close()
+            return [], None
+
+        logging.info(">> Enviando OP_RESTART a ambos para decisão de nova partida.")
+        for client in clients:
+            await sendall_safe(client, bytes([OP_RESTART, 1]))
+        round_ended = time.monotonic()
+
+        decisions = await collect_restart_decisions(clients, players_data)
+
+        if all(decisions.values()):
+            logging.info("Ambos os jogadores querem reiniciar. Enviando confirmação.")
+            await sendall_safe(p1, bytes([OP_RESTART_CONFIRM, 1]))
+            await sendall_safe(p2, bytes([OP_RESTART_CONFIRM, 1]))
+            continue
+
+        sockets_to_return = [client for client in clients if decisions[client]]
+        for client in sockets_to_return:
+            logging.info(f"Player{players_data[client].id} quer continuar. Adicionando ao lobby.")
+            await sendall_safe(client, bytes([OP_RESTART_CONFIRM, 1]))
+        return sockets_to_return, round_ended
+
+
+waiting_clients = OrderedDict() # FIFO, como matchmaking.Lobby: parear e remover são O(1)
+session_tasks = set()
+_game_ids = itertools.count(1)
+
+# Coloca o cliente no lobby; se houver outro cliente esperando, inicia a sessão.
+# requeued_at marca o fim da rodada de quem volta de uma sessão (métrica de re-pareamento).
+def join_lobby(client, requeued_at=None):
+    if waiting_clients:
+        partner, _ = waiting_clients.popitem(last=False)
+        watcher = stop_waiting(partner)
+        now = time.monotonic()
+        metrics.PAIR_SECONDS.observe(now - partner.joined_lobby_at)
+        metrics.PAIR_SECONDS.observe(0.0)
+        for since in (partner.requeued_at, requeued_at):
+            if since is not None:
+                metrics.REPAIR_SECONDS.observe(now - since)
+        logging.info(f"Formado par com {partner.addr} e {client.addr}. Iniciando sessão de jogo.")
+        task = asyncio.create_task(run_session([partner, client], watcher))
+        session_tasks.add(task)
+        task.add_done_callback(session_tasks.discard)
+    else:
+        client.joined_lobby_at = time.monotonic()
+        client.requeued_at = requeued_at
+        waiting_clients[client] = True
+        client.lobby_task = asyncio.create_task(watch_lobby(client))
+        if server.LOBBY_IDLE_TIMEOUT:
+            client.lobby_timer = asyncio.get_running_loop().call_later(
+                server.LOBBY_IDLE_TIMEOUT, expire_lobby_wait, client)
+
+# Cancela o prazo e a leitura de quem sai do lobby; devolve a task de leitura
+# (a sessão espera ela terminar antes de ler do cliente)
+def stop_waiting(client):
+    if client.lobby_timer is not None:
+        client.lobby_timer.cancel()
+        client.lobby_timer = None
+    watcher, client.lobby_task = client.lobby_task, None
+    if watcher is not None:
+        watcher.cancel()
+    return watcher
+
+# Lê o cliente enquanto ele espera no lobby, como o selector do matchmaking.Lobby
+# no modo threads: mensagens de controle (OP_HELLO, OP_LOGIN, OP_WATCH) são
+# tratadas por _read_message, e um EOF tira o cliente da fila na hora. Uma
+# mensagem de jogo fora de hora fica em client.pending para a sessão tratar.
+async def watch_lobby(client):
+    try:
+        client.pending = await _read_message(client)
+        return
+    except ConnectionError:
+        pass
+    client.lobby_task = None
+    if waiting_clients.pop(client, None) is None:
+        return # Já pareado ou removido
+    stop_waiting(client)
+    logging.info(f"Cliente {client.addr} desconectou enquanto esperava no lobby.")
+    client.close()
+
+# Prazo de espera no lobby vencido
+def expire_lobby_wait(client):
+    client.lobby_timer = None
+    if waiting_clients.pop(client, None) is None:
+        return # Já pareado ou removido
+    stop_waiting(client)
+    metrics.TIMEOUTS.inc()
+    logging.info(f"Cliente {client.addr} esperou mais de {server.LOBBY_IDLE_TIMEOUT}s no lobby; desconectando.")
+    client.close()
+
+async def run_session(clients, watcher=None):
+    if watcher is not None:
+        await asyncio.wait([watcher]) # A leitura do lobby solta o reader do parceiro
+    metrics.SESSIONS_ACTIVE.inc()
+    admission.session_started()
+    if server.COALESCE:
+        for client in clients:
+            client.corked = True
+            client.flush_group = clients
+    try:
+        remaining, round_ended = await handle_game_session(clients)
+    except Exception as e:
+        logging.exception(f"Erro ao gerenciar sessão de jogo: {e}")
+        for client in clients:
+            client.close()
+        return
+    finally:
+        metrics.SESSIONS_ACTIVE.dec()
+        admission.session_ended()
+
+    for client in remaining:
+        if not client.is_closed():
+            await sendall_safe(client, bytes([OP_WAITING_FOR_PLAYER, 0]))
+            client.corked = False
+            client.flush_group = None
+            await flush(client)
+            logging.info(f"Cliente {client.addr} voltou para o lobby.")
+            join_lobby(client, requeued_at=round_ended)
+
+async def handle_client(reader, writer):
+    addr = writer.get_extra_info('peername')
+    reason = admission.check(addr)
+    if reason:
+        admission.rejected(addr, reason)
+        writer.write(Busy(reason).encode()) # O transporte envia antes de fechar
+        writer.close()
+        return
+    client = AsyncClient(reader, writer)
+    logging.info(f"Cliente {client.addr} conectado, adicionado ao lobby.")
+    await sendall_safe(client, bytes([OP_WAITING_FOR_PLAYER, 0]))
+    join_lobby(client)
+
+async def serve(host=HOST, port=PORT, backlog=server.BACKLOG):
+    metrics.LOBBY_DEPTH.func = lambda: len(waiting_clients)
+    srv = await asyncio.start_server(handle_client, host, port, backlog=backlog)
+    logging.info(f"Servidor (asyncio) em {host}:{port}, aguardando pares...")
+    async with srv:
+        await srv.serve_forever()
+
+def main(host=HOST, port=PORT, backlog=server.BACKLOG):
+    try:
+        asyncio.run(serve(host, port, backlog))
+    except KeyboardInterrupt:
+        logging.info("Servidor encerrado pelo usuário.")
+    logging.info("Servidor finalizado.")
+
+if __name__ == '__main__':
+    import logconfig
+    logconfig.setup_logging()
+    main()
@@ -0,0 +1,127 @@
+import math
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+# Pareamento por nível (server.py --nivel): cada conexão tem um rating Elo,
+# atualizado a cada rodada terminada, e o lobby pareia quem chega com o
+# jogador de rating mais próximo dentro de uma janela que cresce com a espera.
+# - Os jogadores esperando ficam em faixas de BUCKET_WIDTH pontos; cada faixa é
+#   FIFO (OrderedDict), e as chaves das faixas não vazias ficam em uma lista
+#   ordenada. Achar a faixa mais próxima é um bisect, O(log n) no número de
+#   faixas ocupadas; entrar, sair e parear dentro da faixa são O(1).
+# - A janela é medida em faixas: quem chega aceita faixas a até `window`
+#   pontos da sua; quem espera há t segundos aceita window + widen * t, e
+#   qualquer um a partir de max_wait segundos. O lobby refaz a busca de quem
+#   espera a cada faixa a mais na janela (next_widen), então o tempo até o par
+#   fica limitado por max_wait mesmo para ratings isolados.
+# - O rating vale enquanto a conexão está aberta (volta ao lobby entre as
+#   rodadas com ele); jogadores novos e bots começam em DEFAULT_RATING.
+
+DEFAULT_RATING = 1500.0
+K_FACTOR = 32.0 # Maior variação de rating em uma rodada
+BUCKET_WIDTH = 25 # Pontos de rating por faixa do índice
+
+
+# Probabilidade Elo de `rating` vencer `opponent`
+def expected(rating, opponent):
+    return 1.0 / (1.0 + 10.0 ** ((opponent - rating) / 400.0))
+
+# Atualiza os ratings depois de uma rodada: cada GUESSER joga contra o SETTER
+# (vence se descobriu a palavra) e o SETTER recebe a média das variações contrárias
+def update(setter, guessers, won):
+    if not guessers:
+        return
+    score = 1.0 if won else 0.0
+    total = 0.0
+    for guesser in guessers:
+        delta = K_FACTOR * (score - expected(guesser.rating, setter.rating))
+        guesser.rating += delta
+        total += delta
+    setter.rating -= total / len(guessers)
+
+
+class SkillIndex:
+    def __init__(self, window, widen=0.0, max_wait=0.0, bucket=BUCKET_WIDTH):
+        self.window = window # Pontos de distância aceitos por quem acabou de chegar
+        self.widen = widen   # Pontos a mais por segundo de espera (0 = janela fixa)
+        self.max_wait = max_wait # Segundos de espera até aceitar qualquer rating (0 = nunca)
+        self.bucket = bucket
+        self._buckets = {} # chave da faixa -> OrderedDict(conexão -> instante de entrada)
+        self._keys = []    # Chaves das faixas não vazias, em ordem
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    # Segundos até a próxima busca de quem espera há `waited` segundos: o tempo
+    # para a janela ganhar uma faixa, ou o que falta para max_wait (0 = não
+    # há mais o que alargar)
+    def next_widen(self, waited):
+        if self.max_wait and waited >= self.max_wait:
+            return 0
+        steps = [self.bucket / self.widen] if self.widen else []
+        if self.max_wait:
+            steps.append(self.max_wait - waited)
+        return min(steps, default=0)
+
+    def window_after(self, waited):
+        if self.max_wait and waited >= self.max_wait:
+            return math.inf
+        return self.window + self.widen * waited
+
+    def key(self, rating):
+        return math.floor(rating / self.bucket)
+
+    def add(self, conn, joined_at):
+        key = self.key(conn.rating)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = OrderedDict()
+            insort(self._keys, key)
+        bucket[conn] = joined_at
+        self._count += 1
+
+    def remove(self, conn):
+        key = self.key(conn.rating)
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.pop(conn, None) is None:
+            return False
+        self._count -= 1
+        if not bucket:
+            del self._buckets[key]
+            del self._keys[bisect_left(self._keys, key)]
+        return True
+
+    # Retira e devolve o jogador da faixa mais próxima de `rating` dentro de
+    # `window` pontos (o mais antigo da faixa; no empate entre uma faixa acima e
+    # outra abaixo, a que tem o jogador mais antigo); None se não houver.
+    # `exclude` é quem está procurando, quando ele mesmo está no índice.
+    def pop_closest(self, rating, window, exclude=None):
+        keys = self._keys
+        key = self.key(rating)
+        span = math.ceil(window / self.bucket) if window != math.inf else math.inf
+        above = bisect_left(keys, key)
+        below = above - 1
+        while below >= 0 or above < len(keys):
+            up = keys[above] - key if above < len(keys) else None
+            down = key - keys[below] if below >= 0 else None
+            if down is None or (up is not None and (up < down or up == down and self._older(keys[above], keys[below]))):
+                chosen, distance = above, up
+            else:
+                chosen, distance = below, down
+            if distance > span:
+                return None
+            bucket = self._buckets[keys[chosen]]
+            for conn in bucket:
+                if conn is not exclude:
+                    self.remove(conn)
+                    return conn
+            # Só quem procura está nesta faixa: segue para a próxima do mesmo lado
+            if chosen == above:
+                above += 1
+            else:
+                below -= 1
+        return None
+
+    def _older(self, key_a, key_b):
+        return next(iter(self._buckets[key_a].values())) <= next(iter(self._buckets[key_b].values()))
@@ -0,0 +1,176 @@
+import re
+import threading
+from collections import Counter
+
+from wordlist import LETTER_ORDER
+
+try:
+    import numpy as np
+except ImportError: # numpy é opcional: sem ele o solver usa a versão em Python puro
+    np = None
+
+# Solver do GUESSER: mantém as palavras da lista (wordlist.WordList) que ainda
+# são compatíveis com o que foi revelado e chuta a letra que aparece no maior
+# número delas.
+#
+# Uma palavra é candidata se tem as letras reveladas nas mesmas posições, não
+# tem nenhuma letra errada e não tem letras reveladas nas posições ainda ocultas
+# (na forca, uma letra acertada aparece em todas as posições de uma vez).
+#
+# Com numpy, as palavras de cada tamanho viram uma matriz (n, tamanho) de bytes
+# lida direto do buffer da lista (sem cópia quando há um só grupo de
+# dificuldade), um vetor com a máscara de 26 bits das letras de cada palavra e,
+# por letra, uma coluna com as posições dela (bit i = posição i), de modo que
+# cada restrição do filtro é uma única comparação; filtrar e contar letras são
+# operações vetorizadas. Cada Guesser guarda os
+# candidatos da rodada e filtra só o que sobrou do palpite anterior, então o
+# custo cai a cada palpite; a contagem do primeiro palpite fica em cache.
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
+_A = ord('a')
+
+if np is not None:
+    # Bits de cada valor de byte: _BYTE_BITS[v, b] = 1 se o bit b de v está ligado
+    _BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1, bitorder='little').astype(np.int64)
+
+
+# Palavras de um tamanho, em matriz numpy. As candidatas são um vetor de índices
+# (None = todas as palavras do tamanho).
+class _NumpyTable:
+    def __init__(self, words, length):
+        buf = words.buffer
+        parts = [np.frombuffer(buf, dtype=np.uint8, count=size * length, offset=offset).reshape(size, length)
+                 for offset, size in words.blocks(length)]
+        if not parts: # Tamanho que não está na lista (palavra do jogador): tabela vazia
+            self.letters = np.empty((0, length), dtype=np.uint8)
+        else:
+            self.letters = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        # Menor inteiro que comporta um bit por posição
+        dtype = np.uint8 if length <= 8 else np.uint16 if length <= 16 else np.uint32
+        self.weights = np.left_shift(1, np.arange(length)).astype(dtype)
+        bits = np.left_shift(np.uint32(1), (self.letters - _A).astype(np.uint32))
+        self.masks = np.bitwise_or.reduce(bits, axis=1)
+        self._positions = {c: (self.letters == ord(c)).astype(dtype) @ self.weights for c in ALPHABET}
+        self.first_counts = self.counts(None)
+
+    def __len__(self):
+        return len(self.letters)
+
+    # Cada letra revelada tem de estar exatamente nas posições reveladas; cada
+    # letra errada, em nenhuma
+    def filter(self, candidates, display, wrong):
+        constraints = dict.fromkeys(wrong, 0)
+        for i, c in enumerate(display):
+            if c != '_':
+                constraints[c] = constraints.get(c, 0) | (1 << i)
+        for c, where in constraints.items():
+            column = self._positions[c]
+            if candidates is None:
+                candidates = np.flatnonzero(column == where)
+            else:
+                candidates = candidates[column[candidates] == where]
+        return candidates
+
+    # Em quantas candidatas aparece cada letra (índice 0 = 'a'): histograma de
+    # cada byte das máscaras, convertido em contagem por bit
+    def counts(self, candidates):
+        masks = self.masks if candidates is None else self.masks[candidates]
+        by_byte = masks.astype('<u4').view(np.uint8).reshape(-1, 4)
+        counts = np.concatenate([np.bincount(by_byte[:, j], minlength=256) @ _BYTE_BITS for j in range(4)])
+        return counts[:26].tolist()
+
+
+# Mesma interface em Python puro: as candidatas são uma lista de palavras
+class _PythonTable:
+    def __init__(self, words, length):
+        self.words = list(words.words(length))
+        self.first_counts = self.counts(self.words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def filter(self, candidates, display, wrong):
+        revealed = {c for c in display if c != '_'}
+        excluded = ''.join(sorted(revealed | set(wrong)))
+        hidden = f'[^{excluded}]' if excluded else '.'
+        pattern = re.compile(''.join(hidden if c == '_' else c for c in display))
+        return [w for w in candidates if pattern.fullmatch(w)]
+
+    def counts(self, candidates):
+        counter = Counter(c for w in candidates for c in set(w))
+        return [counter[c] for c in ALPHABET]
+
+
+class Solver:
+    def __init__(self, words, vectorized=None):
+        self.words = words
+        self.vectorized = np is not None if vectorized is None else vectorized
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def guesser(self):
+        return Guesser(self)
+
+    # Monta as tabelas de todos os tamanhos (ex.: na inicialização do servidor),
+    # para que o primeiro palpite de cada tamanho não pague a construção
+    def warm(self):
+        for length in self.words.lengths():
+            self.table(length)
+        return self
+
+    # Tabela de um tamanho, montada no primeiro uso e compartilhada entre threads
+    def table(self, length):
+        table = self._tables.get(length)
+        if table is None:
+            with self._lock:
+                table = self._tables.get(length)
+                if table is None:
+                    cls = _NumpyTable if self.vectorized else _PythonTable
+                    table = self._tables[length] = cls(self.words, length)
+        return table
+
+
+# Estado de uma rodada do GUESSER
+class Guesser:
+    def __init__(self, solver):
+        self.solver = solver
+        self.reset()
+
+    def reset(self):
+        self._table = None
+        self._candidates = None
+        self._known = -1
+
+    def candidates(self):
+        if self._table is None:
+            return 0
+        return len(self._table) if self._candidates is None else len(self._candidates)
+
+    # Próxima letra para o estado (display com '_' nas posições ocultas, letras
+    # erradas, letras já tentadas). Uma rodada nova (tamanho diferente ou menos
+    # informação que antes) reinicia os candidatos.
+    def pick_letter(self, display, wrong, tried=()):
+        known = len(display) - list(display).count('_') + len(wrong)
+        if self._table is None or len(display) != self._length or known < self._known:
+            self._length = len(display)
+            self._table = self.solver.table(self._length)
+            self._candidates = None if self.solver.vectorized else self._table.words
+            self._known = 0
+
+        if known == 0:
+            counts = self._table.first_counts
+        else:
+            if known != self._known:
+                self._candidates = self._table.filter(self._candidates, display, wrong)
+            counts = self._table.counts(self._candidates)
+        self._known = known
+
+        used = set(display) | set(wrong) | set(tried)
+        best = None
+        for c in LETTER_ORDER: # Empates ficam com a letra mais frequente no idioma
+            if c in used:
+                continue
+            count = counts[ord(c) - _A]
+            if best is None or count > best[0]:
+                best = (count, c)
+        return best[1] if best else 'a'
@@ -0,0 +1,283 @@
+import itertools
+import json
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+import metrics
+from protocol import Watch
+
+# Espectadores: qualquer número de conexões assistindo uma partida em andamento.
+# - Cada sessão tem uma sala (Room) com um id ("7", ou "1.7" com --workers). Um
+#   cliente no lobby manda OP_WATCH com o id (vazio = a partida mais assistida) e
+#   o socket sai da Connection (conn.moved, como na retomada) para o espectador;
+#   sem a partida, recebe OP_WATCH vazio e é desconectado.
+#   As salas abertas ficam em /games, na porta de métricas.
+# - play_round publica cada OP_GAME_STATE (visão do SETTER) e OP_OPPONENT_* já
+#   codificado: o mesmo objeto bytes vai para o SETTER e para todos os
+#   espectadores, sem cópia por destinatário.
+# - publish() só anexa o frame ao anel da sala (deque com maxlen) e acorda a
+#   thread de envio; a thread da sessão nunca escreve no socket de um espectador.
+# - Uma única thread por processo (selectors) escreve sem bloquear para todos os
+#   espectadores. Cada um guarda só a posição no anel e recebe os frames
+#   pendentes em um único send. Quem não dá conta (buffer do socket cheio) espera
+#   EVENT_WRITE sem atrasar os outros; se ficar mais de RING frames atrás, pula
+#   direto para o último frame publicado (coalescência no estado mais recente).
+# - As passadas de envio têm um intervalo mínimo (BATCH_INTERVAL): com milhares
+#   de espectadores, os frames de uma partida rápida saem juntos em um send por
+#   espectador em vez de um send por frame.
+
+RING = 64 # Frames guardados por sala
+BATCH_INTERVAL = 0.05 # Segundos mínimos entre passadas de envio da thread
+
+
+class Room:
+    __slots__ = ('id', 'frames', 'seq', 'subscribers', 'closed', '_fanout')
+
+    def __init__(self, fanout, room_id):
+        self.id = room_id
+        self.frames = deque(maxlen=RING) # Últimos frames publicados, compartilhados por todos
+        self.seq = 0 # Total de frames já publicados
+        self.subscribers = set()
+        self.closed = False
+        self._fanout = fanout
+
+    def publish(self, frame: bytes):
+        self._fanout.publish(self, frame)
+
+    def close(self):
+        self._fanout.close_room(self)
+
+
+class _Subscriber:
+    __slots__ = ('sock', 'addr', 'room', 'seq', 'out')
+
+    def __init__(self, sock, addr, room, seq, out):
+        self.sock = sock
+        self.addr = addr
+        self.room = room
+        self.seq = seq # Próximo frame da sala a enviar
+        self.out = out # memoryview do que ainda falta escrever (None = em dia)
+
+
+class Fanout:
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.forward = None # forward(game, conn) -> bool para salas de outro processo (cluster.py)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._rooms = {} # id -> Room
+        self._dirty = set() # Salas com frames novos desde a última passada da thread
+        self._added = deque()
+        self._selector = None # Criado com o primeiro espectador, no processo que vai usá-lo
+
+    def open_room(self):
+        room = Room(self, self.prefix + str(next(self._ids)))
+        with self._lock:
+            self._rooms[room.id] = room
+        return room
+
+    # Thread da sessão: O(1) e sem I/O de espectador
+    def publish(self, room, frame):
+        with self._lock:
+            frames = room.frames
+            if frames and frames[-1] is frame:
+                return # Estado reenviado sem mudança (palpite inválido)
+            frames.append(frame)
+            room.seq += 1
+            if room.subscribers:
+                self._mark(room)
+
+    def close_room(self, room):
+        with self._lock:
+            room.closed = True
+            self._rooms.pop(room.id, None)
+            if room.subscribers:
+                self._mark(room) # A thread fecha os espectadores depois do último frame
+
+    def _mark(self, room):
+        if not self._dirty:
+            self._wakeup()
+        self._dirty.add(room)
+
+    # JSON das salas abertas neste processo, para /games
+    def games_json(self):
+        with self._lock:
+            games = [{'id': room.id, 'espectadores': len(room.subscribers)} for room in self._rooms.values()]
+        return json.dumps(games).encode()
+
+    # A conexão `conn`, no lobby, pediu para assistir `game`. Responde OP_WATCH com
+    # o id da sala e o último frame publicado, ou vazio e fecha a conexão se não
+    # houver a partida (quem pediu para assistir não entra na fila de jogadores).
+    # Nos dois casos a conexão deixa o lobby (conn.moved).
+    def watch(self, conn, game):
+        with self._lock:
+            if game:
+                room = self._rooms.get(game)
+            else:
+                room = max(self._rooms.values(), key=lambda r: len(r.subscribers), default=None)
+        if room is None:
+            if self.forward is not None and self.forward(game, conn):
+                return True
+            logging.info(f"Cliente {conn.addr} pediu a partida '{game}', que não existe; desconectando.")
+            conn.send(Watch('').encode())
+            conn.detach()
+            return False
+
+        sock = conn.take_socket()
+        sock.setblocking(False)
+        with self._lock:
+            latest = room.frames[-1] if room.frames else b''
+            sub = _Subscriber(sock, conn.addr, room, room.seq, memoryview(Watch(room.id).encode() + latest))
+            room.subscribers.add(sub)
+            self._added.append(sub)
+            self._start()
+            self._wakeup()
+        metrics.SPECTATORS.inc()
+        logging.info(f"Cliente {conn.addr} assistindo a partida {room.id}.")
+        return True
+
+    def _start(self):
+        if self._selector is not None:
+            return
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        threading.Thread(target=self._run, name="spectator-fanout", daemon=True).start()
+
+    def _wakeup(self):
+        if self._selector is None:
+            return # Sem espectadores ainda
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass # Já existe um byte pendente acordando a thread
+
+    def _run(self):
+        selector = self._selector
+        next_pass = 0.0
+        while True:
+            events = selector.select()
+            delay = next_pass - time.monotonic()
+            if delay > 0:
+                time.sleep(delay) # Junta os frames publicados até a próxima passada
+            next_pass = time.monotonic() + BATCH_INTERVAL
+            # Esvazia o socketpair antes de pegar o trabalho: um publish depois
+            # daqui escreve um byte novo e acorda o próximo select
+            try:
+                while self._wake_r.recv(4096):
+                    pass
+            except (BlockingIOError, OSError):
+                pass
+            with self._lock:
+                added = list(self._added)
+                self._added.clear()
+                dirty, self._dirty = self._dirty, set()
+                # Uma cópia do anel por sala, não por espectador
+                work = [(room.seq, tuple(room.frames), room.closed, list(room.subscribers)) for room in dirty]
+
+            for sub in added:
+                selector.register(sub.sock, selectors.EVENT_READ, sub)
+                self._write(sub)
+            for key, mask in events:
+                sub = key.data
+                if sub is None or sub.sock.fileno() == -1:
+                    continue
+                if mask & selectors.EVENT_READ and not self._drain(sub):
+                    self._drop(sub)
+                    continue
+                if mask & selectors.EVENT_WRITE and self._write(sub):
+                    selector.modify(sub.sock, selectors.EVENT_READ, sub)
+                    self._refresh(sub)
+            for seq, frames, closed, subs in work:
+                joined = {} # Espectadores no mesmo ponto do anel recebem o mesmo objeto
+                for sub in subs:
+                    if sub.out is None and sub.sock.fileno() != -1:
+                        self._catch_up(sub, seq, frames, closed, joined)
+
+    # Espectador que voltou a aceitar escrita: confere o que chegou enquanto esperava
+    def _refresh(self, sub):
+        with self._lock:
+            room = sub.room
+            seq, frames, closed = room.seq, tuple(room.frames), room.closed
+        self._catch_up(sub, seq, frames, closed)
+
+    def _catch_up(self, sub, seq, frames, closed, joined=None):
+        behind = seq - sub.seq
+        if behind > 0:
+            if behind > len(frames):
+                metrics.SPECTATOR_FRAMES_DROPPED.inc(behind - 1)
+                data = frames[-1]
+            elif behind == 1:
+                data = frames[-1]
+            else:
+                data = joined.get(behind) if joined is not None else None
+                if data is None:
+                    data = b''.join(frames[-behind:])
+                    if joined is not None:
+                        joined[behind] = data
+            sub.seq = seq
+            sub.out = memoryview(data)
+            if not self._write(sub):
+                return
+        if closed:
+            self._drop(sub)
+
+    # Escreve o que faltar de sub.out sem bloquear; True se esvaziou
+    def _write(self, sub):
+        try:
+            n = sub.sock.send(sub.out)
+        except BlockingIOError:
+            n = 0
+        except OSError:
+            self._drop(sub)
+            return False
+        metrics.BYTES_OUT.inc(n)
+        if n == len(sub.out):
+            sub.out = None
+            return True
+        sub.out = sub.out[n:]
+        self._selector.modify(sub.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, sub)
+        return False
+
+    # Espectadores não mandam nada; o que chegar é descartado. False se fechou
+    def _drain(self, sub):
+        try:
+            return bool(sub.sock.recv(4096))
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+
+    def _drop(self, sub):
+        if sub.sock.fileno() == -1:
+            return
+        try:
+            self._selector.unregister(sub.sock)
+        except (KeyError, ValueError):
+            pass
+        sub.sock.close()
+        with self._lock:
+            sub.room.subscribers.discard(sub)
+        metrics.SPECTATORS.dec()
+        logging.debug("Espectador %s saiu da partida %s.", sub.addr, sub.room.id)
+
+
+_fanout = Fanout()
+
+def registry():
+    return _fanout
+
+def open_room():
+    return _fanout.open_room()
+
+def watch(conn, game):
+    return _fanout.watch(conn, game)
+
+def games_json():
+    return _fanout.games_json()
@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+
+# Agendador central de prazos (roda de tempo com hash, "hashed timing wheel").
+# Agendar e cancelar são O(1) e não fazem syscall: cada prazo é um objeto em um
+# dos slots da roda, e uma única thread de fundo avança a roda a cada `tick`
+# segundos disparando os prazos vencidos. Prazos maiores que uma volta completa
+# guardam quantas voltas ainda faltam. A precisão é de um tick.
+#
+# Os callbacks rodam na thread da roda e devem ser curtos (ex.: marcar a conexão
+# como expirada e acordar quem está bloqueado nela).
+
+TICK = 0.05
+SLOTS = 1024
+
+
+class Timer:
+    __slots__ = ('callback', 'slot', 'rounds', 'active')
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.slot = 0
+        self.rounds = 0
+        self.active = True
+
+
+class TimerWheel:
+    def __init__(self, tick=TICK, slots=SLOTS):
+        self.tick = tick
+        self._slots = [set() for _ in range(slots)]
+        self._cursor = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="timer-wheel", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return self._count
+
+    # Chama callback() daqui a `delay` segundos (arredondado para cima em ticks)
+    def schedule(self, delay, callback):
+        ticks = max(1, -int(-delay // self.tick))
+        size = len(self._slots)
+        timer = Timer(callback)
+        with self._lock:
+            timer.slot = (self._cursor + ticks) % size
+            timer.rounds = (ticks - 1) // size
+            self._slots[timer.slot].add(timer)
+            self._count += 1
+        return timer
+
+    # True se o prazo foi cancelado antes de disparar
+    def cancel(self, timer):
+        with self._lock:
+            if not timer.active:
+                return False
+            timer.active = False
+            self._slots[timer.slot].discard(timer)
+            self._count -= 1
+        return True
+
+    def _advance(self):
+        expired = []
+        with self._lock:
+            self._cursor = (self._cursor + 1) % len(self._slots)
+            slot = self._slots[self._cursor]
+            for timer in list(slot):
+                if timer.rounds:
+                    timer.rounds -= 1
+                else:
+                    slot.discard(timer)
+                    timer.active = False
+                    expired.append(timer)
+            self._count -= len(expired)
+        for timer in expired:
+            try:
+                timer.callback()
+            except Exception:
+                logging.exception("Erro em callback de prazo")
+
+    def _run(self):
+        next_tick = time.monotonic() + self.tick
+        while True:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            # Se a thread atrasou (GIL, carga), processa os ticks perdidos em sequência
+            while next_tick <= time.monotonic():
+                self._advance()
+                next_tick += self.tick
+
+
+_wheel = None
+_wheel_lock = threading.Lock()
+
+# Roda compartilhada pelo processo, criada no primeiro uso (depois de um fork,
+# cada processo cria a sua)
+def default_wheel():
+    global _wheel
+    if _wheel is None:
+        with _wheel_lock:
+            if _wheel is None:
+                _wheel = TimerWheel()
+    return _wheel
+
+def schedule(delay, callback):
+    return default_wheel().schedule(delay, callback)
+
+def cancel(timer):
+    return default_wheel().cancel(timer)
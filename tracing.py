@@ -0,0 +1,128 @@
+import contextvars
+import json
+import logging
+import os
+import time
+from collections import deque
+
+# Rastreio das rodadas (server.py --rastreio, /trace na porta de métricas):
+# cada rodada vira uma lista de fases com a duração de cada uma, na ordem em
+# que aconteceram:
+#   palavra        espera do OP_SETWORD (o SETTER digitando)
+#   palpite        espera de cada OP_GUESS (o GUESSER pensando + rede)
+#   processamento  o servidor aplicando o palpite e montando os frames
+#   envio          escritas nos sockets (Connection._write / drain no asyncio),
+#                  descontadas da fase em que aconteceram
+# As rodadas terminadas ficam em um anel (RING_SIZE) e saem em JSON por /trace
+# ou em arquivo com SIGUSR2 (dump_to_file).
+#
+# Desligado, o custo é um teste de `enabled` ou de `trace is None` por ponto de
+# medição. A rodada em andamento fica em uma ContextVar: cada thread de sessão
+# e cada task do asyncio enxerga a sua.
+
+RING_SIZE = 1024 # Rodadas guardadas
+
+enabled = False
+
+_rounds = deque(maxlen=RING_SIZE)
+_current = contextvars.ContextVar('hagsman_round_trace', default=None)
+
+
+class RoundTrace:
+    __slots__ = ('game', 'wall', 'started', 'mark', 'written', 'phases', 'outcome')
+
+    def __init__(self, game):
+        self.game = game
+        self.wall = time.time()
+        self.started = self.mark = time.perf_counter()
+        self.written = 0.0 # Segundos escrevendo em sockets desde a última marca
+        self.phases = []
+        self.outcome = None
+
+    # Fecha a fase que começou na marca anterior; o tempo de escrita medido
+    # nela vira uma fase 'envio' à parte
+    def phase(self, name):
+        now = time.perf_counter()
+        written = self.written
+        if written:
+            self.written = 0.0
+            self.phases.append(('envio', written))
+        self.phases.append((name, now - self.mark - written))
+        self.mark = now
+
+    def as_dict(self):
+        return {
+            'partida': self.game,
+            'inicio': round(self.wall, 3),
+            'duracao_ms': round((self.mark - self.started) * 1000, 3),
+            'resultado': self.outcome,
+            'fases': [[name, round(seconds * 1000, 3)] for name, seconds in self.phases],
+        }
+
+
+# Começa o rastreio de uma rodada na thread/task atual; None com o rastreio desligado
+def start_round(game):
+    if not enabled:
+        return None
+    trace = RoundTrace(game)
+    _current.set(trace)
+    return trace
+
+def finish_round(trace, outcome):
+    trace.outcome = outcome
+    _current.set(None)
+    _rounds.append(trace)
+
+# Soma uma escrita em socket à rodada da thread/task atual (se houver)
+def wrote(seconds):
+    trace = _current.get()
+    if trace is not None:
+        trace.written += seconds
+
+def set_enabled(on):
+    global enabled
+    enabled = bool(on)
+    logging.info(f"Rastreio de rodadas {'ligado' if enabled else 'desligado'}.")
+
+
+def _percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+# Totais por fase das rodadas no anel: onde o tempo das rodadas está indo
+def summary(rounds):
+    by_phase = {}
+    for trace in rounds:
+        for name, seconds in trace.phases:
+            by_phase.setdefault(name, []).append(seconds)
+    result = {}
+    for name, values in by_phase.items():
+        values.sort()
+        result[name] = {
+            'n': len(values),
+            'total_ms': round(sum(values) * 1000, 3),
+            'p50_ms': round(_percentile(values, 0.5) * 1000, 3),
+            'p99_ms': round(_percentile(values, 0.99) * 1000, 3),
+        }
+    return result
+
+def dump():
+    rounds = list(_rounds)
+    return {
+        'rastreio': enabled,
+        'resumo': summary(rounds),
+        'rodadas': [trace.as_dict() for trace in rounds],
+    }
+
+# Rota /trace da porta de métricas; ?ligar=1 / ?ligar=0 liga e desliga
+def render(params):
+    if 'ligar' in params:
+        set_enabled(params['ligar'] not in ('0', 'nao', 'não', 'false'))
+    return json.dumps(dump()).encode()
+
+# Grava o anel em `directory` (SIGUSR2); devolve o caminho do arquivo
+def dump_to_file(directory='.'):
+    path = os.path.join(directory, f'rastreio-{os.getpid()}-{int(time.time())}.json')
+    with open(path, 'w') as f:
+        json.dump(dump(), f)
+    logging.info(f"Rastreio de {len(_rounds)} rodadas gravado em {path}.")
+    return path
@@ -0,0 +1,168 @@
+import argparse
+import bisect
+import mmap
+import random
+import struct
+import unicodedata
+
+# Lista de palavras em formato binário compacto, lida por mmap: os processos que
+# abrem o mesmo arquivo compartilham as páginas do cache do sistema em vez de
+# cada um carregar a lista no próprio heap.
+#
+# Formato (little-endian):
+#   "HWL1"                                   assinatura
+#   u16 n                                    número de grupos
+#   n x (u8 tamanho, u8 dificuldade, u32 quantidade, u32 offset)
+#   registros                                palavras ASCII minúsculas, sem separador
+#
+# Cada grupo reúne as palavras de um mesmo tamanho e dificuldade em registros de
+# largura fixa (o próprio tamanho), então a i-ésima palavra está em
+# offset + i * tamanho e sortear uma palavra não exige varrer o arquivo.
+#
+#   python3 wordlist.py build palavras.txt palavras.bin
+#   python3 wordlist.py sample palavras.bin --tamanho 6 --dificuldade 1
+
+MAGIC = b'HWL1'
+_HEADER = struct.Struct('<4sH')
+_GROUP = struct.Struct('<BBII')
+
+MAX_LENGTH = 32 # Palavras maiores são descartadas na construção
+DIFFICULTIES = 3 # 0 fácil, 1 média, 2 difícil
+
+# Letras do português da mais para a menos frequente; palavras com mais letras
+# fora das 10 primeiras são mais difíceis de adivinhar
+LETTER_ORDER = 'aeosrindmutclpvghqbfzjxkwy'
+COMMON_LETTERS = frozenset(LETTER_ORDER[:10])
+
+
+def difficulty(word):
+    return min(DIFFICULTIES - 1, sum(1 for c in set(word) if c not in COMMON_LETTERS))
+
+# Minúsculas sem acento; None se sobrar algo que não seja letra ASCII
+def normalize(word):
+    word = unicodedata.normalize('NFKD', word.strip().lower()).encode('ascii', 'ignore').decode()
+    if not word.isalpha() or not word.isascii() or len(word) > MAX_LENGTH:
+        return None
+    return word
+
+def encode(words):
+    groups = {}
+    for word in sorted(set(filter(None, map(normalize, words)))):
+        groups.setdefault((len(word), difficulty(word)), []).append(word)
+
+    keys = sorted(groups)
+    offset = _HEADER.size + _GROUP.size * len(keys)
+    header = [_HEADER.pack(MAGIC, len(keys))]
+    records = []
+    for length, level in keys:
+        group = groups[(length, level)]
+        header.append(_GROUP.pack(length, level, len(group), offset))
+        records.append(''.join(group).encode('ascii'))
+        offset += length * len(group)
+    return b''.join(header + records)
+
+
+class WordList:
+    def __init__(self, buf):
+        self._buf = buf
+        magic, count = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError("Arquivo não é uma lista de palavras (assinatura inválida)")
+        self._groups = {} # (tamanho, dificuldade) -> (quantidade, offset)
+        for i in range(count):
+            length, level, size, offset = _GROUP.unpack_from(buf, _HEADER.size + i * _GROUP.size)
+            self._groups[(length, level)] = (size, offset)
+        self._selections = {} # filtro -> (grupos, quantidades acumuladas)
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    # Lista em memória (ex.: a lista embutida quando não há arquivo)
+    @classmethod
+    def from_words(cls, words):
+        return cls(encode(words))
+
+    def __len__(self):
+        return sum(size for size, _ in self._groups.values())
+
+    def lengths(self):
+        return sorted({length for length, _ in self._groups})
+
+    # Buffer bruto (mmap ou bytes) e os blocos [(offset, quantidade)] de registros
+    # de um tamanho, para leitura sem cópia (ex.: numpy.frombuffer no solver.py)
+    @property
+    def buffer(self):
+        return self._buf
+
+    def blocks(self, length):
+        return [(offset, size) for (l, _), (size, offset) in sorted(self._groups.items()) if l == length]
+
+    def words(self, length):
+        for offset, size in self.blocks(length):
+            data = self._buf[offset:offset + size * length].decode('ascii')
+            for i in range(0, len(data), length):
+                yield data[i:i + length]
+
+    def word(self, length, level, index):
+        size, offset = self._groups[(length, level)]
+        if not 0 <= index < size:
+            raise IndexError(index)
+        start = offset + index * length
+        return self._buf[start:start + length].decode('ascii')
+
+    # Palavra aleatória com o tamanho e/ou a dificuldade pedidos (None = qualquer).
+    # A escolha do grupo é proporcional ao tamanho dele, então cada palavra que
+    # passa no filtro tem a mesma chance.
+    def sample(self, length=None, level=None, rng=random):
+        groups, cumulative = self._selection(length, level)
+        if not groups:
+            raise LookupError(f"Nenhuma palavra com tamanho={length} e dificuldade={level}")
+        n = rng.randrange(cumulative[-1])
+        i = bisect.bisect_right(cumulative, n)
+        before = cumulative[i - 1] if i else 0
+        return self.word(*groups[i], n - before)
+
+    def _selection(self, length, level):
+        key = (length, level)
+        selection = self._selections.get(key)
+        if selection is None:
+            groups = [k for k in sorted(self._groups)
+                      if (length is None or k[0] == length) and (level is None or k[1] == level)]
+            cumulative = []
+            total = 0
+            for k in groups:
+                total += self._groups[k][0]
+                cumulative.append(total)
+            selection = self._selections[key] = (groups, cumulative)
+        return selection
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Constrói e consulta listas de palavras binárias")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="converte um arquivo texto (uma palavra por linha)")
+    build.add_argument('entrada')
+    build.add_argument('saida')
+    sample = commands.add_parser('sample', help="sorteia palavras de uma lista binária")
+    sample.add_argument('arquivo')
+    sample.add_argument('--tamanho', type=int)
+    sample.add_argument('--dificuldade', type=int, choices=range(DIFFICULTIES))
+    sample.add_argument('-n', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        with open(args.entrada, encoding='utf-8', errors='ignore') as f:
+            data = encode(f)
+        with open(args.saida, 'wb') as f:
+            f.write(data)
+        words = WordList(data)
+        print(f"{len(words)} palavras, tamanhos {words.lengths()}, {len(data)} bytes")
+    else:
+        words = WordList.open(args.arquivo)
+        for _ in range(args.n):
+            print(words.sample(args.tamanho, args.dificuldade))
+
+if __name__ == '__main__':
+    main()